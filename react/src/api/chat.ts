@@ -9,6 +9,32 @@ export const getChatSession = async (sessionId: string) => {
   return data as Message[]
 }
 
+export type ChatHistoryPage = {
+  messages: Message[]
+  // Cursor of the older page, null once the start of the session is reached
+  before_id: string | null
+  // Number of older messages not in this page, messages_delta indices count them
+  offset: number
+}
+
+export const getChatHistoryPage = async (
+  sessionId: string,
+  beforeId?: string | null,
+  limit: number = 50
+) => {
+  const params = new URLSearchParams({ limit: String(limit) })
+  if (beforeId) {
+    params.set('before_id', beforeId)
+  }
+  const response = await fetch(
+    `${API_BASE_URL}/api/chat_session/${sessionId}/messages?${params}`
+  )
+  if (!response.ok) {
+    throw new Error(`Failed to fetch chat history: ${response.status}`)
+  }
+  return (await response.json()) as ChatHistoryPage
+}
+
 export const sendMessages = async (payload: {
   sessionId: string
   canvasId: string
@@ -23,7 +49,8 @@ export const sendMessages = async (payload: {
       'Content-Type': 'application/json',
     },
     body: JSON.stringify({
-      messages: payload.newMessages,
+      // The server keeps the history, only the new message is sent
+      message: payload.newMessages.at(-1),
       canvas_id: payload.canvasId,
       session_id: payload.sessionId,
       text_model: payload.textModel,
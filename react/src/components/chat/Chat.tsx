@@ -1,4 +1,4 @@
-import { sendMessages } from '@/api/chat'
+import { getChatHistoryPage, sendMessages } from '@/api/chat'
 import Blur from '@/components/common/Blur'
 import { ScrollArea } from '@/components/ui/scroll-area'
 import { eventBus, TEvents } from '@/lib/event'
@@ -36,6 +36,7 @@ import ToolcallProgressUpdate from './ToolcallProgressUpdate'
 import ShareTemplateDialog from './ShareTemplateDialog'
 
 import { useConfigs } from '@/contexts/configs'
+import { useSocket } from '@/contexts/socket'
 import 'react-photo-view/dist/react-photo-view.css'
 import { DEFAULT_SYSTEM_PROMPT } from '@/constants'
 import { ModelInfo, ToolInfo } from '@/api/model'
@@ -81,12 +82,25 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({
   }, [sessionList, searchSessionId])
 
   const [messages, setMessages] = useState<Message[]>([])
+  // Cursor of the older history page, null when everything is loaded
+  const [historyCursor, setHistoryCursor] = useState<string | null>(null)
+  const [loadingHistory, setLoadingHistory] = useState(false)
+  // Messages of the session before messages[0], messages_delta indices count them
+  const historyOffsetRef = useRef(0)
   const [pending, setPending] = useState<PendingType>(
     initCanvas ? 'text' : false
   )
   const mergedToolCallIds = useRef<string[]>([])
 
   const sessionId = session?.id ?? searchSessionId
+  const { socketManager } = useSocket()
+
+  useEffect(() => {
+    // Session updates are only delivered to subscribers of the canvas/session rooms
+    const subscription = { canvas_id: canvasId, session_id: sessionId }
+    socketManager?.subscribe(subscription)
+    return () => socketManager?.unsubscribe(subscription)
+  }, [socketManager, canvasId, sessionId])
 
   const sessionIdRef = useRef<string>(session?.id || nanoid())
   const [expandingToolCalls, setExpandingToolCalls] = useState<string[]>([])
@@ -414,6 +428,31 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({
         return data.messages
       })
       setMessages(mergeToolCallResult(data.messages))
+      // The snapshot is the whole history
+      historyOffsetRef.current = 0
+      setHistoryCursor(null)
+      scrollToBottom()
+    },
+    [sessionId, scrollToBottom]
+  )
+
+  const handleMessagesDelta = useCallback(
+    (data: TEvents['Socket::Session::MessagesDelta']) => {
+      if (data.session_id && data.session_id !== sessionId) {
+        return
+      }
+
+      // Indices count the whole history, only its latest pages may be loaded
+      const offset = historyOffsetRef.current
+      setMessages((prev) => {
+        const next = prev.slice(0, Math.max(data.total - offset, 0))
+        for (const { index, message } of data.changes) {
+          if (index >= offset && index - offset <= next.length) {
+            next[index - offset] = message
+          }
+        }
+        return mergeToolCallResult(next)
+      })
       scrollToBottom()
     },
     [sessionId, scrollToBottom]
@@ -475,6 +514,7 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({
     eventBus.on('Socket::Session::ToolCallResult', handleToolCallResult)
     eventBus.on('Socket::Session::ImageGenerated', handleImageGenerated)
     eventBus.on('Socket::Session::AllMessages', handleAllMessages)
+    eventBus.on('Socket::Session::MessagesDelta', handleMessagesDelta)
     eventBus.on('Socket::Session::Done', handleDone)
     eventBus.on('Socket::Session::Error', handleError)
     eventBus.on('Socket::Session::Info', handleInfo)
@@ -502,6 +542,7 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({
       eventBus.off('Socket::Session::ToolCallResult', handleToolCallResult)
       eventBus.off('Socket::Session::ImageGenerated', handleImageGenerated)
       eventBus.off('Socket::Session::AllMessages', handleAllMessages)
+      eventBus.off('Socket::Session::MessagesDelta', handleMessagesDelta)
       eventBus.off('Socket::Session::Done', handleDone)
       eventBus.off('Socket::Session::Error', handleError)
       eventBus.off('Socket::Session::Info', handleInfo)
@@ -515,26 +556,25 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({
 
     sessionIdRef.current = sessionId
 
-    let msgs = []
+    let msgs: Message[] = []
+    let cursor: string | null = null
+    let offset = 0
     try {
-      const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || 'https://jaaz-backend-337074826438.asia-northeast1.run.app'
-      console.log('🔍 Loading chat history for session:', sessionId, 'from', API_BASE_URL)
-      const resp = await fetch(`${API_BASE_URL}/api/chat_session/${sessionId}`)
-
-      if (!resp.ok) {
-        console.error('❌ Failed to fetch chat history:', resp.status, resp.statusText)
-        return
-      }
-
-      const data = await resp.json()
-      msgs = data?.length ? data : []
+      console.log('🔍 Loading chat history for session:', sessionId)
+      // Only the latest page, older messages are loaded on demand
+      const page = await getChatHistoryPage(sessionId)
+      msgs = page.messages ?? []
+      cursor = page.before_id
+      offset = page.offset ?? 0
       console.log('📝 Loaded messages:', msgs.length)
     } catch (error) {
       console.error('❌ Error loading chat history:', error)
       return
     }
 
+    historyOffsetRef.current = offset
     setMessages(mergeToolCallResult(msgs))
+    setHistoryCursor(cursor)
     if (msgs.length > 0) {
       setInitCanvas(false)
     }
@@ -546,6 +586,23 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({
     initChat()
   }, [sessionId, initChat])
 
+  const loadEarlierMessages = useCallback(async () => {
+    if (!sessionId || !historyCursor || loadingHistory) {
+      return
+    }
+    setLoadingHistory(true)
+    try {
+      const page = await getChatHistoryPage(sessionId, historyCursor)
+      historyOffsetRef.current = page.offset ?? 0
+      setMessages((prev) => mergeToolCallResult([...page.messages, ...prev]))
+      setHistoryCursor(page.before_id)
+    } catch (error) {
+      console.error('❌ Error loading earlier messages:', error)
+    } finally {
+      setLoadingHistory(false)
+    }
+  }, [sessionId, historyCursor, loadingHistory])
+
   const onSelectSession = (sessionId: string) => {
     setSession(sessionList.find((s) => s.id === sessionId) || null)
     window.history.pushState(
@@ -633,6 +690,18 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({
         <ScrollArea className='h-[calc(100vh-45px)]' viewportRef={scrollRef}>
           {messages.length > 0 ? (
             <div className='flex flex-col flex-1 px-4 pb-50 pt-15'>
+              {historyCursor && (
+                <Button
+                  variant='ghost'
+                  size='sm'
+                  className='self-center mb-2'
+                  disabled={loadingHistory}
+                  onClick={loadEarlierMessages}
+                >
+                  {t('chat:messages.loadEarlier')}
+                </Button>
+              )}
+
               {/* Messages */}
               {messages.map((message, idx) => (
                 <div key={`${idx}`} className='flex flex-col gap-4 mb-2'>
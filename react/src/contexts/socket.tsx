@@ -150,3 +150,5 @@ export const SocketProvider: React.FC<SocketProviderProps> = ({ children }) => {
     </SocketContext.Provider>
   )
 }
+
+export const useSocket = () => useContext(SocketContext)
@@ -21,6 +21,10 @@ export class SocketIOManager {
   private reconnectAttempts = 0
   private maxReconnectAttempts = 5
   private reconnectDelay = 1000
+  // Last messages sequence number seen per session, used to detect gaps
+  private messageSeqs: Record<string, number> = {}
+  // Canvas/session rooms joined on the server, replayed after reconnects
+  private subscriptions = new Map<string, ISocket.SocketSubscription>()
 
   constructor(private config: SocketConfig = {}) {
     if (config.autoConnect !== false) {
@@ -48,6 +52,9 @@ export class SocketIOManager {
         console.log('✅ Socket.IO connected:', this.socket?.id)
         this.connected = true
         this.reconnectAttempts = 0
+        for (const subscription of this.subscriptions.values()) {
+          this.socket?.emit('subscribe', subscription)
+        }
         resolve(true)
       })
 
@@ -130,9 +137,32 @@ export class SocketIOManager {
       case ISocket.SessionEventType.VideoGenerated:
         eventBus.emit('Socket::Session::VideoGenerated', data)
         break
+      case ISocket.SessionEventType.CanvasElementsAdded:
+        // One broadcast for a batch of results, handled item by item
+        for (const item of data.items) {
+          const event = { ...item, session_id, canvas_id: data.canvas_id }
+          if (event.type === ISocket.SessionEventType.ImageGenerated) {
+            eventBus.emit('Socket::Session::ImageGenerated', event)
+          } else {
+            eventBus.emit('Socket::Session::VideoGenerated', event)
+          }
+        }
+        break
       case ISocket.SessionEventType.AllMessages:
+        this.messageSeqs[session_id] = data.seq ?? 0
         eventBus.emit('Socket::Session::AllMessages', data)
         break
+      case ISocket.SessionEventType.MessagesDelta:
+        // Every stream starts its deltas at seq 1
+        if (data.seq !== 1 && this.messageSeqs[session_id] !== data.seq - 1) {
+          // Missed a delta, ask the server for a full snapshot instead
+          console.warn('⚠️ Messages delta out of order, resyncing:', session_id)
+          this.socket?.emit('resync_messages', { session_id })
+          break
+        }
+        this.messageSeqs[session_id] = data.seq
+        eventBus.emit('Socket::Session::MessagesDelta', data)
+        break
       case ISocket.SessionEventType.Done:
         eventBus.emit('Socket::Session::Done', data)
         break
@@ -150,6 +180,20 @@ export class SocketIOManager {
     }
   }
 
+  subscribe(subscription: ISocket.SocketSubscription) {
+    this.subscriptions.set(JSON.stringify(subscription), subscription)
+    if (this.socket && this.connected) {
+      this.socket.emit('subscribe', subscription)
+    }
+  }
+
+  unsubscribe(subscription: ISocket.SocketSubscription) {
+    this.subscriptions.delete(JSON.stringify(subscription))
+    if (this.socket && this.connected) {
+      this.socket.emit('unsubscribe', subscription)
+    }
+  }
+
   ping(data: unknown) {
     if (this.socket && this.connected) {
       this.socket.emit('ping', data)
@@ -12,6 +12,7 @@ import { useState } from 'react'
 import { useTranslation } from 'react-i18next'
 import { toast } from 'sonner'
 import TopMenu from '@/components/TopMenu'
+import { useSocket } from '@/contexts/socket'
 
 export const Route = createFileRoute('/')({
   component: Home,
@@ -21,6 +22,7 @@ function Home() {
   const navigate = useNavigate()
   const { t } = useTranslation()
   const { setInitCanvas } = useConfigs()
+  const { socketManager } = useSocket()
 
   const { mutate: createCanvasMutation, isPending } = useMutation({
     mutationFn: createCanvas,
@@ -66,11 +68,15 @@ function Home() {
             className='w-full max-w-xl'
             messages={[]}
             onSendMessages={(messages, configs) => {
+              const canvasId = nanoid()
+              const sessionId = nanoid()
+              // Join the rooms before the first reply starts streaming
+              socketManager?.subscribe({ canvas_id: canvasId, session_id: sessionId })
               createCanvasMutation({
                 name: t('home:newCanvas'),
-                canvas_id: nanoid(),
+                canvas_id: canvasId,
                 messages: messages,
-                session_id: nanoid(),
+                session_id: sessionId,
                 text_model: configs.textModel,
                 tool_list: configs.toolList,
                 system_prompt: DEFAULT_SYSTEM_PROMPT, // Force use new IP-focused system prompt
@@ -8,17 +8,24 @@ export enum SessionEventType {
   Info = 'info',
   ImageGenerated = 'image_generated',
   VideoGenerated = 'video_generated',
+  CanvasElementsAdded = 'canvas_elements_added',
   Delta = 'delta',
   ToolCall = 'tool_call',
   ToolCallArguments = 'tool_call_arguments',
   ToolCallResult = 'tool_call_result',
   AllMessages = 'all_messages',
+  MessagesDelta = 'messages_delta',
   ToolCallProgress = 'tool_call_progress',
   ToolCallPendingConfirmation = 'tool_call_pending_confirmation',
   ToolCallConfirmed = 'tool_call_confirmed',
   ToolCallCancelled = 'tool_call_cancelled',
 }
 
+export interface SocketSubscription {
+  canvas_id?: string
+  session_id?: string
+}
+
 export interface SessionBaseEvent {
   session_id: string
 }
@@ -49,6 +56,17 @@ export interface SessionVideoGeneratedEvent extends SessionBaseEvent {
   video_url: string
 }
 
+// Several generated results placed on a canvas at once, each item is the
+// payload of the matching image_generated / video_generated event
+export interface SessionCanvasElementsAddedEvent extends SessionBaseEvent {
+  type: SessionEventType.CanvasElementsAdded
+  canvas_id: string
+  items: (
+    | Omit<SessionImageGeneratedEvent, 'session_id' | 'canvas_id'>
+    | Omit<SessionVideoGeneratedEvent, 'session_id' | 'canvas_id'>
+  )[]
+}
+
 export interface SessionDeltaEvent extends SessionBaseEvent {
   type: SessionEventType.Delta
   text: string
@@ -71,6 +89,13 @@ export interface SessionToolCallResultEvent extends SessionBaseEvent {
 export interface SessionAllMessagesEvent extends SessionBaseEvent {
   type: SessionEventType.AllMessages
   messages: Message[]
+  seq?: number
+}
+export interface SessionMessagesDeltaEvent extends SessionBaseEvent {
+  type: SessionEventType.MessagesDelta
+  seq: number
+  total: number
+  changes: { index: number; message: Message }[]
 }
 export interface SessionToolCallProgressEvent extends SessionBaseEvent {
   type: SessionEventType.ToolCallProgress
@@ -103,7 +128,9 @@ export type SessionUpdateEvent =
   | SessionToolCallProgressEvent
   | SessionImageGeneratedEvent
   | SessionVideoGeneratedEvent
+  | SessionCanvasElementsAddedEvent
   | SessionAllMessagesEvent
+  | SessionMessagesDeltaEvent
   | SessionDoneEvent
   | SessionErrorEvent
   | SessionInfoEvent
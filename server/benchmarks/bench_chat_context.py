@@ -0,0 +1,151 @@
+"""
+Benchmark: model input tokens per chat turn, full history vs context window
+
+Replays chat sessions turn by turn and, for each user message, compares the
+model input of that turn:
+
+- full:     the whole history as the client sends it (what the agents used
+            to pass to the model), inline images included
+- windowed: services/langgraph_service/context_window.py, earlier images as
+            file ids and the oldest turns summarized past the budget
+
+Sessions are read from the local database (USER_DATA_DIR), or generated with
+--synthetic: IP-design sessions where every turn attaches a reference image,
+calls a generation tool and answers. Summaries are not generated by a model
+here, a stand-in of CHAT_SUMMARY_TOKENS length is used and the summarization
+calls are counted.
+
+Tokens are the context window's estimates (4 characters per token, 765 per
+image); payload is the JSON size of the messages.
+
+Run from the server directory:
+    python -m benchmarks.bench_chat_context
+    python -m benchmarks.bench_chat_context --synthetic 40 --budget 16000
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+from typing import Any, Dict, List, Optional
+from langchain_core.messages import AIMessage, BaseMessage, convert_to_messages
+from services.db_adapter import db_adapter
+from services.langgraph_service.agent_service import _fix_chat_history
+from services.langgraph_service.context_window import ChatContextWindow, SUMMARY_TOKENS, estimate_tokens
+
+
+class _StandInSummarizer:
+    """Answers summarization requests with SUMMARY_TOKENS worth of text"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def ainvoke(self, messages: Any, config: Optional[Dict[str, Any]] = None) -> AIMessage:
+        self.calls += 1
+        return AIMessage(content='summary ' * (SUMMARY_TOKENS // 2))
+
+
+class _InMemoryContextWindow(ChatContextWindow):
+    """Keeps summaries in memory instead of the chat_summaries table"""
+
+    async def _load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return self._summaries.get(session_id)
+
+    async def _store(self, session_id: str, record: Dict[str, Any]) -> None:
+        self._summaries[session_id] = record
+
+
+def _synthetic_session(turns: int, image_kb: int) -> List[Dict[str, Any]]:
+    image = 'data:image/png;base64,' + base64.b64encode(os.urandom(image_kb * 1024)).decode('ascii')
+    messages: List[Dict[str, Any]] = []
+    for turn in range(turns):
+        file_id = f'im_ref{turn:03d}.png'
+        messages.append({'role': 'user', 'content': [
+            {'type': 'text', 'text': (
+                f'Turn {turn}: make the mascot sticker pose #{turn}, keep the pastel palette and the round '
+                f'shapes from before, add a small speech bubble saying hello.\n\n'
+                f'<input_images count="1">\n<image index="1" file_id="{file_id}" width="1024" height="1024" />\n'
+                f'</input_images>'
+            )},
+            {'type': 'image_url', 'image_url': {'url': image}},
+        ]})
+        call_id = f'call_{turn:03d}'
+        messages.append({'role': 'assistant', 'content': 'Character design notes:\n' + '- consistent proportions\n' * 20,
+                         'tool_calls': [{'id': call_id, 'type': 'function', 'function': {
+                             'name': 'generate_image_by_gpt_image_1_jaaz',
+                             'arguments': json.dumps({'prompt': 'kawaii cloud cat mascot sticker ' * 8,
+                                                      'aspect_ratio': '1:1', 'input_images': [file_id]}),
+                         }}]})
+        messages.append({'role': 'tool', 'tool_call_id': call_id,
+                         'content': f'image generated successfully ![image_id: im_out{turn:03d}.png]'
+                                    f'(http://localhost:57988/api/file/im_out{turn:03d}.png)'})
+        messages.append({'role': 'assistant', 'content': f'Here is pose #{turn}. ' + 'It keeps the style guide. ' * 10})
+    return messages
+
+
+async def _recorded_sessions(limit: int) -> List[List[Dict[str, Any]]]:
+    sessions = []
+    for canvas in await db_adapter.list_canvases():
+        for session in await db_adapter.list_sessions(canvas['id']):
+            history = await db_adapter.get_chat_history(session['id'])
+            if history:
+                sessions.append(history)
+            if len(sessions) >= limit:
+                return sessions
+    return sessions
+
+
+async def _replay(name: str, history: List[Dict[str, Any]], window: ChatContextWindow) -> Dict[str, Any]:
+    model = _StandInSummarizer()
+    result = {'name': name, 'turns': 0, 'full': 0, 'windowed': 0, 'full_bytes': 0, 'windowed_bytes': 0,
+              'last_full': 0, 'last_windowed': 0}
+    for index, message in enumerate(history):
+        if message.get('role') != 'user':
+            continue
+        messages: List[BaseMessage] = convert_to_messages(_fix_chat_history(history[:index + 1]))
+        for i, converted in enumerate(messages):
+            converted.id = f'{name}-{i}'
+        prepared = await window.prepare(messages, name, model)
+        full, windowed = estimate_tokens(messages), estimate_tokens(prepared)
+        result['turns'] += 1
+        result['full'] += full
+        result['windowed'] += windowed
+        result['full_bytes'] += len(json.dumps([m.content for m in messages], default=str))
+        result['windowed_bytes'] += len(json.dumps([m.content for m in prepared], default=str))
+        result['last_full'], result['last_windowed'] = full, windowed
+    result['summary_calls'] = model.calls
+    return result
+
+
+async def main(args: argparse.Namespace) -> None:
+    if args.synthetic:
+        sessions = [(f'synthetic-{args.synthetic}-turns', _synthetic_session(args.synthetic, args.image_kb))]
+    else:
+        try:
+            recorded = await _recorded_sessions(args.limit)
+        finally:
+            await db_adapter.close()
+        if not recorded:
+            print("No recorded sessions in USER_DATA_DIR, using a synthetic one (see --synthetic)")
+            recorded = [_synthetic_session(30, args.image_kb)]
+        sessions = [(f'session-{i}', history) for i, history in enumerate(recorded)]
+
+    window = _InMemoryContextWindow(max_tokens=args.budget)
+    print(f"Budget {args.budget} tokens, summary {SUMMARY_TOKENS} tokens")
+    print(f"{'session':>24} {'turns':>5} {'last turn full':>15} {'windowed':>9} "
+          f"{'all turns full':>15} {'windowed':>9} {'payload MB full':>16} {'windowed':>9} {'summaries':>9}")
+    for name, history in sessions:
+        r = await _replay(name, history, window)
+        print(f"{r['name']:>24} {r['turns']:>5} {r['last_full']:>15} {r['last_windowed']:>9} "
+              f"{r['full']:>15} {r['windowed']:>9} {r['full_bytes'] / 1e6:>16.2f} {r['windowed_bytes'] / 1e6:>9.2f} "
+              f"{r['summary_calls']:>9}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--budget', type=int, default=24000, help='CHAT_CONTEXT_TOKENS to test')
+    parser.add_argument('--synthetic', type=int, default=0, help='replay a generated session of this many turns')
+    parser.add_argument('--image-kb', type=int, default=300, help='size of the synthetic reference images')
+    parser.add_argument('--limit', type=int, default=20, help='recorded sessions to replay')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,104 @@
+"""
+Benchmark: chat history per turn, client-posted vs server-side
+
+For one long session (every turn: a user message with an inline reference
+image, a tool call, its result and an answer) this compares:
+
+- request body of /api/chat: the whole history (what the client used to
+  post) against only the new message
+- history read: every row parsed from SQLite (what every history read used
+  to do) against a chat_histories hit
+- opening the session in the client: the whole history against the latest
+  page of get_chat_history_page
+
+The database is a temporary file with the current migrations.
+
+Run from the server directory:
+    python -m benchmarks.bench_chat_history
+    python -m benchmarks.bench_chat_history --turns 200 --image-kb 100
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import statistics
+import tempfile
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+from services.chat_history_cache import ChatHistoryCache
+from services.db_adapter import DatabaseAdapter
+from services.db_service import DatabaseService
+
+
+def _session(turns: int, image_kb: int) -> List[Dict[str, Any]]:
+    image = 'data:image/png;base64,' + base64.b64encode(os.urandom(image_kb * 1024)).decode('ascii')
+    messages: List[Dict[str, Any]] = []
+    for turn in range(turns):
+        call_id = f'call_{turn:04d}'
+        messages.append({'role': 'user', 'content': [
+            {'type': 'text', 'text': f'Turn {turn}: another pose of the mascot, same palette'},
+            {'type': 'image_url', 'image_url': {'url': image}},
+        ]})
+        messages.append({'role': 'assistant', 'content': '', 'tool_calls': [{
+            'id': call_id, 'type': 'function',
+            'function': {'name': 'generate_image_by_gpt_image_1_jaaz', 'arguments': json.dumps({'prompt': 'mascot ' * 20})},
+        }]})
+        messages.append({'role': 'tool', 'tool_call_id': call_id,
+                         'content': f'image generated successfully ![image_id: im_{turn:04d}.png](/api/file/im_{turn:04d}.png)'})
+        messages.append({'role': 'assistant', 'content': f'Here is pose #{turn}. ' + 'It keeps the style guide. ' * 10})
+    return messages
+
+
+async def _median_ms(fn: Callable[[], Awaitable[Any]], runs: int) -> float:
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+async def main(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DatabaseService(os.path.join(tmp, 'bench.db'))
+        adapter = DatabaseAdapter()
+        adapter.sqlite_db = db
+        cache = ChatHistoryCache()
+        try:
+            messages = _session(args.turns, args.image_kb)
+            await db.create_chat_session('bench', 'gpt-4o', 'openai', 'canvas', 'bench')
+            await adapter.create_messages('bench', messages)
+            new_message = messages[-4]
+
+            full_body = len(json.dumps({'messages': messages, 'session_id': 'bench'}))
+            new_body = len(json.dumps({'message': new_message, 'session_id': 'bench'}))
+            print(f"{args.turns} turns, {len(messages)} messages, {args.image_kb} KB image per user message")
+            print(f"/api/chat body, whole history:  {full_body / 1e6:9.2f} MB")
+            print(f"/api/chat body, new message:    {new_body / 1e6:9.2f} MB")
+
+            def load():
+                return db.get_chat_history('bench')
+
+            await cache.get_or_load('bench', load)
+            parsed = await _median_ms(load, args.runs)
+            cached = await _median_ms(lambda: cache.get_or_load('bench', load), args.runs)
+            page = await _median_ms(lambda: adapter.get_chat_history_page('bench', None, args.page), args.runs)
+            latest = await adapter.get_chat_history_page('bench', None, args.page)
+            print(f"history read, parse all rows:   {parsed:9.2f} ms")
+            print(f"history read, cache hit:        {cached:9.3f} ms")
+            print(f"open session, whole history:    {parsed:9.2f} ms  {full_body / 1e6:7.2f} MB")
+            print(f"open session, latest page:      {page:9.2f} ms  "
+                  f"{len(json.dumps(latest)) / 1e6:7.2f} MB ({len(latest['messages'])} messages)")
+        finally:
+            await db.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--turns', type=int, default=100, help='turns in the session')
+    parser.add_argument('--image-kb', type=int, default=300, help='size of the inline reference images')
+    parser.add_argument('--page', type=int, default=50, help='history page size')
+    parser.add_argument('--runs', type=int, default=5, help='runs per measurement')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,110 @@
+"""
+Benchmark: compressing oversized uploads under the upload limit
+
+For synthetic uploads of about 5, 20 and 50 MB (PNG photos with grain, like
+screenshots of generated images or camera exports) this compares:
+
+- loop:   the previous compress_image, quality 95, 85, ... then scale 0.8, 0.7, ...
+          each step a full-size JPEG encode
+- search: utils/image_compress.py, probe-estimated binary search
+
+and reports full-size encodes, wall time and the resulting size.
+
+Run from the server directory:
+    python -m benchmarks.bench_compress_image
+    python -m benchmarks.bench_compress_image --sizes 5,20 --limit 3
+"""
+
+import argparse
+import math
+import time
+from io import BytesIO
+from typing import Any, Dict, Tuple
+from PIL import Image, ImageFilter
+from utils.image_compress import compress_to_limit
+
+
+def _legacy_compress(img: Image.Image, max_size_mb: float) -> Tuple[bytes, int]:
+    """The previous compress_image loop, returns (data, full encodes)"""
+    encodes = 0
+
+    def encode(image: Image.Image, quality: int) -> bytes:
+        nonlocal encodes
+        encodes += 1
+        buffer = BytesIO()
+        image.save(buffer, format='JPEG', quality=quality, optimize=True)
+        return buffer.getvalue()
+
+    quality = 95
+    while quality > 10:
+        data = encode(img, quality)
+        if len(data) / (1024 * 1024) <= max_size_mb:
+            return data, encodes
+        quality -= 10
+
+    original_width, original_height = img.size
+    scale_factor = 0.8
+    while scale_factor > 0.3:
+        resized_img = img.resize((int(original_width * scale_factor), int(original_height * scale_factor)),
+                                 Image.Resampling.LANCZOS)
+        data = encode(resized_img, 70)
+        if len(data) / (1024 * 1024) <= max_size_mb:
+            return data, encodes
+        scale_factor -= 0.1
+
+    return encode(resized_img, 30), encodes
+
+
+def _make_upload(target_mb: float, grain: int) -> bytes:
+    """PNG of roughly target_mb: smooth photographic content with grain"""
+
+    def render(side: int) -> bytes:
+        size = (side * 3 // 2, side)
+        base = Image.effect_mandelbrot(size, (-2.0, -1.2, 0.8, 1.2), 80).convert('RGB')
+        gradient = Image.linear_gradient('L').resize(size).convert('RGB')
+        image = Image.blend(base, gradient, 0.5).filter(ImageFilter.GaussianBlur(4))
+        image = Image.blend(image, Image.effect_noise(size, grain).convert('RGB'), 0.25)
+        with BytesIO() as output:
+            image.save(output, format='PNG', compress_level=1)
+            return output.getvalue()
+
+    side = 1024
+    data = render(side)
+    # PNG size grows with the pixel count, one correction is close enough
+    side = int(side * math.sqrt(target_mb * 1024 * 1024 / len(data)))
+    return render(side)
+
+
+def _run(label: str, upload: bytes, limit_mb: float) -> Dict[str, Any]:
+    start = time.perf_counter()
+    with Image.open(BytesIO(upload)) as image:
+        image.load()
+        if label == 'loop':
+            data, encodes = _legacy_compress(image.convert('RGB'), limit_mb)
+            extra = ''
+        else:
+            data, stats = compress_to_limit(image, int(limit_mb * 1024 * 1024))
+            encodes = stats['encodes']
+            extra = f"q{stats['quality']} x{stats['scale']:.2f}, {stats['probe_encodes']} probe encodes"
+    return {'encodes': encodes, 'seconds': time.perf_counter() - start, 'size': len(data), 'extra': extra}
+
+
+def main(args: argparse.Namespace) -> None:
+    print(f"Upload limit {args.limit} MB")
+    print(f"{'upload':>10} {'pixels':>9} {'engine':>7} {'encodes':>8} {'wall s':>7} {'result MB':>9}")
+    for target in (float(size) for size in args.sizes.split(',')):
+        upload = _make_upload(target, args.grain)
+        with Image.open(BytesIO(upload)) as image:
+            megapixels = image.width * image.height / 1e6
+        for label in ('loop', 'search'):
+            result = _run(label, upload, args.limit)
+            print(f"{len(upload) / 1024 / 1024:>8.1f}MB {megapixels:>7.1f}MP {label:>7} {result['encodes']:>8} "
+                  f"{result['seconds']:>7.2f} {result['size'] / 1024 / 1024:>9.2f}  {result['extra']}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='5,20,50', help='upload sizes in MB')
+    parser.add_argument('--limit', type=float, default=3.0, help='max_size_mb of the upload endpoint')
+    parser.add_argument('--grain', type=int, default=40, help='noise level of the synthetic photos')
+    main(parser.parse_args())
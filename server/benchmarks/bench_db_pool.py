@@ -0,0 +1,73 @@
+"""
+Benchmark: pooled SQLite connections vs per-call aiosqlite.connect()
+
+Writes N chat messages (optionally from several concurrent "sessions") and
+reports messages per second for both designs.
+
+Run from the server directory:
+    python -m benchmarks.bench_db_pool --messages 2000 --concurrency 8
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+import aiosqlite
+from services.db_service import DatabaseService
+
+
+async def _legacy_create_message(db_path: str, session_id: str, role: str, message: str):
+    """The previous design: open, insert, commit and close per message"""
+    async with aiosqlite.connect(db_path) as db:
+        await db.execute("""
+            INSERT INTO chat_messages (session_id, role, message)
+            VALUES (?, ?, ?)
+        """, (session_id, role, message))
+        await db.commit()
+
+
+async def _run(label: str, write, messages: int, concurrency: int) -> float:
+    payload = json.dumps({'role': 'assistant', 'content': 'x' * 200})
+    per_worker = messages // concurrency
+
+    async def worker(n: int):
+        for _ in range(per_worker):
+            await write(f'session_{n}', 'assistant', payload)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(n) for n in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    rate = per_worker * concurrency / elapsed
+    print(f"{label:<12} {per_worker * concurrency:>7} msgs  {elapsed:7.3f}s  {rate:9.1f} msg/s")
+    return rate
+
+
+async def main(messages: int, concurrency: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, 'legacy.db')
+        pooled_path = os.path.join(tmp, 'pooled.db')
+
+        # Both databases get the same schema; only the access pattern differs
+        DatabaseService(legacy_path)
+        pooled = DatabaseService(pooled_path)
+
+        legacy_rate = await _run(
+            'per-call',
+            lambda *args: _legacy_create_message(legacy_path, *args),
+            messages,
+            concurrency,
+        )
+        pooled_rate = await _run('pooled', pooled.create_message, messages, concurrency)
+        await pooled.close()
+
+        print(f"speedup: {pooled_rate / legacy_rate:.1f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    args = parser.parse_args()
+    asyncio.run(main(args.messages, args.concurrency))
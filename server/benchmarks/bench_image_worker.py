@@ -0,0 +1,104 @@
+"""
+Benchmark: event loop stalls while saving generated images
+
+Saves --images synthetic generation results (noisy gradients, JPEG encoded
+like most provider outputs) as optimized PNG, --concurrency at a time, with:
+
+- inline: the previous behaviour, PIL decode/convert/encode on the event loop
+- pool:   through the image worker pool
+
+A ticker coroutine sleeping --tick ms measures how late the loop wakes it up,
+which is what every websocket stream sees while images are being saved.
+
+Run from the server directory:
+    python -m benchmarks.bench_image_worker --size 3072 --images 8
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from io import BytesIO
+from typing import List
+from PIL import Image
+from utils.image_output import save_image
+from utils.image_worker import ImageWorkerPool
+
+
+def _make_image(size: int, seed: int) -> bytes:
+    gradient = Image.linear_gradient('L').resize((size, size))
+    noise = Image.effect_noise((size, size), 40 + seed)
+    image = Image.merge('RGB', (gradient, noise, gradient.rotate(90)))
+    with BytesIO() as output:
+        image.save(output, format='JPEG', quality=90)
+        return output.getvalue()
+
+
+async def _ticker(tick: float, stop: asyncio.Event, lateness: List[float]) -> None:
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(tick)
+        lateness.append((time.perf_counter() - start - tick) * 1000)
+
+
+async def _run(mode: str, sources: List[bytes], workdir: str, args: argparse.Namespace) -> None:
+    pool = ImageWorkerPool(processes=args.processes) if mode == 'pool' else None
+    slots = asyncio.Semaphore(args.concurrency)
+
+    async def save_one(i: int) -> None:
+        async with slots:
+            source_path = os.path.join(workdir, f'{mode}_{i}.download')
+            with open(source_path, 'wb') as f:
+                f.write(sources[i % len(sources)])
+            target = os.path.join(workdir, f'{mode}_{i}')
+            if pool is None:
+                save_image(source_path, target)
+            else:
+                await pool.run('save_image', save_image, source_path, target)
+
+    if pool is not None:
+        # Start the workers outside the measurement
+        warmup = os.path.join(workdir, 'warmup.download')
+        with open(warmup, 'wb') as f:
+            f.write(sources[0])
+        await pool.run('save_image', save_image, warmup, os.path.join(workdir, 'warmup'))
+
+    lateness: List[float] = []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(_ticker(args.tick / 1000, stop, lateness))
+    await asyncio.sleep(args.tick / 1000 * 3)
+    start = time.perf_counter()
+    await asyncio.gather(*[save_one(i) for i in range(args.images)])
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await ticker
+    if pool is not None:
+        pool.close()
+
+    stalled = sum(late for late in lateness if late > args.tick)
+    print(f"{mode:>7} {elapsed:>8.2f} {max(lateness):>12.1f} {statistics.median(lateness):>11.1f} {stalled:>14.0f}")
+
+
+async def main(args: argparse.Namespace) -> None:
+    print(f"Encoding {args.images} images of {args.size}x{args.size}, {args.concurrency} at a time")
+    sources = [_make_image(args.size, seed) for seed in range(min(args.images, 3))]
+    workdir = tempfile.mkdtemp(prefix='bench_image_worker_')
+    try:
+        print(f"{'mode':>7} {'wall s':>8} {'max stall ms':>12} {'p50 late ms':>11} {'stalled ms sum':>14}")
+        for mode in ('inline', 'pool'):
+            await _run(mode, sources, workdir, args)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=3072)
+    parser.add_argument('--images', type=int, default=8)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--processes', type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument('--tick', type=float, default=10.0, help='ticker interval in ms')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,85 @@
+"""
+Benchmark: per-task fixed-interval polling vs the central Jaaz task watcher
+
+Starts the stub Jaaz server, creates --tasks concurrent tasks with durations
+spread over --min-duration..--max-duration (image jobs to video jobs), and
+waits for all of them with:
+
+- fixed:   the previous loop, one GET /task/{id} every --interval seconds per task
+- watcher: a JaazTaskWatcher with the default backoff (0.5s x1.5 up to 1.5s),
+           with and without the batch status endpoint
+
+Reports status requests sent and how late completion was noticed. All times
+are multiplied by --scale while running and reported unscaled, so the default
+5-120s tasks finish in a few seconds.
+
+Run from the server directory:
+    python -m benchmarks.bench_jaaz_polling --tasks 40 --interval 2
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Any, Dict, List
+import aiohttp
+from benchmarks.jaaz_stub_server import StubJaazServer
+from services.jaaz_task_watcher import JaazTaskWatcher
+from utils.http_client import HttpClient
+
+HEADERS = {'Authorization': 'Bearer stub', 'Content-Type': 'application/json'}
+
+
+async def _fixed_poll(api_url: str, task_id: str, interval: float, max_attempts: int) -> Dict[str, Any]:
+    async with HttpClient.create_aiohttp() as session:
+        for _ in range(max_attempts):
+            async with session.get(f'{api_url}/task/{task_id}', headers=HEADERS,
+                                   timeout=aiohttp.ClientTimeout(total=20.0)) as response:
+                task = (await response.json())['data']['task']
+                if task['status'] != 'processing':
+                    return task
+            await asyncio.sleep(interval)
+    raise Exception('timeout')
+
+
+async def _run(mode: str, args: argparse.Namespace) -> None:
+    stub = StubJaazServer(batch=(mode != 'watcher-nobatch'))
+    api_url = await stub.start()
+    scale = args.scale
+    defaults = JaazTaskWatcher()
+    watcher = JaazTaskWatcher(min_interval=defaults.min_interval * scale, max_interval=defaults.max_interval * scale,
+                              backoff=defaults.backoff, coalesce_window=defaults.coalesce_window * scale)
+    durations = [
+        (args.min_duration + (args.max_duration - args.min_duration) * i / max(args.tasks - 1, 1)) * scale
+        for i in range(args.tasks)
+    ]
+    task_ids = [stub.create_task({'stub_duration': d})['id'] for d in durations]
+
+    async def wait_one(task_id: str) -> float:
+        if mode == 'fixed':
+            await _fixed_poll(api_url, task_id, args.interval * scale, 100000)
+        else:
+            await watcher.wait(api_url, HEADERS, task_id, timeout=600)
+        return (time.monotonic() - stub.finished_at(task_id)) / scale
+
+    lateness: List[float] = await asyncio.gather(*[wait_one(t) for t in task_ids])
+    requests = stub.stats['status_requests'] + stub.stats['batch_requests']
+    print(f"{mode:>16} {requests:>9} {statistics.mean(lateness) * 1000:>12.0f} {max(lateness) * 1000:>11.0f}")
+    await stub.stop()
+
+
+async def main(args: argparse.Namespace) -> None:
+    print(f"{'mode':>16} {'requests':>9} {'mean late ms':>12} {'max late ms':>11}")
+    for mode in ('fixed', 'watcher-nobatch', 'watcher'):
+        await _run(mode, args)
+    await HttpClient.close_all()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tasks', type=int, default=40)
+    parser.add_argument('--interval', type=float, default=2.0, help='fixed poll interval')
+    parser.add_argument('--min-duration', type=float, default=5.0)
+    parser.add_argument('--max-duration', type=float, default=120.0)
+    parser.add_argument('--scale', type=float, default=0.05, help='time compression factor')
+    asyncio.run(main(parser.parse_args()))
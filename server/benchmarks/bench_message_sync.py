@@ -0,0 +1,79 @@
+"""
+Benchmark: full `all_messages` resend vs incremental `messages_delta`
+
+Simulates one agent turn on top of an existing history: each step appends a
+message and emits a `values` chunk, like the swarm does. Reports the bytes
+that would go over the websocket and the CPU time spent per turn.
+
+Run from the server directory:
+    python -m benchmarks.bench_message_sync --sizes 50 200 1000 --steps 8
+"""
+
+import argparse
+import json
+import time
+from typing import Any, Dict, List
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage, convert_to_openai_messages
+from services.message_sync_service import MessageSync
+
+
+def _make_step(i: int) -> BaseMessage:
+    if i % 3 == 0:
+        return HumanMessage(content=f"Design a mascot variant number {i} " * 4)
+    if i % 3 == 1:
+        return AIMessage(
+            content="",
+            tool_calls=[{
+                'id': f'call_{i}',
+                'name': 'generate_image_by_gpt_image_1_jaaz',
+                'args': {'prompt': f'mascot variant {i} ' * 8, 'aspect_ratio': '1:1'},
+            }],
+        )
+    return ToolMessage(
+        content=f"image generated successfully ![image_id: im_{i}.png](http://localhost/api/file/im_{i}.png)",
+        tool_call_id=f'call_{i - 1}',
+    )
+
+
+def _legacy_turn(history: List[BaseMessage], steps: int) -> int:
+    messages = list(history)
+    sent = 0
+    for i in range(steps):
+        messages = messages + [_make_step(len(messages) + i)]
+        event: Dict[str, Any] = {'type': 'all_messages', 'messages': convert_to_openai_messages(messages)}
+        sent += len(json.dumps(event))
+    return sent
+
+
+def _delta_turn(history: List[BaseMessage], steps: int) -> int:
+    sync = MessageSync('bench')
+    messages = list(history)
+    sent = len(json.dumps(sync.snapshot(messages)))
+    for i in range(steps):
+        messages = messages + [_make_step(len(messages) + i)]
+        _, event = sync.diff(messages)
+        if event:
+            sent += len(json.dumps(event))
+    return sent
+
+
+def main(sizes: List[int], steps: int, turns: int):
+    print(f"{'history':>8} {'mode':>7} {'bytes/turn':>12} {'cpu ms/turn':>12}")
+    for size in sizes:
+        history = [_make_step(i) for i in range(size)]
+        for label, run in (('full', _legacy_turn), ('delta', _delta_turn)):
+            start = time.process_time()
+            sent = 0
+            for _ in range(turns):
+                sent = run(history, steps)
+            cpu_ms = (time.process_time() - start) * 1000 / turns
+            print(f"{size:>8} {label:>7} {sent:>12} {cpu_ms:>12.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[50, 200, 1000])
+    parser.add_argument('--steps', type=int, default=8, help='values chunks per turn')
+    parser.add_argument('--turns', type=int, default=5)
+    args = parser.parse_args()
+    main(args.sizes, args.steps, args.turns)
@@ -0,0 +1,124 @@
+"""
+Benchmark: next-element placement on large canvases
+
+Builds synthetic canvases the way generation fills them (rows of media
+elements placed by the placement function, plus text noise) and times
+one placement with:
+
+- legacy:  the previous O(n²) row grouping scan over all elements
+- rebuild: a PlacementIndex built from the element list (no cache)
+- cached:  the per-canvas index, updated incrementally with the new element
+
+The legacy scan is skipped above --legacy-max elements. Positions from all
+three are checked to agree.
+
+Run from the server directory:
+    python -m benchmarks.bench_placement --sizes 100 1000 10000 50000
+"""
+
+import argparse
+import random
+import time
+from typing import Any, Dict, List, Tuple
+from utils.canvas import PlacementIndex
+
+
+def _legacy_position(canvas_data, max_num_per_row=4, spacing=20) -> Tuple[float, float]:
+    elements = canvas_data.get("elements", [])
+    media_elements = [
+        e for e in elements
+        if e.get("type") in ["image", "embeddable", "video"] and not e.get("isDeleted")
+    ]
+    if not media_elements:
+        return 0, 0
+    media_elements.sort(key=lambda e: (e.get("y", 0), e.get("x", 0)))
+    rows: List[List[Dict[str, Any]]] = []
+    for element in media_elements:
+        y, height = element.get("y", 0), element.get("height", 0)
+        placed = False
+        for row in rows:
+            if any(max(y, r.get("y", 0)) < min(y + height, r.get("y", 0) + r.get("height", 0)) for r in row):
+                row.append(element)
+                placed = True
+                break
+        if not placed:
+            rows.append([element])
+    rows.sort(key=lambda row: sum(e.get("y", 0) for e in row) / len(row))
+    last_row = rows[-1]
+    last_row.sort(key=lambda e: e.get("x", 0))
+    if len(last_row) < max_num_per_row:
+        rightmost_element = last_row[-1]
+        return (rightmost_element.get("x", 0) + rightmost_element.get("width", 0) + spacing,
+                min(e.get("y", 0) for e in last_row))
+    return 0, max(e.get("y", 0) + e.get("height", 0) for e in last_row) + spacing
+
+
+def _build_canvas(size: int, seed: int = 0) -> Tuple[List[Dict[str, Any]], PlacementIndex]:
+    rng = random.Random(seed)
+    index = PlacementIndex()
+    elements: List[Dict[str, Any]] = []
+    for i in range(size):
+        if i % 10 == 9:
+            # Non-media elements are ignored by placement
+            elements.append({"id": f"t{i}", "type": "text", "x": rng.randint(0, 4000), "y": rng.randint(0, 4000)})
+            continue
+        x, y = index.next_position()
+        element = {
+            "id": f"e{i}",
+            "type": rng.choice(["image", "image", "video"]),
+            "x": x,
+            "y": y,
+            "width": rng.choice([512, 768, 1024]),
+            "height": rng.choice([512, 768, 1024]),
+            "isDeleted": False,
+        }
+        elements.append(element)
+        index.add(element)
+    return elements, index
+
+
+def _time(fn, repeat: int) -> Tuple[float, Any]:
+    result = None
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) * 1000 / repeat, result
+
+
+def main(sizes: List[int], legacy_max: int, repeat: int):
+    print(f"{'elements':>9} {'legacy ms':>10} {'rebuild ms':>11} {'cached ms':>10}")
+    for size in sizes:
+        elements, index = _build_canvas(size)
+        canvas_data = {"elements": elements}
+
+        legacy_ms, legacy_pos = None, None
+        if size <= legacy_max:
+            legacy_ms, legacy_pos = _time(lambda: _legacy_position(canvas_data), 1)
+        rebuild_ms, rebuild_pos = _time(lambda: PlacementIndex(elements).next_position(), max(1, repeat // 10))
+
+        # One generation step against the cached index: place, then record the element
+        counter = iter(range(repeat))
+
+        def cached_step():
+            x, y = index.next_position()
+            index.add({"id": f"new{next(counter)}", "type": "image", "x": x, "y": y, "width": 512, "height": 512})
+            return x, y
+
+        cached_pos = index.next_position()
+        cached_ms, _ = _time(cached_step, repeat)
+
+        assert rebuild_pos == cached_pos, (rebuild_pos, cached_pos)
+        if legacy_pos is not None:
+            assert legacy_pos == cached_pos, (legacy_pos, cached_pos)
+
+        legacy_col = f"{legacy_ms:>10.3f}" if legacy_ms is not None else f"{'skipped':>10}"
+        print(f"{size:>9} {legacy_col} {rebuild_ms:>11.3f} {cached_ms:>10.4f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 5000, 10000, 50000])
+    parser.add_argument('--legacy-max', type=int, default=2000, help='skip the legacy scan above this size')
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+    main(args.sizes, args.legacy_max, args.repeat)
@@ -0,0 +1,131 @@
+"""
+Benchmark: agent swarm setup per chat turn, rebuilt vs cached
+
+langgraph_multi_agent used to build the text model, both react agents and
+the swarm, then compile it, on every turn. With swarm_cache only the first
+turn for a given model / tools / system prompt does that. This measures:
+
+- startup: the first turn of a fresh process (includes the one-off cost of
+  langgraph compiling its first graph)
+- setup per turn: the previous per-turn path (model lookup + agents +
+  swarm + compile) against a cache lookup
+- whole turn: agents + swarm + compile plus one astream through the graph
+  with an instant fake model (so without the chat model lookup), i.e.
+  the overhead a user sees before the first token
+
+All registered TOOL_MAPPING tools are bound, as with every provider
+configured. Nothing is sent over the network.
+
+Run from the server directory:
+    python -m benchmarks.bench_swarm_cache
+    python -m benchmarks.bench_swarm_cache --turns 50
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import statistics
+import time
+from typing import Any, Callable, Dict, List, Optional
+from langchain_core.language_models.fake_chat_models import FakeMessagesListChatModel
+from langchain_core.messages import AIMessage
+from langgraph_swarm import create_swarm  # type: ignore
+from services.langgraph_service.agent_manager import AgentManager
+from services.langgraph_service.agent_service import _build_swarm
+from services.langgraph_service.swarm_cache import SwarmCache, swarm_key
+from services.config_service import config_service
+from services.tool_service import TOOL_MAPPING, tool_service
+
+TEXT_MODEL = {'provider': 'openai', 'model': 'gpt-4o', 'url': 'https://api.openai.com/v1', 'type': 'text'}
+
+
+class _InstantModel(FakeMessagesListChatModel):
+    """Answers immediately, enough to drive the graph without a provider"""
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> Any:
+        return self
+
+
+def _tool_list() -> List[Dict[str, Any]]:
+    tools = []
+    for tool_id, tool_info in TOOL_MAPPING.items():
+        tool_service.register_tool(tool_id, tool_info)
+        tools.append({'id': tool_id, 'provider': tool_info['provider'], 'type': tool_info.get('type'),
+                      'display_name': tool_info.get('display_name')})
+    return tools
+
+
+def _build_with(model: Any, tool_list: List[Dict[str, Any]]) -> Any:
+    agents = AgentManager.create_agents(model, tool_list, '')
+    return create_swarm(agents=agents, default_active_agent=agents[0].name).compile()  # type: ignore
+
+
+def _time_ms(fn: Callable[[], Any]) -> float:
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000
+
+
+async def _turn(compiled: Any, active_agent: Optional[str]) -> str:
+    swarm_input: Dict[str, Any] = {'messages': [{'role': 'user', 'content': 'hi'}]}
+    if active_agent:
+        swarm_input['active_agent'] = active_agent
+    last: Dict[str, Any] = {}
+    async for chunk in compiled.astream(swarm_input, stream_mode='values'):
+        last = chunk
+    return last['messages'][-1].name
+
+
+def _summary(samples: List[float]) -> str:
+    return f"median {statistics.median(samples):7.2f} ms  p95 {sorted(samples)[int(len(samples) * 0.95) - 1]:7.2f} ms"
+
+
+async def main(args: argparse.Namespace) -> None:
+    tool_list = _tool_list()
+    # ChatOpenAI only needs a key to be constructed
+    config_service.app_config.setdefault('openai', {})['api_key'] = 'sk-bench'
+    key = swarm_key(TEXT_MODEL, 'sk-bench', tool_list, '')  # type: ignore
+    cache = SwarmCache()
+    # create_agents prints the tool lists on every build
+    with contextlib.redirect_stdout(io.StringIO()):
+        startup = _time_ms(lambda: cache.get_or_build(key, lambda: _build_swarm(TEXT_MODEL, tool_list, '')))  # type: ignore
+    print(f"{len(tool_list)} tools bound, {args.turns} turns")
+    print(f"startup (first turn, cold process): {startup:8.2f} ms")
+
+    rebuilt: List[float] = []
+    cached: List[float] = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(args.turns):
+            rebuilt.append(_time_ms(lambda: _build_swarm(TEXT_MODEL, tool_list, '')))  # type: ignore
+            cached.append(_time_ms(lambda: cache.get_or_build(key, lambda: _build_swarm(TEXT_MODEL, tool_list, ''))))  # type: ignore
+    print(f"setup per turn, rebuilt: {_summary(rebuilt)}")
+    print(f"setup per turn, cached:  {_summary(cached)}")
+
+    # Whole turn with an instant model: setup + graph run
+    def model() -> Any:
+        return _InstantModel(responses=[AIMessage(content='done')] * (args.turns * 4))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        shared = _build_with(model(), tool_list)
+        rebuilt_turns: List[float] = []
+        cached_turns: List[float] = []
+        for _ in range(args.turns):
+            start = time.perf_counter()
+            await _turn(_build_with(model(), tool_list), None)
+            rebuilt_turns.append((time.perf_counter() - start) * 1000)
+            start = time.perf_counter()
+            await _turn(shared, None)
+            cached_turns.append((time.perf_counter() - start) * 1000)
+        # The active agent now comes in with the input instead of the swarm default
+        routed = await _turn(shared, 'image_video_creator')
+    print(f"whole turn, rebuilt:     {_summary(rebuilt_turns)}")
+    print(f"whole turn, cached:      {_summary(cached_turns)}")
+    print(f"turn started with active_agent=image_video_creator answered as: {routed}")
+    print(f"cache stats: {cache.get_stats()}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--turns', type=int, default=20, help='turns measured per variant')
+    asyncio.run(main(parser.parse_args()))
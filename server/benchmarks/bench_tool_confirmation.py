@@ -0,0 +1,98 @@
+"""
+Benchmark: waiting tool confirmations, 100 ms polling vs futures
+
+N tool calls wait for the user's confirmation for a while, then are all
+confirmed. For both designs this reports the CPU time burnt while waiting
+(the event loop wakes up for every sleeping poller) and the latency from
+confirm_tool to the tool resuming.
+
+- polling:  the previous design, one asyncio.sleep(0.1) loop per request
+- futures:  ToolConfirmationManager, memory backend
+- database: ToolConfirmationManager, database backend; the confirmations are
+            written straight into the tool_confirmations table, as another
+            server process would, and picked up by the shared check
+
+Run from the server directory:
+    python -m benchmarks.bench_tool_confirmation
+    python -m benchmarks.bench_tool_confirmation --waiters 500 --wait 10
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from services.db_adapter import db_adapter
+from services.tool_confirmation_manager import ToolConfirmationManager
+
+
+class _PollingConfirmations:
+    """The previous design: every waiting request polls its entry every 100 ms"""
+
+    def __init__(self):
+        self.confirmed: Dict[str, Optional[bool]] = {}
+
+    async def request_confirmation(self, tool_call_id: str, *args: Any) -> bool:
+        self.confirmed[tool_call_id] = None
+        while self.confirmed[tool_call_id] is None:
+            await asyncio.sleep(0.1)
+        return bool(self.confirmed[tool_call_id])
+
+    async def confirm_tool(self, tool_call_id: str) -> bool:
+        self.confirmed[tool_call_id] = True
+        return True
+
+
+async def _run(label: str, manager: Any, confirm: Callable[[str], Awaitable[Any]], waiters: int, wait: float) -> None:
+    resumed: Dict[str, float] = {}
+
+    async def tool(tool_call_id: str) -> None:
+        await manager.request_confirmation(tool_call_id, 'bench', 'generate_video', {})
+        resumed[tool_call_id] = time.perf_counter()
+
+    ids = [f'{label}_{i}' for i in range(waiters)]
+    tasks = [asyncio.create_task(tool(tool_call_id)) for tool_call_id in ids]
+    # Let every request register before measuring
+    await asyncio.sleep(1)
+
+    cpu_start = time.process_time()
+    await asyncio.sleep(wait)
+    cpu_waiting = time.process_time() - cpu_start
+
+    confirmed_at: Dict[str, float] = {}
+    for tool_call_id in ids:
+        confirmed_at[tool_call_id] = time.perf_counter()
+        await confirm(tool_call_id)
+    await asyncio.gather(*tasks)
+
+    latencies: List[float] = [(resumed[i] - confirmed_at[i]) * 1000 for i in ids]
+    print(f"{label:>9}: CPU while waiting {cpu_waiting * 1000:8.1f} ms   "
+          f"confirm -> resume median {statistics.median(latencies):7.2f} ms  max {max(latencies):7.2f} ms")
+
+
+async def main(args: argparse.Namespace) -> None:
+    print(f"{args.waiters} tool calls waiting {args.wait:.0f} s for confirmation")
+    polling = _PollingConfirmations()
+    await _run('polling', polling, polling.confirm_tool, args.waiters, args.wait)
+
+    futures = ToolConfirmationManager(backend='memory')
+    await _run('futures', futures, futures.confirm_tool, args.waiters, args.wait)
+    await futures.stop()
+
+    shared = ToolConfirmationManager(backend='database')
+    try:
+        async def confirm_elsewhere(tool_call_id: str) -> None:
+            await db_adapter.resolve_tool_confirmation(tool_call_id, True, time.time())
+
+        await _run('database', shared, confirm_elsewhere, args.waiters, args.wait)
+        print(f"database checks: {shared.get_stats()['polls']} (every {shared.poll_interval} s while waiting)")
+    finally:
+        await shared.stop()
+        await db_adapter.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--waiters', type=int, default=200, help='tool calls waiting at once')
+    parser.add_argument('--wait', type=float, default=5, help='seconds before they are confirmed')
+    asyncio.run(main(parser.parse_args()))
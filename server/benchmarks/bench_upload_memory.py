@@ -0,0 +1,155 @@
+"""
+Benchmark: server memory while receiving large uploads
+
+Starts the server's upload endpoint in a separate uvicorn process, with
+Supabase Storage pointed at a local stand-in that drains request bodies
+(simple upload and the resumable TUS endpoint), then posts 5/20/50 MB images
+from disk and reads the server's peak RSS (VmHWM, reset before each upload).
+
+With the upload spooled to disk and streamed to storage the peak should stay
+flat whatever the file size; holding the file in memory shows up as a peak
+growing with the upload.
+
+Run from the server directory:
+    python -m benchmarks.bench_upload_memory
+    python -m benchmarks.bench_upload_memory --sizes 5,20,50,200
+"""
+
+import argparse
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Optional
+import httpx
+
+BENCH_STORAGE_KEY = 'bench-storage'
+
+
+def _make_app():
+    """Upload router plus a Supabase Storage stand-in, served by the benchmark's child process"""
+    from fastapi import FastAPI, Request, Response
+    from routers import image_router
+    from services.supabase_storage_service import supabase_storage
+
+    app = FastAPI()
+    app.include_router(image_router.router)
+    uploads = {}
+
+    async def drain(request: Request) -> int:
+        received = 0
+        async for chunk in request.stream():
+            received += len(chunk)
+        return received
+
+    @app.post('/storage/v1/object/{bucket}/{path:path}')
+    async def simple_upload(bucket: str, path: str, request: Request):
+        await drain(request)
+        return {'Key': f'{bucket}/{path}'}
+
+    @app.post('/storage/v1/upload/resumable')
+    async def create_upload(request: Request):
+        upload_id = str(len(uploads))
+        uploads[upload_id] = 0
+        base_url = str(request.base_url).rstrip('/')
+        return Response(status_code=201, headers={'Location': f'{base_url}/storage/v1/upload/resumable/{upload_id}'})
+
+    @app.patch('/storage/v1/upload/resumable/{upload_id}')
+    async def upload_chunk(upload_id: str, request: Request):
+        uploads[upload_id] += await drain(request)
+        return Response(status_code=204, headers={'Upload-Offset': str(uploads[upload_id])})
+
+    @app.get('/bench/rss')
+    async def rss(reset: bool = False):
+        with open('/proc/self/status') as f:
+            fields = dict(line.split(':', 1) for line in f)
+        if reset:
+            # Resets VmHWM to the current RSS
+            with open('/proc/self/clear_refs', 'w') as f:
+                f.write('5')
+        return {'peak_kb': int(fields['VmHWM'].split()[0]), 'rss_kb': int(fields['VmRSS'].split()[0])}
+
+    @app.on_event('startup')
+    async def startup():
+        supabase_storage.initialize(os.environ['BENCH_STORAGE_URL'], BENCH_STORAGE_KEY)
+
+    return app
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _make_image(path: str, target_mb: float) -> None:
+    from PIL import Image
+
+    # Uncompressed PNG of noise: the file size is the pixel count
+    side = int((target_mb * 1024 * 1024 / 3) ** 0.5)
+    Image.effect_noise((side, side), 64).convert('RGB').save(path, format='PNG', compress_level=0)
+
+
+def _wait_ready(base_url: str, process: subprocess.Popen) -> None:
+    for _ in range(300):
+        if process.poll() is not None:
+            raise RuntimeError('server exited during startup')
+        try:
+            httpx.get(f'{base_url}/bench/rss', timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError('server did not start')
+
+
+def main(args: argparse.Namespace) -> None:
+    workdir = tempfile.mkdtemp(prefix='bench_upload_memory_')
+    port = _free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    env = {**os.environ, 'USER_DATA_DIR': os.path.join(workdir, 'user_data'), 'BENCH_STORAGE_URL': base_url}
+    process: Optional[subprocess.Popen] = None
+    try:
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'benchmarks.bench_upload_memory:_make_app', '--factory',
+             '--port', str(port), '--log-level', 'warning'],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        _wait_ready(base_url, process)
+        with httpx.Client(base_url=base_url, timeout=600.0) as client:
+            # Warm up imports and connections with a small upload
+            small = os.path.join(workdir, 'warmup.png')
+            _make_image(small, 0.5)
+            with open(small, 'rb') as f:
+                client.post('/api/upload_image', params={'max_size_mb': 1000}, files={'file': ('warmup.png', f, 'image/png')})
+            baseline = client.get('/bench/rss').json()['rss_kb']
+            print(f"Server RSS after warmup: {baseline / 1024:.0f} MB")
+            print(f"{'upload':>9} {'mode':>10} {'peak RSS MB':>12} {'over baseline MB':>17} {'wall s':>7}")
+            for size in (float(s) for s in args.sizes.split(',')):
+                path = os.path.join(workdir, f'upload_{size:g}.png')
+                _make_image(path, size)
+                actual_mb = os.path.getsize(path) / 1024 / 1024
+                for mode, max_size_mb in (('store', 1000.0), ('compress', args.limit)):
+                    client.get('/bench/rss', params={'reset': True})
+                    start = time.perf_counter()
+                    with open(path, 'rb') as f:
+                        response = client.post('/api/upload_image', params={'max_size_mb': max_size_mb},
+                                               files={'file': (os.path.basename(path), f, 'image/png')})
+                    response.raise_for_status()
+                    elapsed = time.perf_counter() - start
+                    peak = client.get('/bench/rss').json()['peak_kb']
+                    print(f"{actual_mb:>7.1f}MB {mode:>10} {peak / 1024:>12.0f} {(peak - baseline) / 1024:>17.0f} {elapsed:>7.2f}")
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='5,20,50', help='upload sizes in MB')
+    parser.add_argument('--limit', type=float, default=3.0, help='max_size_mb for the compressed uploads')
+    main(parser.parse_args())
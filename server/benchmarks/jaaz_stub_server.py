@@ -0,0 +1,129 @@
+"""
+Stub Jaaz cloud API for exercising task polling without the real service
+
+Implements the endpoints JaazService uses. Every created task reports
+`processing` until its duration has elapsed, then `succeeded` with a
+result_url (or `failed` when the payload has "fail": true). The duration is
+taken from the payload's "stub_duration" (seconds) or drawn uniformly from
+--min-duration..--max-duration.
+
+    POST /api/v1/image/magic                 -> {"task_id": ...}
+    POST /api/v1/image/midjourney/generation -> {"task_id": ...}
+    POST /api/v1/video/sunra/generations     -> {"task_id": ...}
+    POST /api/v1/video/seedance/generation   -> {"task_id": ...}
+    GET  /api/v1/task/{task_id}
+    POST /api/v1/task/batch                  (disable with --no-batch)
+
+Request counts are available at GET /stub/stats.
+
+Run standalone from the server directory and point config.toml's jaaz.url at it:
+    python -m benchmarks.jaaz_stub_server --port 8765
+"""
+
+import argparse
+import random
+import time
+from typing import Any, Dict, Optional
+from aiohttp import web
+from nanoid import generate
+
+
+class StubJaazServer:
+    def __init__(self, min_duration: float = 1.0, max_duration: float = 10.0, batch: bool = True):
+        self.min_duration = min_duration
+        self.max_duration = max_duration
+        self.batch = batch
+        self.tasks: Dict[str, Dict[str, Any]] = {}
+        self.stats = {'created': 0, 'status_requests': 0, 'batch_requests': 0}
+        self._runner: Optional[web.AppRunner] = None
+
+    def create_task(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        duration = payload.get('stub_duration')
+        if duration is None:
+            duration = random.uniform(self.min_duration, self.max_duration)
+        task_id = generate(size=12)
+        task = {
+            'id': task_id,
+            'finish_at': time.monotonic() + float(duration),
+            'fail': bool(payload.get('fail')),
+        }
+        self.tasks[task_id] = task
+        self.stats['created'] += 1
+        return task
+
+    def task_view(self, task_id: str) -> Optional[Dict[str, Any]]:
+        task = self.tasks.get(task_id)
+        if task is None:
+            return None
+        if time.monotonic() < task['finish_at']:
+            return {'id': task_id, 'status': 'processing'}
+        if task['fail']:
+            return {'id': task_id, 'status': 'failed', 'error': 'stub failure'}
+        return {
+            'id': task_id,
+            'status': 'succeeded',
+            'result_url': f'https://stub.jaaz.local/results/{task_id}.png',
+            'result': {'image_url': f'https://stub.jaaz.local/results/{task_id}.png'},
+        }
+
+    def finished_at(self, task_id: str) -> float:
+        return self.tasks[task_id]['finish_at']
+
+    async def _create(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        return web.json_response({'task_id': self.create_task(payload)['id']})
+
+    async def _get_task(self, request: web.Request) -> web.Response:
+        self.stats['status_requests'] += 1
+        task = self.task_view(request.match_info['task_id'])
+        if task is None:
+            return web.json_response({'success': True, 'data': {'found': False}})
+        return web.json_response({'success': True, 'data': {'found': True, 'task': task}})
+
+    async def _batch(self, request: web.Request) -> web.Response:
+        if not self.batch:
+            return web.Response(status=404)
+        self.stats['batch_requests'] += 1
+        payload = await request.json()
+        tasks = [self.task_view(task_id) for task_id in payload.get('task_ids', [])]
+        return web.json_response({'success': True, 'data': {'tasks': [t for t in tasks if t]}})
+
+    async def _stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats)
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/api/v1/image/magic', self._create)
+        app.router.add_post('/api/v1/image/midjourney/generation', self._create)
+        app.router.add_post('/api/v1/video/sunra/generations', self._create)
+        app.router.add_post('/api/v1/video/seedance/generation', self._create)
+        app.router.add_get('/api/v1/task/{task_id}', self._get_task)
+        app.router.add_post('/api/v1/task/batch', self._batch)
+        app.router.add_get('/stub/stats', self._stats)
+        return app
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """Start serving in the running loop, returns the API base url"""
+        self._runner = web.AppRunner(self.app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        bound_port = site._server.sockets[0].getsockname()[1]  # type: ignore
+        return f'http://{host}:{bound_port}/api/v1'
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--min-duration', type=float, default=1.0)
+    parser.add_argument('--max-duration', type=float, default=10.0)
+    parser.add_argument('--no-batch', action='store_true', help='answer 404 on /task/batch')
+    args = parser.parse_args()
+    stub = StubJaazServer(args.min_duration, args.max_duration, batch=not args.no_batch)
+    web.run_app(stub.app(), host=args.host, port=args.port)
@@ -12,6 +12,7 @@ from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi import FastAPI
 import argparse
+import multiprocessing
 from contextlib import asynccontextmanager
 from starlette.types import Scope
 from starlette.responses import Response
@@ -29,6 +30,11 @@ print('Importing db_adapter')
 from services.db_adapter import db_adapter
 print('Importing supabase_storage')
 from services.supabase_storage_service import supabase_storage
+from services.upload_queue_service import upload_queue
+from services.tool_confirmation_manager import tool_confirmation_manager
+from services.langgraph_service.model_registry import chat_models
+from utils.http_client import HttpClient
+from utils.image_worker import image_worker
 
 async def initialize():
     print('Initializing config_service')
@@ -62,6 +68,7 @@ async def initialize():
                     await supabase_storage.create_bucket_if_not_exists()
                 else:
                     print('📦 Using existing Storage bucket (Anon key cannot create buckets)')
+                await upload_queue.start()
             else:
                 print('⚠️ SUPABASE_URL or SUPABASE keys not found, Storage disabled')
         else:
@@ -83,8 +90,15 @@ async def lifespan(app: FastAPI):
     # TODO: Check if there will be racing conditions when user send chat request but tools and models are not initialized yet.
     await initialize()
     await tool_service.initialize()
+    await tool_confirmation_manager.start()
     yield
     # onshutdown
+    await tool_confirmation_manager.stop()
+    await upload_queue.stop()
+    await db_adapter.close()
+    await chat_models.close()
+    await HttpClient.close_all()
+    image_worker.close()
 
 print('Creating FastAPI app')
 app = FastAPI(lifespan=lifespan)
@@ -131,6 +145,9 @@ print('Creating socketio app')
 socket_app = socketio.ASGIApp(sio, other_asgi_app=app, socketio_path='/socket.io')
 
 if __name__ == "__main__":
+    # image worker processes of a frozen (PyInstaller) build start through here
+    multiprocessing.freeze_support()
+
     # bypass localhost request for proxy, fix ollama proxy issue
     _bypass = {"127.0.0.1", "localhost", "::1"}
     current = set(os.environ.get("no_proxy", "").split(",")) | set(
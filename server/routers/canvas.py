@@ -2,16 +2,30 @@ from fastapi import APIRouter, Request
 #from routers.agent import chat
 from services.chat_service import handle_chat
 from services.db_adapter import db_adapter
+from services.canvas_mutation_service import canvas_mutations
+from services.image_variant_service import store_inline_thumbnail, thumbnail_url
+from common import DEFAULT_PORT
 import asyncio
 import json
-import httpx
+from utils.http_client import HttpClient
 import os
 
 router = APIRouter(prefix="/api/canvas")
 
+
+def _backend_url() -> str:
+    if os.environ.get('CLOUD_DEPLOYMENT', 'false').lower() == 'true':
+        return 'https://jaaz-backend-337074826438.asia-northeast1.run.app'
+    return os.environ.get('BACKEND_URL', f'http://localhost:{DEFAULT_PORT}')
+
+
 @router.get("/list")
 async def list_canvases():
-    return await db_adapter.list_canvases()
+    canvases = await db_adapter.list_canvases()
+    # Thumbnail-sized variants instead of the full images
+    for canvas in canvases:
+        canvas['thumbnail'] = thumbnail_url(canvas.get('thumbnail'))
+    return canvases
 
 @router.post("/create")
 async def create_canvas(request: Request):
@@ -31,7 +45,11 @@ async def get_canvas(id: str):
 async def save_canvas(id: str, request: Request):
     payload = await request.json()
     data_str = json.dumps(payload['data'])
-    await db_adapter.save_canvas_data(id, data_str, payload['thumbnail'])
+    # Pasted images arrive as data URLs, keep them out of the canvas row
+    thumbnail = await store_inline_thumbnail(payload['thumbnail'], _backend_url())
+    # Serialized with generated media being added to the same canvas
+    async with canvas_mutations.lock_canvas(id):
+        await db_adapter.save_canvas_data(id, data_str, thumbnail)
     return {"id": id }
 
 @router.post("/{id}/rename")
@@ -64,7 +82,7 @@ async def cleanup_canvas_images(id: str):
     valid_elements = []
     
     # 檢查每個圖片元素的有效性
-    async with httpx.AsyncClient() as client:
+    async with HttpClient.create() as client:
         for element in data['elements']:
             if element.get('type') == 'image':
                 file_id = element.get('fileId')
@@ -79,7 +97,7 @@ async def cleanup_canvas_images(id: str):
                             backend_url = f'http://localhost:{DEFAULT_PORT}'
                         
                         file_url = f"{backend_url}/api/file/{file_id}"
-                        response = await client.head(file_url, timeout=3.0)
+                        response = await client.head(file_url, timeout=3.0, follow_redirects=False)
                         
                         if response.status_code == 200:
                             valid_elements.append(element)
@@ -97,27 +115,26 @@ async def cleanup_canvas_images(id: str):
                 # 非圖片元素，保留
                 valid_elements.append(element)
     
-    # 更新畫布數據
-    data['elements'] = valid_elements
-    
-    # 清理對應的 files 數據
-    if 'files' in data:
-        valid_file_ids = set()
-        for element in valid_elements:
-            if element.get('type') == 'image' and element.get('fileId'):
-                valid_file_ids.add(element['fileId'])
-        
-        # 只保留有效的文件
-        data['files'] = {
-            file_id: file_data 
-            for file_id, file_data in data['files'].items() 
-            if file_id in valid_file_ids
-        }
-    
-    # 保存更新後的畫布數據
-    data_str = json.dumps(data)
-    await db_adapter.save_canvas_data(id, data_str, canvas_data.get('thumbnail'))
-    
+    # 圖片檢查很慢，在鎖外進行；期間可能有新生成的圖片落到畫布上，
+    # 所以在鎖內重新讀取畫布，只刪除檢查出的無效元素和它們的文件
+    invalid_ids = {elem.get('id') for elem in invalid_elements if elem.get('id')}
+    invalid_file_ids = {elem.get('fileId') for elem in invalid_elements if elem.get('fileId')}
+    if invalid_elements:
+        async with canvas_mutations.lock_canvas(id):
+            latest = await db_adapter.get_canvas_data(id)
+            data = (latest or {}).get('data')
+            if isinstance(data, dict) and 'elements' in data:
+                data['elements'] = [elem for elem in data['elements'] if elem.get('id') not in invalid_ids]
+                # 仍被其他元素引用的文件保留
+                still_used = {elem.get('fileId') for elem in data['elements'] if elem.get('fileId')}
+                if 'files' in data:
+                    data['files'] = {
+                        file_id: file_data
+                        for file_id, file_data in data['files'].items()
+                        if file_id not in invalid_file_ids or file_id in still_used
+                    }
+                await db_adapter.save_canvas_data(id, json.dumps(data), canvas_data.get('thumbnail'))
+
     removed_count = len(invalid_elements)
     
     print(f"🧹 Canvas cleanup complete: removed {removed_count} invalid elements")
@@ -2,21 +2,36 @@ from fastapi.responses import FileResponse
 from fastapi.concurrency import run_in_threadpool
 from common import DEFAULT_PORT
 from tools.utils.image_canvas_utils import generate_file_id
-from services.config_service import FILES_DIR
+from services.config_service import FILES_DIR, IMAGE_FORMATS
 from services.supabase_storage_service import supabase_storage
+from services.file_index_service import file_index_service
+from services.file_store import file_store
+from services.image_variant_service import VARIANT_FORMATS, VARIANT_WIDTHS, image_variants
 
 from PIL import Image
-from io import BytesIO
 import os
-from fastapi import APIRouter, HTTPException, UploadFile, File
+from fastapi import APIRouter, HTTPException, Request, Response, UploadFile, File
+from typing import Optional
 import httpx
 import aiofiles
 from mimetypes import guess_type
 from utils.http_client import HttpClient
+from utils.image_compress import compress_image
+from utils.image_worker import image_worker
 
 router = APIRouter(prefix="/api")
 os.makedirs(FILES_DIR, exist_ok=True)
 
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def _convert_upload(source_path: str, file_path: str, save_format: str) -> None:
+    """Re-encode an upload whose content doesn't match its extension"""
+    with Image.open(source_path) as img:
+        if save_format == 'JPEG':
+            img = img.convert('RGB')
+        img.save(file_path, format=save_format)
+
 # 上传图片接口，支持表单提交
 @router.post("/upload_image")
 async def upload_image(file: UploadFile = File(...), max_size_mb: float = 3.0):
@@ -25,47 +40,39 @@ async def upload_image(file: UploadFile = File(...), max_size_mb: float = 3.0):
     file_id = generate_file_id()
     filename = file.filename or ''
 
-    # Read the file content
+    # Spool the upload to disk in chunks, never holding the whole file in memory
+    spool_path = os.path.join(FILES_DIR, f'{file_id}.upload')
     try:
-        content = await file.read()
+        async with aiofiles.open(spool_path, 'wb') as spool:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                await spool.write(chunk)
     except Exception as e:
+        if os.path.exists(spool_path):
+            os.remove(spool_path)
         raise HTTPException(status_code=400, detail=f"Error reading file: {e}")
-    original_size_mb = len(content) / (1024 * 1024)  # Convert to MB
+    original_size_mb = os.path.getsize(spool_path) / (1024 * 1024)  # Convert to MB
+
+    try:
+        # Only the header is read for the format and dimensions
+        with Image.open(spool_path) as img:
+            width, height = img.size
+            original_format = img.format
 
-    # Open the image from bytes to get its dimensions
-    with Image.open(BytesIO(content)) as img:
-        width, height = img.size
-        
         # Check if compression is needed
         if original_size_mb > max_size_mb:
             print(f'🦄 Image size ({original_size_mb:.2f}MB) exceeds limit ({max_size_mb}MB), compressing...')
-            
-            # Convert to RGB if necessary (for JPEG compression)
-            if img.mode in ('RGBA', 'LA', 'P'):
-                # Create a white background for transparent images
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                img = background
-            elif img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # Compress the image
-            compressed_content = compress_image(img, max_size_mb)
-            
-            # Save compressed image using Image.save
+
+            # Compress the image in the worker pool, written as JPEG
             extension = 'jpg'  # Force JPEG for compressed images
             file_path = os.path.join(FILES_DIR, f'{file_id}.{extension}')
-            
-            # Create new image from compressed content and save
-            with Image.open(BytesIO(compressed_content)) as compressed_img:
-                width, height = compressed_img.size
-                await run_in_threadpool(compressed_img.save, file_path, format='JPEG', quality=95, optimize=True)
-                # compressed_img.save(file_path, format='JPEG', quality=95, optimize=True)
-            
-            final_size_mb = len(compressed_content) / (1024 * 1024)
-            print(f'🦄 Compressed from {original_size_mb:.2f}MB to {final_size_mb:.2f}MB')
+            stats = await image_worker.run(
+                'compress_image', compress_image, spool_path, file_path, int(max_size_mb * 1024 * 1024)
+            )
+            width, height = stats['width'], stats['height']
+
+            final_size_mb = stats['size'] / (1024 * 1024)
+            print(f'🦄 Compressed from {original_size_mb:.2f}MB to {final_size_mb:.2f}MB '
+                  f'(quality {stats["quality"]}, scale {stats["scale"]:.2f}, {stats["encodes"]} full encodes)')
         else:
             # Determine the file extension from original file
             mime_type, _ = guess_type(filename)
@@ -76,17 +83,26 @@ async def upload_image(file: UploadFile = File(...), max_size_mb: float = 3.0):
                     extension = 'jpg'
             else:
                 extension = 'jpg'  # Default to jpg for unknown types
-            
-            # Save original image using Image.save
+
             file_path = os.path.join(FILES_DIR, f'{file_id}.{extension}')
-            
+
             # Determine save format based on extension
             save_format = 'JPEG' if extension.lower() in ['jpg', 'jpeg'] else extension.upper()
-            if save_format == 'JPEG':
-                img = img.convert('RGB')
-            
-            # img.save(file_path, format=save_format)
-            await run_in_threadpool(img.save, file_path, format=save_format)
+            if original_format == save_format:
+                # Already in the right format: the spooled upload becomes the file
+                os.replace(spool_path, file_path)
+            else:
+                await run_in_threadpool(_convert_upload, spool_path, file_path, save_format)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error processing image: {e}")
+    finally:
+        if os.path.exists(spool_path):
+            os.remove(spool_path)
+
+    # 相同內容的文件只存一份
+    await file_store.adopt_path(file_path)
 
     # 確定後端 URL（雲端部署或本地開發）
     is_cloud_deployment = os.environ.get('CLOUD_DEPLOYMENT', 'false').lower() == 'true'
@@ -114,9 +130,9 @@ async def upload_image(file: UploadFile = File(...), max_size_mb: float = 3.0):
             
             print(f"✅ Image uploaded to Supabase Storage: {public_url}")
             
-            # Optionally remove local file to save space
+            # Optionally remove local file to save space (and its file store alias and blob)
             try:
-                os.remove(file_path)
+                await file_store.remove(f'{file_id}.{extension}')
                 print(f"🗑️ Removed local file: {file_path}")
             except Exception as e:
                 print(f"⚠️ Could not remove local file: {e}")
@@ -137,125 +153,72 @@ async def upload_image(file: UploadFile = File(...), max_size_mb: float = 3.0):
     }
 
 
-def compress_image(img: Image.Image, max_size_mb: float) -> bytes:
-    """
-    Compress an image to be under the specified size limit.
-    """
-    # Start with high quality
-    quality = 95
-    
-    while quality > 10:
-        # Save to bytes buffer
-        buffer = BytesIO()
-        img.save(buffer, format='JPEG', quality=quality, optimize=True)
-        
-        # Check size
-        size_mb = len(buffer.getvalue()) / (1024 * 1024)
-        
-        if size_mb <= max_size_mb:
-            return buffer.getvalue()
-        
-        # Reduce quality for next iteration
-        quality -= 10
-    
-    # If still too large, try reducing dimensions
-    original_width, original_height = img.size
-    scale_factor = 0.8
-    
-    while scale_factor > 0.3:
-        new_width = int(original_width * scale_factor)
-        new_height = int(original_height * scale_factor)
-        resized_img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-        
-        # Try with moderate quality
-        buffer = BytesIO()
-        resized_img.save(buffer, format='JPEG', quality=70, optimize=True)
-        
-        size_mb = len(buffer.getvalue()) / (1024 * 1024)
-        
-        if size_mb <= max_size_mb:
-            return buffer.getvalue()
-        
-        scale_factor -= 0.1
-    
-    # Last resort: very low quality
-    buffer = BytesIO()
-    resized_img.save(buffer, format='JPEG', quality=30, optimize=True)
-    return buffer.getvalue()
+async def _storage_url(file_id: str) -> str | None:
+    """Public Supabase Storage URL of a file that is not on local disk"""
+    if not supabase_storage.initialized:
+        return None
+
+    # 從文件索引查找 Supabase Storage 路徑
+    try:
+        storage_path = await file_index_service.lookup(file_id)
+        if storage_path:
+            public_url = supabase_storage.get_public_url(storage_path)
+            print(f"🔗 Indexed at {storage_path}: {public_url}")
+            return public_url
+    except Exception as e:
+        print(f"❌ Error looking up file index: {e}")
+
+    # 未索引的聊天上傳文件：嘗試常見的直接路徑，找到後寫入索引
+    # （canvas 文件請用 `python -m services.file_index_service backfill` 建立索引）
+    try:
+        storage_path = f"uploads/{file_id}"
+        public_url = supabase_storage.get_public_url(storage_path)
+
+        async with HttpClient.create(url=supabase_storage.supabase_url) as client:
+            response = await client.head(public_url, timeout=3.0, follow_redirects=False)
+            if response.status_code == 200:
+                print(f"🔗 Found at {storage_path}: {public_url}")
+                await file_index_service.record(storage_path, file_id)
+                return public_url
+
+    except Exception as e:
+        print(f"❌ Error checking common paths: {e}")
+    return None
 
 
 # 文件下载接口
+# ?w=256&fmt=webp 返回縮小後的版本（磁碟快取，見 services/image_variant_service.py）
 @router.get("/file/{file_id}")
-async def get_file(file_id: str):
+async def get_file(file_id: str, request: Request, w: Optional[int] = None, fmt: Optional[str] = None):
     from fastapi.responses import RedirectResponse
-    
+
     file_path = os.path.join(FILES_DIR, f'{file_id}')
     print('🦄get_file file_path', file_path)
-    
+
+    if w is not None or fmt is not None:
+        if os.path.splitext(file_id)[1].lower() not in IMAGE_FORMATS:
+            raise HTTPException(status_code=400, detail="Resized variants are only available for images")
+        if w is not None and w <= 0:
+            raise HTTPException(status_code=400, detail="w must be a positive width")
+        if fmt is not None and fmt.lower() not in VARIANT_FORMATS:
+            raise HTTPException(status_code=400, detail=f"fmt must be one of {', '.join(VARIANT_FORMATS)}")
+        source_url = None if os.path.exists(file_path) else await _storage_url(file_id)
+        variant = await image_variants.get_variant(file_id, w or VARIANT_WIDTHS[-1], fmt, source_url)
+        if variant is None:
+            raise HTTPException(status_code=404, detail="File not found")
+        if request.headers.get('if-none-match') == variant.etag:
+            return Response(status_code=304, headers=variant.headers())
+        return FileResponse(variant.path, media_type=variant.media_type, headers=variant.headers())
+
     # 首先嘗試從本地文件系統提供文件
     if os.path.exists(file_path):
         return FileResponse(file_path)
-    
-    # 如果本地文件不存在，嘗試從 Supabase Storage 查找
-    if supabase_storage.initialized:
-        try:
-            # 先嘗試常見的直接路徑
-            common_paths = [
-                f"uploads/{file_id}",    # 聊天上傳路徑
-            ]
-            
-            for storage_path in common_paths:
-                public_url = f"{supabase_storage.supabase_url}/storage/v1/object/public/{supabase_storage.bucket_name}/{storage_path}"
-                
-                async with httpx.AsyncClient() as client:
-                    response = await client.head(public_url, timeout=3.0)
-                    if response.status_code == 200:
-                        print(f"🔗 Found at {storage_path}, redirecting to: {public_url}")
-                        return RedirectResponse(url=public_url, status_code=302)
-                        
-        except Exception as e:
-            print(f"❌ Error checking common paths: {e}")
-            
-        # 如果直接路徑沒找到，嘗試通過模式匹配查找 canvas 路徑
-        try:
-            # 我們知道 canvas 文件的格式是: canvas/{canvas_id}/{filename}
-            # 動態獲取所有 canvas ID 來查找文件
-            
-            from services.db_adapter import db_adapter
-            
-            # 獲取所有 canvas ID
-            try:
-                canvases = await db_adapter.list_canvases()
-                canvas_ids = [canvas.get('id') for canvas in canvases if canvas.get('id')]
-                print(f"🔍 Found {len(canvas_ids)} canvas IDs to search")
-            except Exception as e:
-                print(f"⚠️ Could not get canvas IDs from database: {e}")
-                # 回退到硬編碼的已知路徑
-                canvas_ids = [
-                    "Tu9xMOoLtND6s_gZyiMhi",  # 當前用戶的canvas
-                    "qiOuoR0GhB_SUAfiQ5evF",  # 已知存在的路徑
-                    "H7L9rSfAami0LK-MYIGO1",  # 已知存在的路徑  
-                    "et1KGstRGHyPnMlXdxssK",  # 已知存在的路徑
-                ]
-            
-            async with httpx.AsyncClient() as client:
-                for canvas_id in canvas_ids:
-                    test_url = f"{supabase_storage.supabase_url}/storage/v1/object/public/{supabase_storage.bucket_name}/canvas/{canvas_id}/{file_id}"
-                    
-                    try:
-                        response = await client.head(test_url, timeout=3.0)
-                        if response.status_code == 200:
-                            print(f"🔗 Found file at: canvas/{canvas_id}/{file_id} -> {test_url}")
-                            return RedirectResponse(url=test_url, status_code=302)
-                    except Exception as e:
-                        # 不打印每個失敗的嘗試，避免日誌過多
-                        continue
-                        
-                print(f"🔍 File {file_id} not found in any canvas paths (checked {len(canvas_ids)} canvases)")
-                    
-        except Exception as e:
-            print(f"❌ Error searching canvas paths: {e}")
-    
+
+    # 如果本地文件不存在，重定向到 Supabase Storage
+    public_url = await _storage_url(file_id)
+    if public_url:
+        return RedirectResponse(url=public_url, status_code=302)
+
     # 如果都找不到，返回 404
     raise HTTPException(status_code=404, detail="File not found")
 
@@ -1,6 +1,6 @@
 import os
 from datetime import datetime
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 import requests
 import httpx
 from models.tool_model import ToolInfoJson
@@ -8,10 +8,22 @@ from services.tool_service import tool_service
 from services.config_service import config_service
 from services.db_service import db_service
 from services.db_adapter import db_adapter
+from services.chat_history_cache import chat_histories
+from services.langgraph_service.delta_coalescer import get_delta_coalescer_stats
+from services.langgraph_service.swarm_cache import swarm_cache
+from services.langgraph_service.model_registry import chat_models
+from services.langgraph_service.context_window import chat_context
+from services.jaaz_task_watcher import jaaz_task_watcher
+from services.canvas_mutation_service import canvas_mutations
+from utils.image_worker import image_worker
+from utils.image_input_cache import input_image_cache
+from services.image_variant_service import image_variants
+from services.upload_queue_service import upload_queue
+from services.tool_confirmation_manager import tool_confirmation_manager
 from utils.http_client import HttpClient
 # services
 from models.config_model import ModelInfo
-from typing import List
+from typing import List, Optional
 from services.tool_service import TOOL_MAPPING
 
 router = APIRouter(prefix="/api")
@@ -149,6 +161,20 @@ async def get_chat_session(session_id: str):
     return messages
 
 
+@router.get("/chat_session/{session_id}/messages")
+async def get_chat_session_messages(session_id: str, before_id: Optional[str] = None, limit: int = 50):
+    """One page of chat history, in chronological order
+
+    Without before_id the latest messages are returned; pass the returned
+    before_id to get the page before them, it is null once the start of the
+    session is reached.
+    """
+    try:
+        return await db_adapter.get_chat_history_page(session_id, before_id, limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid before_id")
+
+
 @router.get("/health")
 async def health_check():
     """Health check endpoint for cloud deployment"""
@@ -169,3 +195,23 @@ async def health_check():
             "error": str(e),
             "timestamp": datetime.now().isoformat()
         }
+
+
+@router.get("/metrics")
+async def metrics():
+    """Runtime counters of the streaming and I/O layers"""
+    return {
+        "delta_coalescer": get_delta_coalescer_stats(),
+        "http_client": HttpClient.get_stats(),
+        "jaaz_task_watcher": dict(jaaz_task_watcher.stats),
+        "canvas_mutations": canvas_mutations.get_stats(),
+        "image_worker": image_worker.get_stats(),
+        "input_image_cache": input_image_cache.get_stats(),
+        "image_variants": image_variants.get_stats(),
+        "upload_queue": upload_queue.get_stats(),
+        "swarm_cache": swarm_cache.get_stats(),
+        "chat_models": chat_models.get_stats(),
+        "chat_context": chat_context.get_stats(),
+        "chat_histories": chat_histories.get_stats(),
+        "tool_confirmations": tool_confirmation_manager.get_stats(),
+    }
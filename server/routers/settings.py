@@ -26,13 +26,13 @@ Settings Router - 设置路由模块
 import json
 import os
 import shutil
-import httpx
 from fastapi import APIRouter, HTTPException, Request, UploadFile, File, Form
 from services.db_adapter import db_adapter
 from services.settings_service import settings_service
 from services.tool_service import tool_service
 from services.knowledge_service import list_user_enabled_knowledge
 from pydantic import BaseModel
+from utils.http_client import HttpClient
 
 # 创建设置相关的路由器，所有端点都以 /api/settings 为前缀
 router = APIRouter(prefix="/api/settings")
@@ -288,8 +288,8 @@ async def comfyui_proxy(request: Request):
         full_url = f"{target_url}{path}"
 
         # 使用httpx转发请求（支持GET/POST等方法，这里示例用GET）
-        async with httpx.AsyncClient() as client:
-            response = await client.get(full_url)
+        async with HttpClient.create(url=full_url) as client:
+            response = await client.get(full_url, timeout=5.0, follow_redirects=False)
             # 将ComfyUI的响应原样返回给前端
             return response.json()
 
@@ -17,7 +17,7 @@ async def handle_tool_confirmation(request: ToolConfirmationRequest):
     try:
         if request.confirmed:
             # 确认工具调用
-            success = tool_confirmation_manager.confirm_tool(
+            success = await tool_confirmation_manager.confirm_tool(
                 request.tool_call_id)
             if success:
                 await send_to_websocket(request.session_id, {
@@ -29,7 +29,7 @@ async def handle_tool_confirmation(request: ToolConfirmationRequest):
                     status_code=404, detail="Tool call not found or already processed")
         else:
             # 取消工具调用
-            success = tool_confirmation_manager.cancel_confirmation(
+            success = await tool_confirmation_manager.cancel_confirmation(
                 request.tool_call_id)
             if success:
                 await send_to_websocket(request.session_id, {
@@ -41,5 +41,7 @@ async def handle_tool_confirmation(request: ToolConfirmationRequest):
                     status_code=404, detail="Tool call not found or already processed")
 
         return {"status": "success"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
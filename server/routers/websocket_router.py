@@ -1,5 +1,7 @@
 # routers/websocket_router.py
-from services.websocket_state import sio, add_connection, remove_connection
+from services.websocket_state import sio, add_connection, remove_connection, canvas_room, session_room
+from services.message_sync_service import get_message_sync
+from services.db_adapter import db_adapter
 
 @sio.event
 async def connect(sid, environ, auth):
@@ -7,6 +9,7 @@ async def connect(sid, environ, auth):
     
     user_info = auth or {}
     add_connection(sid, user_info)
+    await _enter_rooms(sid, user_info)
     
     await sio.emit('connected', {'status': 'connected'}, room=sid)
 
@@ -18,3 +21,52 @@ async def disconnect(sid):
 @sio.event
 async def ping(sid, data):
     await sio.emit('pong', data, room=sid)
+
+def _rooms_for(data) -> list:
+    """Rooms named by a {canvas_id, session_id} payload"""
+    data = data if isinstance(data, dict) else {}
+    rooms = []
+    if data.get('canvas_id'):
+        rooms.append(canvas_room(data['canvas_id']))
+    if data.get('session_id'):
+        rooms.append(session_room(data['session_id']))
+    return rooms
+
+async def _enter_rooms(sid, data):
+    for room in _rooms_for(data):
+        await sio.enter_room(sid, room)
+
+@sio.event
+async def subscribe(sid, data):
+    """Join the rooms of a canvas and/or session to receive their updates"""
+    await _enter_rooms(sid, data)
+
+@sio.event
+async def unsubscribe(sid, data):
+    """Leave the rooms of a canvas and/or session"""
+    for room in _rooms_for(data):
+        await sio.leave_room(sid, room)
+
+@sio.event
+async def resync_messages(sid, data):
+    """Send a full message snapshot to a client that detected a delta gap"""
+    session_id = (data or {}).get('session_id')
+    if not session_id:
+        return
+
+    sync = get_message_sync(session_id)
+    if sync:
+        event = sync.snapshot()
+    else:
+        # No active stream, the database holds the full history
+        event = {
+            'type': 'all_messages',
+            'seq': 0,
+            'messages': await db_adapter.get_chat_history(session_id),
+        }
+
+    await sio.emit('session_update', {
+        'canvas_id': None,
+        'session_id': session_id,
+        **event
+    }, room=sid)
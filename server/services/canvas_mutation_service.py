@@ -0,0 +1,180 @@
+# services/canvas_mutation_service.py
+"""
+Single coordinator for generated media landing on a canvas
+
+Image, video and ComfyUI results all add elements to a canvas by reading its
+placement index and appending rows. They used to do that under separate lock
+managers (or none), so results of different kinds could race and land on the
+same spot, and the per-canvas lock dicts were never cleaned up.
+
+Everything now goes through `canvas_mutations`:
+
+- `lock_canvas(canvas_id)` is the one per-canvas lock. Locks are reference
+  counted and dropped as soon as nobody holds or waits for them, so memory is
+  bounded by the canvases being written right now.
+- `add_media(...)` queues a result for the canvas. Results arriving within
+  `coalesce_window` seconds of the first one are placed together under the
+  lock, written with a single append and announced with a single
+  `canvas_elements_added` broadcast per session.
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, List
+from services.db_adapter import db_adapter
+from services.websocket_service import broadcast_session_update
+from utils.canvas import placement_indexes
+
+
+class _CanvasLock:
+    __slots__ = ('lock', 'users')
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        # Holders plus waiters; the lock is dropped when this reaches 0
+        self.users = 0
+
+
+class _PendingMedia:
+    __slots__ = ('session_id', 'build_element', 'file_data', 'event_type', 'url_key', 'url', 'future')
+
+    def __init__(self, session_id: str, build_element: Callable[[], Awaitable[Dict[str, Any]]],
+                 file_data: Dict[str, Any], event_type: str, url_key: str, url: str,
+                 future: 'asyncio.Future[Dict[str, Any]]'):
+        self.session_id = session_id
+        self.build_element = build_element
+        self.file_data = file_data
+        self.event_type = event_type
+        self.url_key = url_key
+        self.url = url
+        self.future = future
+
+
+class CanvasMutationCoordinator:
+    """Per-canvas lock plus write coalescing for generated media"""
+
+    def __init__(self, coalesce_window: float = 0.05, max_batch: int = 50):
+        self.coalesce_window = coalesce_window
+        self.max_batch = max_batch
+        self._locks: Dict[str, _CanvasLock] = {}
+        self._pending: Dict[str, List[_PendingMedia]] = {}
+        self._flushers: Dict[str, 'asyncio.Task[None]'] = {}
+        self.stats = {'media_added': 0, 'writes': 0, 'broadcasts': 0}
+
+    @asynccontextmanager
+    async def lock_canvas(self, canvas_id: str):
+        entry = self._locks.get(canvas_id)
+        if entry is None:
+            entry = self._locks[canvas_id] = _CanvasLock()
+        entry.users += 1
+        try:
+            async with entry.lock:
+                yield
+        finally:
+            entry.users -= 1
+            if entry.users == 0 and self._locks.get(canvas_id) is entry:
+                del self._locks[canvas_id]
+
+    async def add_media(
+        self,
+        session_id: str,
+        canvas_id: str,
+        build_element: Callable[[], Awaitable[Dict[str, Any]]],
+        file_data: Dict[str, Any],
+        event_type: str,
+        url_key: str,
+        url: str,
+    ) -> Dict[str, Any]:
+        """Place a generated file on the canvas, returns its new element
+
+        build_element is called under the canvas lock, after the results queued
+        before it have been placed, so it sees their positions in the placement
+        index. event_type/url_key/url describe the per-item broadcast payload,
+        e.g. ('image_generated', 'image_url', url).
+        """
+        future: 'asyncio.Future[Dict[str, Any]]' = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(canvas_id, []).append(
+            _PendingMedia(session_id, build_element, file_data, event_type, url_key, url, future)
+        )
+        flusher = self._flushers.get(canvas_id)
+        if flusher is None or flusher.done():
+            self._flushers[canvas_id] = asyncio.create_task(self._flush_later(canvas_id))
+        # Shield so a cancelled caller doesn't drop the rest of the batch
+        return await asyncio.shield(future)
+
+    async def _flush_later(self, canvas_id: str) -> None:
+        batch: List[_PendingMedia] = []
+        try:
+            await asyncio.sleep(self.coalesce_window)
+            while self._pending.get(canvas_id):
+                async with self.lock_canvas(canvas_id):
+                    batch = self._pending[canvas_id][:self.max_batch]
+                    del self._pending[canvas_id][:len(batch)]
+                    await self._write_batch(canvas_id, batch)
+        except BaseException as e:
+            error = e if isinstance(e, Exception) else Exception("Canvas write cancelled")
+            for item in batch + self._pending.pop(canvas_id, []):
+                if not item.future.done():
+                    item.future.set_exception(error)
+            raise
+        finally:
+            if not self._pending.get(canvas_id):
+                self._pending.pop(canvas_id, None)
+            if self._flushers.get(canvas_id) is asyncio.current_task():
+                del self._flushers[canvas_id]
+
+    async def _write_batch(self, canvas_id: str, batch: List[_PendingMedia]) -> None:
+        elements: List[Dict[str, Any]] = []
+        files: Dict[str, Any] = {}
+        placed: List[_PendingMedia] = []
+        for item in batch:
+            try:
+                element = await item.build_element()
+            except Exception as e:
+                item.future.set_exception(e)
+                continue
+            # Place the next item of the batch after this one
+            placement_indexes.add_elements(canvas_id, [element])
+            elements.append(element)
+            files[item.file_data['id']] = item.file_data
+            placed.append(item)
+        if not placed:
+            return
+
+        try:
+            await db_adapter.append_canvas_elements(canvas_id, elements, files)
+        except Exception as e:
+            # The index got ahead of the stored canvas, rebuild it next time
+            placement_indexes.invalidate(canvas_id)
+            for item in placed:
+                item.future.set_exception(e)
+            return
+        self.stats['writes'] += 1
+        self.stats['media_added'] += len(placed)
+
+        by_session: Dict[str, List[Dict[str, Any]]] = {}
+        for item, element in zip(placed, elements):
+            by_session.setdefault(item.session_id, []).append({
+                'type': item.event_type,
+                'element': element,
+                'file': item.file_data,
+                item.url_key: item.url,
+            })
+            item.future.set_result(element)
+        for session_id, items in by_session.items():
+            self.stats['broadcasts'] += 1
+            await broadcast_session_update(session_id, canvas_id, {
+                'type': 'canvas_elements_added',
+                'items': items,
+            })
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            'locks': len(self._locks),
+            'pending': sum(len(items) for items in self._pending.values()),
+        }
+
+
+# Shared by every tool that adds generated media to a canvas
+canvas_mutations = CanvasMutationCoordinator()
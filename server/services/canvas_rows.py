@@ -0,0 +1,31 @@
+# services/canvas_rows.py
+"""
+Row layout of canvas data, shared by the SQLite and Supabase backends
+
+A canvas is stored as three parts:
+
+- `canvases.data`: the blob without `elements` and `files` (appState etc.)
+- `canvas_elements(canvas_id, id, position, data)`: one row per element, in
+  drawing order
+- `canvas_files(canvas_id, id, data)`: one row per entry of `files`
+
+Both backends split incoming blobs and name element rows the same way, so
+the helpers live here instead of on each service.
+"""
+import json
+from typing import Any, Dict, List, Tuple
+
+
+def split_canvas_data(data: Any) -> Tuple[Dict[str, Any], List[Dict[str, Any]], Dict[str, Any]]:
+    """Split a canvas blob into (rest, elements, files)"""
+    if isinstance(data, (str, bytes)):
+        data = json.loads(data) if data else {}
+    rest = dict(data) if isinstance(data, dict) else {}
+    elements = [el for el in (rest.pop('elements', None) or []) if isinstance(el, dict)]
+    files = rest.pop('files', None) or {}
+    return rest, elements, files
+
+
+def element_id(element: Dict[str, Any], position: int) -> str:
+    """Row id of an element; elements without an id are keyed by position"""
+    return str(element.get('id') or f'_{position}')
@@ -0,0 +1,143 @@
+"""
+Server-side cache of chat histories
+
+Every chat turn used to start from the whole history posted by the client,
+and every history read (chat_session, resync_messages) parsed every row of
+the session again. Recently used sessions now keep their parsed history in
+memory and db_adapter keeps it in sync with its writes:
+
+- filled by db_adapter.get_chat_history on a miss, appended to by
+  db_adapter.create_message(s); sessions that are not cached are left
+  alone and read from the database next time
+- writes made while a session is loading are counted, so a load racing
+  with a write does not cache a history that misses the new message
+- least recently used sessions are dropped past CHAT_HISTORY_CACHE_SESSIONS
+  or when the cached messages exceed CHAT_HISTORY_CACHE_MB (inline images
+  make histories large); a session bigger than the whole budget is not
+  cached
+
+Only used with the local SQLite database: with Supabase several server
+instances write to the same sessions and this cache is per process, so
+db_adapter reads Supabase histories directly.
+
+The cached message dicts are shared with the callers, treat them as
+read-only (_fix_chat_history copies what it changes).
+
+Tuning (environment variables):
+    CHAT_HISTORY_CACHE_SESSIONS  sessions kept (default 64), 0 disables the cache
+    CHAT_HISTORY_CACHE_MB        size budget of the cached messages (default 128)
+"""
+
+import json
+import os
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+
+def _message_size(message: Dict[str, Any]) -> int:
+    return len(json.dumps(message, ensure_ascii=False, default=str))
+
+
+class _Entry:
+    __slots__ = ('messages', 'size')
+
+    def __init__(self, messages: List[Dict[str, Any]]):
+        self.messages = messages
+        self.size = sum(_message_size(message) for message in messages)
+
+
+class ChatHistoryCache:
+    """Parsed histories of recently used sessions, kept in sync by db_adapter writes"""
+
+    def __init__(self, max_sessions: Optional[int] = None, max_bytes: Optional[int] = None):
+        if max_sessions is None:
+            max_sessions = int(os.environ.get('CHAT_HISTORY_CACHE_SESSIONS', 64))
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get('CHAT_HISTORY_CACHE_MB', 128)) * 1024 * 1024)
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[str, _Entry]' = OrderedDict()
+        self._size = 0
+        # Sessions being loaded: [writes since the first load started, loads running]
+        self._loading: Dict[str, List[int]] = {}
+        self.stats = {'hits': 0, 'misses': 0, 'appends': 0, 'evictions': 0}
+
+    async def get_or_load(self, session_id: str,
+                          load: Callable[[], Awaitable[List[Dict[str, Any]]]]) -> List[Dict[str, Any]]:
+        """Return the history of session_id, calling load() on a miss"""
+        entry = self._entries.get(session_id)
+        if entry is not None:
+            self.stats['hits'] += 1
+            self._entries.move_to_end(session_id)
+            return list(entry.messages)
+
+        self.stats['misses'] += 1
+        loading = self._loading.setdefault(session_id, [0, 0])
+        writes = loading[0]
+        loading[1] += 1
+        try:
+            messages = await load()
+        finally:
+            loading[1] -= 1
+            if not loading[1]:
+                del self._loading[session_id]
+        if self.max_sessions > 0 and loading[0] == writes and session_id not in self._entries:
+            self._put(session_id, _Entry(list(messages)))
+        return messages
+
+    def _record_write(self, session_id: str) -> None:
+        loading = self._loading.get(session_id)
+        if loading is not None:
+            loading[0] += 1
+
+    def append(self, session_id: str, messages: Iterable[Dict[str, Any]]) -> None:
+        """Record messages saved to the session"""
+        self._record_write(session_id)
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return
+        for message in messages:
+            entry.messages.append(message)
+            size = _message_size(message)
+            entry.size += size
+            self._size += size
+        self.stats['appends'] += 1
+        self._entries.move_to_end(session_id)
+        self._shrink()
+
+    def invalidate(self, session_id: str) -> None:
+        self._record_write(session_id)
+        entry = self._entries.pop(session_id, None)
+        if entry is not None:
+            self._size -= entry.size
+
+    def clear(self) -> None:
+        for session_id in list(self._entries):
+            self.invalidate(session_id)
+
+    def _put(self, session_id: str, entry: _Entry) -> None:
+        if entry.size > self.max_bytes:
+            return
+        self._entries[session_id] = entry
+        self._size += entry.size
+        self._shrink()
+
+    def _shrink(self) -> None:
+        while self._entries and (len(self._entries) > self.max_sessions or self._size > self.max_bytes):
+            _, entry = self._entries.popitem(last=False)
+            self._size -= entry.size
+            self.stats['evictions'] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            'sessions': len(self._entries),
+            'messages': sum(len(entry.messages) for entry in self._entries.values()),
+            'mb': round(self._size / (1024 * 1024), 1),
+            'max_sessions': self.max_sessions,
+            'max_mb': round(self.max_bytes / (1024 * 1024), 1),
+        }
+
+
+# Shared by db_adapter, exposed by /api/metrics
+chat_histories = ChatHistoryCache()
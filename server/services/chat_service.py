@@ -28,15 +28,22 @@ async def handle_chat(data: Dict[str, Any]) -> None:
 
     Args:
         data (dict): Chat request data containing:
-            - messages: list of message dicts
+            - message: the new message dict; the history is taken from the
+              server (db_adapter's history cache)
+            - messages: alternatively the whole history, new message last
             - session_id: unique session identifier
             - canvas_id: canvas identifier (contextual use)
             - text_model: text model configuration
             - tool_list: list of tool model configurations (images/videos)
     """
     # Extract fields from incoming data
-    messages: List[Dict[str, Any]] = data.get('messages', [])
     session_id: str = data.get('session_id', '')
+    new_message: Optional[Dict[str, Any]] = data.get('message')
+    if new_message is not None:
+        # 服务端是历史的唯一来源，客户端只发送新消息
+        messages: List[Dict[str, Any]] = await db_adapter.get_chat_history(session_id) + [new_message]
+    else:
+        messages = data.get('messages', [])
     canvas_id: str = data.get('canvas_id', '')
     text_model: ModelInfo = data.get('text_model', {})
     tool_list: List[ToolInfoJson] = data.get('tool_list', [])
@@ -90,6 +90,7 @@ IMAGE_FORMATS = (
     ".tiff",
     ".tif",  # 其他常见格式
     ".webp",
+    ".avif",
 )
 VIDEO_FORMATS = (
     ".mp4",
@@ -108,6 +109,8 @@ class ConfigService:
             "CONFIG_PATH", os.path.join(USER_DATA_DIR, "config.toml")
         )
         self.initialized = False
+        # Bumped on every update_config, clients built from the config check it
+        self.version = 0
 
     def _get_jaaz_url(self) -> str:
         """Get the correct jaaz URL"""
@@ -182,6 +185,7 @@ class ConfigService:
             with open(self.config_file, "w") as f:
                 toml.dump(data, f)
             self.app_config = data
+            self.version += 1
 
             return {
                 "status": "success",
@@ -4,14 +4,19 @@ This adapter allows switching between SQLite and Supabase backends
 """
 import os
 import json
-from typing import List, Dict, Any, Optional, Union
-from .db_service import DatabaseService
+from typing import List, Dict, Any, Optional, Tuple, Union
+from .db_service import DatabaseService, db_service
 from .supabase_db_service import SupabaseService, supabase_service
+from .chat_history_cache import chat_histories
+from utils.canvas import placement_indexes
 import nanoid
 
+# Largest history page served by get_chat_history_page
+MAX_HISTORY_PAGE = 200
+
 class DatabaseAdapter:
     def __init__(self):
-        self.sqlite_db = DatabaseService()
+        self.sqlite_db: DatabaseService = db_service
         self.supabase_db = supabase_service
         self.use_supabase = False  # Start with SQLite, switch to Supabase when ready
         
@@ -26,6 +31,12 @@ class DatabaseAdapter:
             print("📝 Falling back to SQLite")
             self.use_supabase = False
 
+    async def close(self):
+        """Close pooled database connections"""
+        await self.sqlite_db.close()
+        if self.use_supabase:
+            await self.supabase_db.close()
+
     async def create_canvas(self, id: str, name: str):
         """Create a new canvas"""
         if self.use_supabase:
@@ -66,20 +77,76 @@ class DatabaseAdapter:
             tool_calls = kwargs.get('tool_calls')
             tool_call_id = kwargs.get('tool_call_id')
             
-            return await self.supabase_db.create_message(
+            await self.supabase_db.create_message(
                 message_id, session_id, role, content, tool_calls, tool_call_id
             )
         else:
             # For SQLite, use the old format
             message_str = json.dumps(message) if isinstance(message, dict) else message
-            return await self.sqlite_db.create_message(session_id, role, message_str)
+            await self.sqlite_db.create_message(session_id, role, message_str)
+
+        try:
+            chat_histories.append(session_id, [json.loads(message) if isinstance(message, str) else message])
+        except ValueError:
+            # Not a message the history would return, read it back from the database
+            chat_histories.invalidate(session_id)
+
+    async def create_messages(self, session_id: str, messages: List[Dict[str, Any]]):
+        """Save several OpenAI-format messages in one transaction"""
+        if not messages:
+            return
+        if self.use_supabase:
+            await self.supabase_db.create_messages([
+                (nanoid.generate(), session_id, message.get('role', 'user'), message, None, None)
+                for message in messages
+            ])
+        else:
+            await self.sqlite_db.create_messages(session_id, [
+                (message.get('role', 'user'), json.dumps(message))
+                for message in messages
+            ])
+        chat_histories.append(session_id, messages)
 
     async def get_chat_history(self, session_id: str) -> List[Dict[str, Any]]:
-        """Get chat history for a session"""
+        """Get chat history for a session, served from chat_histories once loaded
+
+        Only with SQLite: a Supabase database is shared by several server
+        instances, and a process-local cache would miss the messages written
+        by the others.
+        """
         if self.use_supabase:
             return await self.supabase_db.get_chat_history(session_id)
         else:
-            return await self.sqlite_db.get_chat_history(session_id)
+            return await chat_histories.get_or_load(session_id, lambda: self.sqlite_db.get_chat_history(session_id))
+
+    async def get_chat_history_page(self, session_id: str, before_id: Optional[str] = None, limit: int = 50) -> Dict[str, Any]:
+        """Get the messages before message before_id (the latest ones without it)
+
+        Pages start at a user message so tool calls stay with their results,
+        unless the whole page is one long tool chain.
+
+        Returns:
+            {'messages': [...], 'before_id': cursor of the next older page, None at the start,
+             'offset': number of messages before the page, to place messages_delta indices}
+        """
+        limit = max(1, min(limit, MAX_HISTORY_PAGE))
+        backend = self.supabase_db if self.use_supabase else self.sqlite_db
+        if before_id is not None and not self.use_supabase:
+            before_id = int(before_id)
+
+        # One extra row tells whether there are older messages
+        rows = await backend.list_chat_message_roles(session_id, before_id, limit + 1)
+        has_more = len(rows) > limit
+        rows = rows[:limit][::-1]
+        if has_more:
+            start = next((i for i, row in enumerate(rows) if row['role'] == 'user'), 0)
+            rows = rows[start:]
+        if not rows:
+            return {'messages': [], 'before_id': None, 'offset': 0}
+
+        messages = await backend.get_chat_messages_range(session_id, rows[0]['id'], rows[-1]['id'])
+        offset = await backend.count_chat_messages_before(session_id, rows[0]['id']) if has_more else 0
+        return {'messages': messages, 'before_id': str(rows[0]['id']) if has_more else None, 'offset': offset}
 
     async def list_sessions(self, canvas_id: str) -> List[Dict[str, Any]]:
         """List all chat sessions"""
@@ -91,9 +158,10 @@ class DatabaseAdapter:
     async def save_canvas_data(self, id: str, data: str, thumbnail: str = None):
         """Save canvas data"""
         if self.use_supabase:
-            return await self.supabase_db.save_canvas_data(id, data, thumbnail)
+            await self.supabase_db.save_canvas_data(id, data, thumbnail)
         else:
-            return await self.sqlite_db.save_canvas_data(id, data, thumbnail)
+            await self.sqlite_db.save_canvas_data(id, data, thumbnail)
+        placement_indexes.sync(id, data)
 
     async def get_canvas_data(self, id: str) -> Optional[Dict[str, Any]]:
         """Get canvas data"""
@@ -102,6 +170,29 @@ class DatabaseAdapter:
         else:
             return await self.sqlite_db.get_canvas_data(id)
 
+    async def get_canvas_elements(self, canvas_id: str) -> List[Dict[str, Any]]:
+        """Get the elements of a canvas in z-order"""
+        if self.use_supabase:
+            return await self.supabase_db.get_canvas_elements(canvas_id)
+        else:
+            return await self.sqlite_db.get_canvas_elements(canvas_id)
+
+    async def append_canvas_elements(self, canvas_id: str, elements: List[Dict[str, Any]], files: Optional[Dict[str, Any]] = None):
+        """Append elements (and their files) without rewriting the whole canvas"""
+        if self.use_supabase:
+            await self.supabase_db.append_canvas_elements(canvas_id, elements, files)
+        else:
+            await self.sqlite_db.append_canvas_elements(canvas_id, elements, files)
+        placement_indexes.add_elements(canvas_id, elements)
+
+    async def patch_canvas_elements(self, canvas_id: str, elements: Optional[List[Dict[str, Any]]] = None, files: Optional[Dict[str, Any]] = None):
+        """Update elements and files by id without rewriting the whole canvas"""
+        if self.use_supabase:
+            await self.supabase_db.patch_canvas_elements(canvas_id, elements, files)
+        else:
+            await self.sqlite_db.patch_canvas_elements(canvas_id, elements, files)
+        placement_indexes.add_elements(canvas_id, elements or [])
+
     async def get_or_create_canvas(self, canvas_id: str, canvas_name: str = "Untitled") -> Dict[str, Any]:
         """
         Tries to fetch a canvas by its ID. If it doesn't exist, creates a new one.
@@ -121,9 +212,10 @@ class DatabaseAdapter:
     async def delete_canvas(self, id: str):
         """Delete canvas and related data"""
         if self.use_supabase:
-            return await self.supabase_db.delete_canvas(id)
+            await self.supabase_db.delete_canvas(id)
         else:
-            return await self.sqlite_db.delete_canvas(id)
+            await self.sqlite_db.delete_canvas(id)
+        placement_indexes.invalidate(id)
 
     async def rename_canvas(self, id: str, name: str):
         """Rename canvas"""
@@ -132,6 +224,109 @@ class DatabaseAdapter:
         else:
             return await self.sqlite_db.rename_canvas(id, name)
 
+    async def save_file_locations(self, locations: List[Tuple[str, str]]):
+        """Record where files live in remote storage, as (file_id, storage_path) pairs"""
+        if self.use_supabase:
+            return await self.supabase_db.save_file_locations(locations)
+        else:
+            return await self.sqlite_db.save_file_locations(locations)
+
+    async def get_file_location(self, file_id: str) -> Optional[str]:
+        """Get the remote storage path of a file"""
+        if self.use_supabase:
+            return await self.supabase_db.get_file_location(file_id)
+        else:
+            return await self.sqlite_db.get_file_location(file_id)
+
+    async def get_chat_summary(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Rolling summary of the session's oldest messages, if any"""
+        if self.use_supabase:
+            return await self.supabase_db.get_chat_summary(session_id)
+        else:
+            return await self.sqlite_db.get_chat_summary(session_id)
+
+    async def save_chat_summary(self, session_id: str, covered_count: int, covered_digest: str, summary: str):
+        """Store the rolling summary of the session's first covered_count messages"""
+        if self.use_supabase:
+            return await self.supabase_db.save_chat_summary(session_id, covered_count, covered_digest, summary)
+        else:
+            return await self.sqlite_db.save_chat_summary(session_id, covered_count, covered_digest, summary)
+
+    async def save_tool_confirmation(self, tool_call_id: str, session_id: str, tool_name: str,
+                                     created_at: float, expires_at: float):
+        """Record a tool call waiting for the user's confirmation"""
+        if self.use_supabase:
+            return await self.supabase_db.save_tool_confirmation(tool_call_id, session_id, tool_name, created_at, expires_at)
+        else:
+            return await self.sqlite_db.save_tool_confirmation(tool_call_id, session_id, tool_name, created_at, expires_at)
+
+    async def resolve_tool_confirmation(self, tool_call_id: str, confirmed: bool, now: float) -> bool:
+        """Record the user's decision, False if the tool call isn't waiting (any more)"""
+        if self.use_supabase:
+            return await self.supabase_db.resolve_tool_confirmation(tool_call_id, confirmed, now)
+        else:
+            return await self.sqlite_db.resolve_tool_confirmation(tool_call_id, confirmed, now)
+
+    async def get_tool_confirmation_decisions(self, tool_call_ids: List[str]) -> Dict[str, bool]:
+        """Decisions made so far for the given tool calls"""
+        if self.use_supabase:
+            return await self.supabase_db.get_tool_confirmation_decisions(tool_call_ids)
+        else:
+            return await self.sqlite_db.get_tool_confirmation_decisions(tool_call_ids)
+
+    async def delete_tool_confirmation(self, tool_call_id: str):
+        """Forget a tool call that stopped waiting"""
+        if self.use_supabase:
+            return await self.supabase_db.delete_tool_confirmation(tool_call_id)
+        else:
+            return await self.sqlite_db.delete_tool_confirmation(tool_call_id)
+
+    async def delete_expired_tool_confirmations(self, now: float) -> int:
+        """Remove tool calls past their deadline, returns how many"""
+        if self.use_supabase:
+            return await self.supabase_db.delete_expired_tool_confirmations(now)
+        else:
+            return await self.sqlite_db.delete_expired_tool_confirmations(now)
+
+    # The file store indexes blobs on this machine's disk (FILES_DIR), so like
+    # the upload journal it always lives in the local SQLite database; in a
+    # shared Supabase table one instance's GC would delete the others' aliases
+    async def save_file_alias(self, file_id: str, hash: str, size: int) -> Optional[str]:
+        """Point file_id at the blob with the given content hash, returns the hash of a blob it orphaned"""
+        return await self.sqlite_db.save_file_alias(file_id, hash, size)
+
+    async def list_file_aliases(self) -> List[Dict[str, Any]]:
+        """All aliases with their blob's hash, size, ref_count and created_at"""
+        return await self.sqlite_db.list_file_aliases()
+
+    async def delete_file_aliases(self, file_ids: List[str]) -> List[Dict[str, Any]]:
+        """Delete aliases, returns (and deletes) the blobs left without any alias"""
+        return await self.sqlite_db.delete_file_aliases(file_ids)
+
+    # The upload journal describes files on this machine's disk, so it always
+    # lives in the local SQLite database, also when Supabase is the main store
+    async def save_upload_job(self, file_name: str, storage_path: str, canvas_id: Optional[str] = None,
+                              canvas_file: Optional[Dict[str, Any]] = None):
+        """Journal a local file to upload to remote storage"""
+        return await self.sqlite_db.save_upload_job(
+            file_name, storage_path, canvas_id, json.dumps(canvas_file) if canvas_file is not None else None)
+
+    async def list_upload_jobs(self, status: str = 'pending') -> List[Dict[str, Any]]:
+        """Journaled uploads with the given status, oldest first"""
+        jobs = await self.sqlite_db.list_upload_jobs(status)
+        for job in jobs:
+            job['canvas_file'] = json.loads(job['canvas_file']) if job['canvas_file'] else None
+        return jobs
+
+    async def update_upload_job(self, file_name: str, status: str, attempts: int,
+                                last_error: Optional[str] = None, next_attempt_at: float = 0):
+        """Record a failed upload attempt"""
+        return await self.sqlite_db.update_upload_job(file_name, status, attempts, last_error, next_attempt_at)
+
+    async def delete_upload_job(self, file_name: str):
+        """Remove a completed upload from the journal"""
+        return await self.sqlite_db.delete_upload_job(file_name)
+
     async def create_comfy_workflow(self, name: str, api_json: str, description: str, inputs: str, outputs: str = None):
         """Create a new comfy workflow"""
         if self.use_supabase:
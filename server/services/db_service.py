@@ -1,19 +1,21 @@
 import sqlite3
 import json
 import os
-from typing import List, Dict, Any, Optional
-import aiosqlite
+from typing import List, Dict, Any, Optional, Tuple
 from .config_service import USER_DATA_DIR
+from .canvas_rows import split_canvas_data, element_id
 from .migrations.manager import MigrationManager, CURRENT_VERSION
+from .sqlite_pool import SQLitePool
 
 DB_PATH = os.path.join(USER_DATA_DIR, "localmanus.db")
 
 class DatabaseService:
-    def __init__(self):
-        self.db_path = DB_PATH
+    def __init__(self, db_path: str = DB_PATH):
+        self.db_path = db_path
         self._ensure_db_directory()
         self._migration_manager = MigrationManager()
         self._init_db()
+        self.pool = SQLitePool(self.db_path)
 
     def _ensure_db_directory(self):
         """Ensure the database directory exists"""
@@ -22,6 +24,9 @@ class DatabaseService:
     def _init_db(self):
         """Initialize the database with the current schema"""
         with sqlite3.connect(self.db_path) as conn:
+            # WAL is persistent on the database file, set it once up front
+            SQLitePool.configure(conn)
+
             # Create version table if it doesn't exist
             conn.execute("""
                 CREATE TABLE IF NOT EXISTS db_version (
@@ -43,19 +48,21 @@ class DatabaseService:
                 # Need to migrate
                 self._migration_manager.migrate(conn, current_version[0], CURRENT_VERSION)
 
+    async def close(self):
+        """Close pooled connections"""
+        await self.pool.close()
+
     async def create_canvas(self, id: str, name: str):
         """Create a new canvas"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.pool.write() as db:
             await db.execute("""
                 INSERT INTO canvases (id, name)
                 VALUES (?, ?)
             """, (id, name))
-            await db.commit()
 
     async def list_canvases(self) -> List[Dict[str, Any]]:
         """Get all canvases"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = sqlite3.Row
+        async with self.pool.read() as db:
             cursor = await db.execute("""
                 SELECT id, name, description, thumbnail, created_at, updated_at
                 FROM canvases
@@ -66,26 +73,38 @@ class DatabaseService:
 
     async def create_chat_session(self, id: str, model: str, provider: str, canvas_id: str, title: Optional[str] = None):
         """Save a new chat session"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.pool.write() as db:
             await db.execute("""
                 INSERT INTO chat_sessions (id, model, provider, canvas_id, title)
                 VALUES (?, ?, ?, ?, ?)
             """, (id, model, provider, canvas_id, title))
-            await db.commit()
 
     async def create_message(self, session_id: str, role: str, message: str):
         """Save a chat message"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.pool.write() as db:
             await db.execute("""
                 INSERT INTO chat_messages (session_id, role, message)
                 VALUES (?, ?, ?)
             """, (session_id, role, message))
-            await db.commit()
+
+    async def create_messages(self, session_id: str, messages: List[Tuple[str, str]]):
+        """Save several chat messages in one transaction
+
+        Args:
+            session_id: Session the messages belong to
+            messages: List of (role, message) tuples
+        """
+        if not messages:
+            return
+        async with self.pool.write() as db:
+            await db.executemany("""
+                INSERT INTO chat_messages (session_id, role, message)
+                VALUES (?, ?, ?)
+            """, [(session_id, role, message) for role, message in messages])
 
     async def get_chat_history(self, session_id: str) -> List[Dict[str, Any]]:
         """Get chat history for a session"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = sqlite3.Row
+        async with self.pool.read() as db:
             cursor = await db.execute("""
                 SELECT role, message, id
                 FROM chat_messages
@@ -106,10 +125,49 @@ class DatabaseService:
                 
             return messages
 
+    async def list_chat_message_roles(self, session_id: str, before_id: Optional[int], limit: int) -> List[Dict[str, Any]]:
+        """Ids and roles of up to limit messages older than before_id, newest first"""
+        async with self.pool.read() as db:
+            # Index-only scan of idx_chat_messages_session_id_id_role, message bodies are not read
+            cursor = await db.execute("""
+                SELECT id, role
+                FROM chat_messages
+                WHERE session_id = ? AND id < ?
+                ORDER BY id DESC
+                LIMIT ?
+            """, (session_id, before_id if before_id is not None else 2 ** 63 - 1, limit))
+            return [dict(row) for row in await cursor.fetchall()]
+
+    async def count_chat_messages_before(self, session_id: str, before_id: int) -> int:
+        """Number of messages older than before_id"""
+        async with self.pool.read() as db:
+            cursor = await db.execute(
+                "SELECT COUNT(*) FROM chat_messages WHERE session_id = ? AND id < ?", (session_id, before_id))
+            return (await cursor.fetchone())[0]
+
+    async def get_chat_messages_range(self, session_id: str, first_id: int, last_id: int) -> List[Dict[str, Any]]:
+        """Messages with first_id <= id <= last_id, oldest first"""
+        async with self.pool.read() as db:
+            cursor = await db.execute("""
+                SELECT message
+                FROM chat_messages
+                WHERE session_id = ? AND id BETWEEN ? AND ?
+                ORDER BY id ASC
+            """, (session_id, first_id, last_id))
+            rows = await cursor.fetchall()
+
+        messages = []
+        for row in rows:
+            if row['message']:
+                try:
+                    messages.append(json.loads(row['message']))
+                except ValueError:
+                    pass
+        return messages
+
     async def list_sessions(self, canvas_id: str) -> List[Dict[str, Any]]:
         """List all chat sessions"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = sqlite3.Row
+        async with self.pool.read() as db:
             if canvas_id:
                 cursor = await db.execute("""
                     SELECT id, title, model, provider, created_at, updated_at
@@ -127,75 +185,365 @@ class DatabaseService:
             return [dict(row) for row in rows]
 
     async def save_canvas_data(self, id: str, data: str, thumbnail: str = None):
-        """Save canvas data"""
-        async with aiosqlite.connect(self.db_path) as db:
+        """Save canvas data
+
+        Elements and files are stored as rows; only the ones that changed
+        since the last save are written.
+        """
+        rest, elements, files = split_canvas_data(data)
+
+        element_rows: Dict[str, Tuple[int, str]] = {}
+        for position, element in enumerate(elements):
+            element_rows[element_id(element, position)] = (position, json.dumps(element))
+        file_rows = {str(file_id): json.dumps(file_data) for file_id, file_data in files.items()}
+
+        async with self.pool.write() as db:
+            cursor = await db.execute("SELECT id, position, data FROM canvas_elements WHERE canvas_id = ?", (id,))
+            existing_elements = {row['id']: (row['position'], row['data']) for row in await cursor.fetchall()}
+            cursor = await db.execute("SELECT id, data FROM canvas_files WHERE canvas_id = ?", (id,))
+            existing_files = {row['id']: row['data'] for row in await cursor.fetchall()}
+
+            await db.executemany("""
+                INSERT OR REPLACE INTO canvas_elements (canvas_id, id, position, data)
+                VALUES (?, ?, ?, ?)
+            """, [
+                (id, row_id, position, element_data)
+                for row_id, (position, element_data) in element_rows.items()
+                if existing_elements.get(row_id) != (position, element_data)
+            ])
+            await db.executemany(
+                "DELETE FROM canvas_elements WHERE canvas_id = ? AND id = ?",
+                [(id, row_id) for row_id in existing_elements.keys() - element_rows.keys()]
+            )
+
+            await db.executemany("""
+                INSERT OR REPLACE INTO canvas_files (canvas_id, id, data)
+                VALUES (?, ?, ?)
+            """, [
+                (id, file_id, file_data)
+                for file_id, file_data in file_rows.items()
+                if existing_files.get(file_id) != file_data
+            ])
+            await db.executemany(
+                "DELETE FROM canvas_files WHERE canvas_id = ? AND id = ?",
+                [(id, file_id) for file_id in existing_files.keys() - file_rows.keys()]
+            )
+
             await db.execute("""
                 UPDATE canvases 
                 SET data = ?, thumbnail = ?, updated_at = STRFTIME('%Y-%m-%dT%H:%M:%fZ', 'now')
                 WHERE id = ?
-            """, (data, thumbnail, id))
-            await db.commit()
+            """, (json.dumps(rest), thumbnail, id))
+
+    async def get_canvas_elements(self, canvas_id: str) -> List[Dict[str, Any]]:
+        """Get the elements of a canvas in z-order, without files or app state"""
+        async with self.pool.read() as db:
+            cursor = await db.execute("""
+                SELECT data FROM canvas_elements
+                WHERE canvas_id = ?
+                ORDER BY position
+            """, (canvas_id,))
+            rows = await cursor.fetchall()
+        return [json.loads(row['data']) for row in rows]
+
+    async def append_canvas_elements(self, canvas_id: str, elements: List[Dict[str, Any]], files: Optional[Dict[str, Any]] = None):
+        """Append elements on top of the canvas and add their files
+
+        An element whose id already exists is replaced and moved to the top.
+        """
+        async with self.pool.write() as db:
+            cursor = await db.execute(
+                "SELECT COALESCE(MAX(position), -1) FROM canvas_elements WHERE canvas_id = ?", (canvas_id,))
+            top = (await cursor.fetchone())[0]
+
+            await db.executemany("""
+                INSERT OR REPLACE INTO canvas_elements (canvas_id, id, position, data)
+                VALUES (?, ?, ?, ?)
+            """, [
+                (canvas_id, element_id(element, top + 1 + i), top + 1 + i, json.dumps(element))
+                for i, element in enumerate(elements)
+            ])
+            await self._upsert_canvas_files(db, canvas_id, files)
+            await self._touch_canvas(db, canvas_id)
+
+    async def patch_canvas_elements(self, canvas_id: str, elements: Optional[List[Dict[str, Any]]] = None, files: Optional[Dict[str, Any]] = None):
+        """Update elements and files by id, keeping their position
+
+        Elements that don't exist yet are appended on top.
+        """
+        async with self.pool.write() as db:
+            if elements:
+                cursor = await db.execute(
+                    "SELECT COALESCE(MAX(position), -1) FROM canvas_elements WHERE canvas_id = ?", (canvas_id,))
+                top = (await cursor.fetchone())[0]
+                for element in elements:
+                    element_data = json.dumps(element)
+                    cursor = await db.execute("""
+                        UPDATE canvas_elements SET data = ?
+                        WHERE canvas_id = ? AND id = ?
+                    """, (element_data, canvas_id, str(element.get('id'))))
+                    if cursor.rowcount == 0:
+                        top += 1
+                        await db.execute("""
+                            INSERT INTO canvas_elements (canvas_id, id, position, data)
+                            VALUES (?, ?, ?, ?)
+                        """, (canvas_id, element_id(element, top), top, element_data))
+            await self._upsert_canvas_files(db, canvas_id, files)
+            await self._touch_canvas(db, canvas_id)
+
+    @staticmethod
+    async def _upsert_canvas_files(db, canvas_id: str, files: Optional[Dict[str, Any]]):
+        if not files:
+            return
+        await db.executemany("""
+            INSERT OR REPLACE INTO canvas_files (canvas_id, id, data)
+            VALUES (?, ?, ?)
+        """, [(canvas_id, str(file_id), json.dumps(file_data)) for file_id, file_data in files.items()])
+
+    @staticmethod
+    async def _touch_canvas(db, canvas_id: str):
+        await db.execute("""
+            UPDATE canvases SET updated_at = STRFTIME('%Y-%m-%dT%H:%M:%fZ', 'now')
+            WHERE id = ?
+        """, (canvas_id,))
 
     async def get_canvas_data(self, id: str) -> Optional[Dict[str, Any]]:
-        """Get canvas data"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = sqlite3.Row
+        """Get canvas data, reassembled from the canvas and its element/file rows"""
+        async with self.pool.read() as db:
             cursor = await db.execute("""
                 SELECT data, name
                 FROM canvases
                 WHERE id = ?
             """, (id,))
             row = await cursor.fetchone()
-
-            sessions = await self.list_sessions(id)
-            
             if row:
-                return {
-                    'data': json.loads(row['data']) if row['data'] else {},
-                    'name': row['name'],
-                    'sessions': sessions
-                }
+                cursor = await db.execute("""
+                    SELECT data FROM canvas_elements
+                    WHERE canvas_id = ?
+                    ORDER BY position
+                """, (id,))
+                element_rows = await cursor.fetchall()
+                cursor = await db.execute("SELECT id, data FROM canvas_files WHERE canvas_id = ?", (id,))
+                file_rows = await cursor.fetchall()
+
+        if not row:
             return None
 
+        # Fetched after releasing the reader so one call never holds two connections
+        sessions = await self.list_sessions(id)
+
+        data = json.loads(row['data']) if row['data'] else {}
+        if data or element_rows or file_rows:
+            data['elements'] = [json.loads(r['data']) for r in element_rows]
+            data['files'] = {r['id']: json.loads(r['data']) for r in file_rows}
+        return {
+            'data': data,
+            'name': row['name'],
+            'sessions': sessions
+        }
+
     async def delete_canvas(self, id: str):
         """Delete canvas and related data"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.pool.write() as db:
+            await db.execute("DELETE FROM canvas_elements WHERE canvas_id = ?", (id,))
+            await db.execute("DELETE FROM canvas_files WHERE canvas_id = ?", (id,))
             await db.execute("DELETE FROM canvases WHERE id = ?", (id,))
-            await db.commit()
 
     async def rename_canvas(self, id: str, name: str):
         """Rename canvas"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.pool.write() as db:
             await db.execute("UPDATE canvases SET name = ? WHERE id = ?", (name, id))
-            await db.commit()
+
+    async def save_file_locations(self, locations: List[Tuple[str, str]]):
+        """Record where files live in remote storage, as (file_id, storage_path) pairs"""
+        async with self.pool.write() as db:
+            await db.executemany("""
+                INSERT OR REPLACE INTO file_locations (file_id, storage_path)
+                VALUES (?, ?)
+            """, locations)
+
+    async def get_file_location(self, file_id: str) -> Optional[str]:
+        """Get the remote storage path of a file"""
+        async with self.pool.read() as db:
+            cursor = await db.execute("SELECT storage_path FROM file_locations WHERE file_id = ?", (file_id,))
+            row = await cursor.fetchone()
+        return row['storage_path'] if row else None
+
+    async def save_file_alias(self, file_id: str, hash: str, size: int) -> Optional[str]:
+        """Point file_id at the blob with the given content hash
+
+        Keeps the blobs' ref_count (number of aliases) up to date. Returns the
+        hash of the blob file_id pointed at before when it has no alias left
+        (its row is deleted, the caller removes the blob file).
+        """
+        async with self.pool.write() as db:
+            cursor = await db.execute("SELECT hash FROM file_aliases WHERE file_id = ?", (file_id,))
+            row = await cursor.fetchone()
+            previous = row['hash'] if row else None
+            if previous == hash:
+                return None
+            await db.execute("INSERT OR IGNORE INTO file_blobs (hash, size) VALUES (?, ?)", (hash, size))
+            await db.execute("INSERT OR REPLACE INTO file_aliases (file_id, hash) VALUES (?, ?)", (file_id, hash))
+            await db.execute("UPDATE file_blobs SET ref_count = ref_count + 1 WHERE hash = ?", (hash,))
+            if previous is None:
+                return None
+            await db.execute("UPDATE file_blobs SET ref_count = ref_count - 1 WHERE hash = ?", (previous,))
+            cursor = await db.execute("DELETE FROM file_blobs WHERE hash = ? AND ref_count <= 0", (previous,))
+            return previous if cursor.rowcount else None
+
+    async def list_file_aliases(self) -> List[Dict[str, Any]]:
+        """All aliases with their blob's hash, size, ref_count and created_at"""
+        async with self.pool.read() as db:
+            cursor = await db.execute("""
+                SELECT a.file_id, a.hash, b.size, b.ref_count, a.created_at
+                FROM file_aliases a JOIN file_blobs b ON b.hash = a.hash
+            """)
+            rows = await cursor.fetchall()
+            return [dict(row) for row in rows]
+
+    async def delete_file_aliases(self, file_ids: List[str]) -> List[Dict[str, Any]]:
+        """Delete aliases, returns (and deletes) the blobs left without any alias"""
+        async with self.pool.write() as db:
+            removed: Dict[str, int] = {}
+            for i in range(0, len(file_ids), 500):
+                chunk = file_ids[i:i + 500]
+                placeholders = ','.join('?' * len(chunk))
+                cursor = await db.execute(f"SELECT hash FROM file_aliases WHERE file_id IN ({placeholders})", chunk)
+                for row in await cursor.fetchall():
+                    removed[row['hash']] = removed.get(row['hash'], 0) + 1
+                await db.execute(f"DELETE FROM file_aliases WHERE file_id IN ({placeholders})", chunk)
+            await db.executemany("UPDATE file_blobs SET ref_count = ref_count - ? WHERE hash = ?",
+                                 [(count, hash) for hash, count in removed.items()])
+            orphans: List[Dict[str, Any]] = []
+            for hash in removed:
+                cursor = await db.execute("SELECT hash, size FROM file_blobs WHERE hash = ? AND ref_count <= 0", (hash,))
+                row = await cursor.fetchone()
+                if row:
+                    orphans.append(dict(row))
+            await db.executemany("DELETE FROM file_blobs WHERE hash = ?", [(o['hash'],) for o in orphans])
+            return orphans
+
+    async def get_chat_summary(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Rolling summary of the session's oldest messages, if any"""
+        async with self.pool.read() as db:
+            cursor = await db.execute("""
+                SELECT covered_count, covered_digest, summary
+                FROM chat_summaries
+                WHERE session_id = ?
+            """, (session_id,))
+            row = await cursor.fetchone()
+            return dict(row) if row else None
+
+    async def save_chat_summary(self, session_id: str, covered_count: int, covered_digest: str, summary: str):
+        """Store the rolling summary of the session's first covered_count messages"""
+        async with self.pool.write() as db:
+            await db.execute("""
+                INSERT OR REPLACE INTO chat_summaries (session_id, covered_count, covered_digest, summary, updated_at)
+                VALUES (?, ?, ?, ?, STRFTIME('%Y-%m-%dT%H:%M:%fZ', 'now'))
+            """, (session_id, covered_count, covered_digest, summary))
+
+    async def save_upload_job(self, file_name: str, storage_path: str, canvas_id: Optional[str] = None,
+                              canvas_file: Optional[str] = None):
+        """Journal a local file to upload to remote storage"""
+        async with self.pool.write() as db:
+            await db.execute("""
+                INSERT OR REPLACE INTO storage_uploads (file_name, storage_path, canvas_id, canvas_file)
+                VALUES (?, ?, ?, ?)
+            """, (file_name, storage_path, canvas_id, canvas_file))
+
+    async def list_upload_jobs(self, status: str = 'pending') -> List[Dict[str, Any]]:
+        """Journaled uploads with the given status, oldest first"""
+        async with self.pool.read() as db:
+            cursor = await db.execute("""
+                SELECT file_name, storage_path, canvas_id, canvas_file, status, attempts, last_error, next_attempt_at
+                FROM storage_uploads
+                WHERE status = ?
+                ORDER BY created_at
+            """, (status,))
+            rows = await cursor.fetchall()
+            return [dict(row) for row in rows]
+
+    async def update_upload_job(self, file_name: str, status: str, attempts: int,
+                                last_error: Optional[str] = None, next_attempt_at: float = 0):
+        """Record a failed upload attempt"""
+        async with self.pool.write() as db:
+            await db.execute("""
+                UPDATE storage_uploads
+                SET status = ?, attempts = ?, last_error = ?, next_attempt_at = ?,
+                    updated_at = STRFTIME('%Y-%m-%dT%H:%M:%fZ', 'now')
+                WHERE file_name = ?
+            """, (status, attempts, last_error, next_attempt_at, file_name))
+
+    async def delete_upload_job(self, file_name: str):
+        """Remove a completed upload from the journal"""
+        async with self.pool.write() as db:
+            await db.execute("DELETE FROM storage_uploads WHERE file_name = ?", (file_name,))
+
+    async def save_tool_confirmation(self, tool_call_id: str, session_id: str, tool_name: str,
+                                     created_at: float, expires_at: float):
+        """Record a tool call waiting for the user's confirmation"""
+        async with self.pool.write() as db:
+            await db.execute("""
+                INSERT OR REPLACE INTO tool_confirmations (tool_call_id, session_id, tool_name, confirmed, created_at, expires_at)
+                VALUES (?, ?, ?, NULL, ?, ?)
+            """, (tool_call_id, session_id, tool_name, created_at, expires_at))
+
+    async def resolve_tool_confirmation(self, tool_call_id: str, confirmed: bool, now: float) -> bool:
+        """Record the user's decision, False if the tool call isn't waiting (any more)"""
+        async with self.pool.write() as db:
+            cursor = await db.execute("""
+                UPDATE tool_confirmations
+                SET confirmed = ?
+                WHERE tool_call_id = ? AND confirmed IS NULL AND expires_at > ?
+            """, (int(confirmed), tool_call_id, now))
+            return cursor.rowcount > 0
+
+    async def get_tool_confirmation_decisions(self, tool_call_ids: List[str]) -> Dict[str, bool]:
+        """Decisions made so far for the given tool calls"""
+        if not tool_call_ids:
+            return {}
+        async with self.pool.read() as db:
+            cursor = await db.execute(f"""
+                SELECT tool_call_id, confirmed
+                FROM tool_confirmations
+                WHERE confirmed IS NOT NULL AND tool_call_id IN ({','.join('?' * len(tool_call_ids))})
+            """, tool_call_ids)
+            return {row['tool_call_id']: bool(row['confirmed']) for row in await cursor.fetchall()}
+
+    async def delete_tool_confirmation(self, tool_call_id: str):
+        """Forget a tool call that stopped waiting"""
+        async with self.pool.write() as db:
+            await db.execute("DELETE FROM tool_confirmations WHERE tool_call_id = ?", (tool_call_id,))
+
+    async def delete_expired_tool_confirmations(self, now: float) -> int:
+        """Remove tool calls past their deadline (left by stopped processes), returns how many"""
+        async with self.pool.write() as db:
+            cursor = await db.execute("DELETE FROM tool_confirmations WHERE expires_at <= ?", (now,))
+            return cursor.rowcount
 
     async def create_comfy_workflow(self, name: str, api_json: str, description: str, inputs: str, outputs: str = None):
         """Create a new comfy workflow"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.pool.write() as db:
             await db.execute("""
                 INSERT INTO comfy_workflows (name, api_json, description, inputs, outputs)
                 VALUES (?, ?, ?, ?, ?)
             """, (name, api_json, description, inputs, outputs))
-            await db.commit()
 
     async def list_comfy_workflows(self) -> List[Dict[str, Any]]:
         """List all comfy workflows"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = sqlite3.Row
+        async with self.pool.read() as db:
             cursor = await db.execute("SELECT id, name, description, api_json, inputs, outputs FROM comfy_workflows ORDER BY id DESC")
             rows = await cursor.fetchall()
             return [dict(row) for row in rows]
 
     async def delete_comfy_workflow(self, id: int):
         """Delete a comfy workflow"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.pool.write() as db:
             await db.execute("DELETE FROM comfy_workflows WHERE id = ?", (id,))
-            await db.commit()
 
     async def get_comfy_workflow(self, id: int):
         """Get comfy workflow dict"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = sqlite3.Row
+        async with self.pool.read() as db:
             cursor = await db.execute(
                 "SELECT api_json FROM comfy_workflows WHERE id = ?", (id,)
             )
@@ -0,0 +1,122 @@
+# services/file_index_service.py
+"""
+file_id -> remote storage path index
+
+Files uploaded to Supabase Storage live under `uploads/{file_id}` or
+`canvas/{canvas_id}/{file_id}`. When a file is not on local disk,
+/api/file/{file_id} looks its storage path up here instead of probing every
+canvas with HEAD requests. Lookups go through an in-process LRU in front of
+the `file_locations` table; entries are written whenever a file is uploaded
+to storage.
+
+Build the index for files stored before it existed (one-off), from the
+server directory:
+    python -m services.file_index_service backfill [--dry-run]
+"""
+
+import os
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from services.db_adapter import db_adapter
+
+
+class FileIndexService:
+    """Persistent file_id -> storage_path index with an LRU in front"""
+
+    def __init__(self, cache_size: int = 4096):
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+
+    def _remember(self, file_id: str, storage_path: str) -> None:
+        self._cache[file_id] = storage_path
+        self._cache.move_to_end(file_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def record(self, storage_path: str, file_id: Optional[str] = None) -> None:
+        """Record that a file was stored at storage_path (file_id defaults to its basename)"""
+        file_id = file_id or os.path.basename(storage_path)
+        await db_adapter.save_file_locations([(file_id, storage_path)])
+        self._remember(file_id, storage_path)
+
+    async def lookup(self, file_id: str) -> Optional[str]:
+        """Return the storage path of file_id, or None if it isn't indexed"""
+        storage_path = self._cache.get(file_id)
+        if storage_path is not None:
+            self._cache.move_to_end(file_id)
+            return storage_path
+        storage_path = await db_adapter.get_file_location(file_id)
+        if storage_path is not None:
+            self._remember(file_id, storage_path)
+        return storage_path
+
+
+def storage_path_from_url(url: str, bucket_name: str) -> Optional[str]:
+    """Extract the storage path from a Supabase public object URL"""
+    marker = f'/storage/v1/object/public/{bucket_name}/'
+    if not url or marker not in url:
+        return None
+    return url.split(marker, 1)[1].split('?', 1)[0] or None
+
+
+async def backfill_file_index(bucket_name: str, dry_run: bool = False) -> int:
+    """Index every storage-backed file referenced by existing canvases, plus chat
+    uploads when Supabase Storage is configured
+
+    Returns the number of files indexed.
+    """
+    from services.supabase_storage_service import supabase_storage
+
+    locations: List[Tuple[str, str]] = []
+    if supabase_storage.initialized:
+        uploads = await supabase_storage.list_files('uploads')
+        locations.extend((os.path.basename(path), path) for path in uploads)
+        print(f"🗂️ Found {len(uploads)} chat uploads in storage")
+
+    canvases = await db_adapter.list_canvases()
+    for canvas in canvases:
+        canvas_data = await db_adapter.get_canvas_data(canvas['id'])
+        files: Dict[str, Any] = ((canvas_data or {}).get('data') or {}).get('files') or {}
+        for file_data in files.values():
+            storage_path = storage_path_from_url(str(file_data.get('dataURL') or ''), bucket_name)
+            if storage_path:
+                locations.append((os.path.basename(storage_path), storage_path))
+
+    print(f"🗂️ Found {len(locations)} stored files in {len(canvases)} canvases")
+    if locations and not dry_run:
+        for i in range(0, len(locations), 500):
+            await db_adapter.save_file_locations(locations[i:i + 500])
+    return len(locations)
+
+
+file_index_service = FileIndexService()
+
+
+if __name__ == '__main__':
+    import argparse
+    import asyncio
+
+    parser = argparse.ArgumentParser(description="Maintain the file_id -> storage path index")
+    parser.add_argument('command', choices=['backfill'])
+    parser.add_argument('--bucket', default='images', help='Supabase Storage bucket name')
+    parser.add_argument('--dry-run', action='store_true', help='only count the files that would be indexed')
+    args = parser.parse_args()
+
+    async def main():
+        database_url = os.environ.get('SUPABASE_DATABASE_URL')
+        use_supabase = (os.environ.get('USE_SUPABASE', 'false').lower() == 'true'
+                        or os.environ.get('CLOUD_DEPLOYMENT', 'false').lower() == 'true')
+        if use_supabase and database_url:
+            await db_adapter.initialize_supabase(database_url)
+            from services.supabase_storage_service import supabase_storage
+            supabase_url = os.environ.get('SUPABASE_URL')
+            supabase_key = os.environ.get('SUPABASE_SERVICE_ROLE_KEY') or os.environ.get('SUPABASE_ANON_KEY')
+            if supabase_url and supabase_key:
+                supabase_storage.initialize(supabase_url, supabase_key, args.bucket)
+        try:
+            count = await backfill_file_index(args.bucket, dry_run=args.dry_run)
+            print(f"✅ {'Would index' if args.dry_run else 'Indexed'} {count} files")
+        finally:
+            await db_adapter.close()
+
+    asyncio.run(main())
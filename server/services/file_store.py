@@ -0,0 +1,255 @@
+# services/file_store.py
+"""
+Content-addressed store behind FILES_DIR
+
+Every file written to FILES_DIR (uploads, provider outputs, ComfyUI results,
+videos) keeps its random file_id name, so all the code serving or reading
+`FILES_DIR/{file_id}` is unchanged. Once written it is adopted by the store:
+
+- its bytes are hashed (sha256) and kept once under `FILES_DIR/blobs/ab/<hash>`
+- `FILES_DIR/{file_id}` becomes a hard link to that blob, so identical
+  uploads and regenerated outputs share their bytes
+- the `file_aliases` table maps file_id -> hash, `file_blobs` holds sizes and
+  the number of aliases of each blob (ref_count), updated by every alias
+  write; a blob is removed as soon as its last alias goes
+- both tables describe this machine's FILES_DIR, so they always live in the
+  local SQLite database, also when Supabase is the main store
+
+Garbage collection finds the file_ids still referenced by canvases or chat
+sessions, removes unreferenced aliases older than the grace period and the
+blobs left without aliases, and reports the bytes reclaimed and saved by
+deduplication. Run it from the server directory:
+    python -m services.file_store gc [--dry-run] [--grace-hours 24]
+
+Files written before the store existed are adopted by the first GC pass,
+their age for the grace period is their modification time.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+from services.config_service import FILES_DIR
+from services.db_adapter import db_adapter
+
+# Names that look like files anywhere in canvas data or chat messages
+_FILE_NAME_RE = re.compile(r'[A-Za-z0-9_-]+\.[A-Za-z0-9]{2,5}')
+# In-flight files, never adopted or collected
+_TEMP_SUFFIXES = ('.part', '.tmp', '.download', '.link', '.upload')
+
+
+def _parse_time(value: Any) -> float:
+    if not value:
+        return 0.0
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+
+
+class FileStore:
+    """Deduplicated blob storage for FILES_DIR, see the module docstring"""
+
+    def __init__(self, files_dir: str = FILES_DIR):
+        self.files_dir = files_dir
+        self.blobs_dir = os.path.join(files_dir, 'blobs')
+        self.stats = {'adopted': 0, 'deduplicated': 0, 'dedup_bytes': 0}
+
+    def blob_path(self, hash: str) -> str:
+        return os.path.join(self.blobs_dir, hash[:2], hash)
+
+    def _link_into_store(self, path: str) -> Tuple[str, int, bool]:
+        """Hash path and make it a link to its blob, returns (hash, size, deduplicated)"""
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        hash = digest.hexdigest()
+        size = os.path.getsize(path)
+        blob = self.blob_path(hash)
+
+        if os.path.exists(blob):
+            if os.path.samefile(blob, path):
+                return hash, size, False
+            # Same bytes already stored: swap our copy for a link to the blob
+            link_path = f"{path}.link"
+            try:
+                os.link(blob, link_path)
+                os.replace(link_path, path)
+                return hash, size, True
+            except OSError as e:
+                print(f"⚠️ Could not link {path} to its blob, keeping the copy: {e}")
+                return hash, size, False
+
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        try:
+            os.link(path, blob)
+        except OSError:
+            # No hard links on this filesystem, store a copy
+            tmp_path = f"{blob}.tmp"
+            shutil.copyfile(path, tmp_path)
+            os.replace(tmp_path, blob)
+        return hash, size, False
+
+    async def adopt(self, file_id: str) -> Optional[str]:
+        """Move a freshly written FILES_DIR/{file_id} into the store, returns its hash
+
+        Errors are logged and swallowed, the file stays usable either way.
+        """
+        path = os.path.join(self.files_dir, file_id)
+        try:
+            if not os.path.isfile(path):
+                return None
+            hash, size, deduplicated = await asyncio.to_thread(self._link_into_store, path)
+            orphan = await db_adapter.save_file_alias(file_id, hash, size)
+            if orphan:
+                # file_id was rewritten with new content, nothing else used the old bytes
+                await asyncio.to_thread(self._remove_blobs, [orphan])
+            self.stats['adopted'] += 1
+            if deduplicated:
+                self.stats['deduplicated'] += 1
+                self.stats['dedup_bytes'] += size
+                print(f"🧬 {file_id} has the same content as a stored file, deduplicated {size} bytes")
+            return hash
+        except Exception as e:
+            print(f"⚠️ Could not add {file_id} to the file store: {e}")
+            return None
+
+    async def adopt_path(self, path: str) -> Optional[str]:
+        """adopt() for a full path, files outside FILES_DIR are left alone"""
+        if os.path.dirname(os.path.abspath(path)) != os.path.abspath(self.files_dir):
+            return None
+        return await self.adopt(os.path.basename(path))
+
+    def _remove_blobs(self, hashes: List[str]) -> None:
+        for hash in hashes:
+            blob = self.blob_path(hash)
+            if os.path.exists(blob):
+                os.remove(blob)
+                if not os.listdir(os.path.dirname(blob)):
+                    os.rmdir(os.path.dirname(blob))
+
+    async def remove(self, file_id: str) -> None:
+        """Delete FILES_DIR/{file_id} and its alias, and its blob when nothing else shares it
+
+        For files that moved elsewhere (uploaded to remote storage).
+        """
+        path = os.path.join(self.files_dir, file_id)
+        if os.path.exists(path):
+            os.remove(path)
+        orphans = await db_adapter.delete_file_aliases([file_id])
+        await asyncio.to_thread(self._remove_blobs, [orphan['hash'] for orphan in orphans])
+
+    def _untracked_files(self, known: Set[str]) -> List[str]:
+        names = []
+        for entry in os.scandir(self.files_dir):
+            if entry.is_file() and entry.name not in known and not entry.name.endswith(_TEMP_SUFFIXES):
+                names.append(entry.name)
+        return names
+
+    async def _referenced_names(self) -> Dict[str, Set[str]]:
+        """file name -> ids of the canvases and sessions mentioning it"""
+        references: Dict[str, Set[str]] = {}
+
+        def collect(owner: str, data: Any) -> None:
+            for name in set(_FILE_NAME_RE.findall(json.dumps(data, ensure_ascii=False))):
+                references.setdefault(name, set()).add(owner)
+
+        for canvas in await db_adapter.list_canvases():
+            # Thumbnails saved as files (th_*) are only referenced from the canvas row
+            collect(f"canvas:{canvas['id']}", [canvas.get('thumbnail'), await db_adapter.get_canvas_data(canvas['id'])])
+            for session in await db_adapter.list_sessions(canvas['id']):
+                collect(f"session:{session['id']}", await db_adapter.get_chat_history(session['id']))
+        return references
+
+    async def collect_garbage(self, grace_seconds: float = 24 * 3600, dry_run: bool = False) -> Dict[str, Any]:
+        """Remove files no canvas or chat session references any more, returns a report"""
+        aliases = await db_adapter.list_file_aliases()
+        known = {alias['file_id'] for alias in aliases}
+        untracked = await asyncio.to_thread(self._untracked_files, known) if os.path.isdir(self.files_dir) else []
+        # Files written before the store existed are as old as their mtime, not their new alias
+        written_at = {file_id: os.path.getmtime(os.path.join(self.files_dir, file_id)) for file_id in untracked}
+        if untracked and not dry_run:
+            print(f"🧬 Adopting {len(untracked)} files written before the file store existed")
+            for file_id in untracked:
+                await self.adopt(file_id)
+            aliases = await db_adapter.list_file_aliases()
+
+        references = await self._referenced_names()
+        now = time.time()
+        size_by_hash: Dict[str, int] = {}
+        present_by_hash: Dict[str, int] = {}
+        garbage: List[Dict[str, Any]] = []
+        for alias in aliases:
+            hash = alias['hash']
+            size_by_hash[hash] = alias['size']
+            owners = references.get(alias['file_id'])
+            if os.path.exists(os.path.join(self.files_dir, alias['file_id'])):
+                present_by_hash[hash] = present_by_hash.get(hash, 0) + 1
+            created = written_at.get(alias['file_id']) or _parse_time(alias['created_at'])
+            if not owners and now - created > grace_seconds:
+                garbage.append(alias)
+
+        report: Dict[str, Any] = {
+            'aliases': len(aliases),
+            'blobs': len(size_by_hash),
+            'untracked_adopted': 0 if dry_run else len(untracked),
+            'unreferenced_files': len(garbage),
+            'removed_blobs': 0,
+            'reclaimed_bytes': 0,
+            # Bytes not stored twice thanks to the links, before this pass removes anything
+            'dedup_saved_bytes': sum((count - 1) * size_by_hash[hash] for hash, count in present_by_hash.items() if count > 1),
+            'dry_run': dry_run,
+        }
+
+        garbage_ids = {alias['file_id'] for alias in garbage}
+        garbage_hashes = {alias['hash'] for alias in garbage}
+        surviving = {alias['hash'] for alias in aliases if alias['file_id'] not in garbage_ids}
+        orphan_hashes = garbage_hashes - surviving
+        report['removed_blobs'] = len(orphan_hashes)
+        report['reclaimed_bytes'] = sum(size_by_hash[hash] for hash in orphan_hashes)
+        if dry_run:
+            return report
+
+        for alias in garbage:
+            path = os.path.join(self.files_dir, alias['file_id'])
+            if os.path.exists(path):
+                os.remove(path)
+        orphans = await db_adapter.delete_file_aliases([alias['file_id'] for alias in garbage]) if garbage else []
+        self._remove_blobs([orphan['hash'] for orphan in orphans])
+        print(f"🧹 File store GC: removed {len(garbage)} files and {len(orphans)} blobs, "
+              f"reclaimed {report['reclaimed_bytes']} bytes, deduplication saves {report['dedup_saved_bytes']} bytes")
+        return report
+
+
+# Shared by everything writing to FILES_DIR
+file_store = FileStore()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Maintain the content-addressed file store")
+    parser.add_argument('command', choices=['gc'])
+    parser.add_argument('--grace-hours', type=float, default=24.0,
+                        help='keep unreferenced files younger than this (they may be about to be used)')
+    parser.add_argument('--dry-run', action='store_true', help='only report what would be removed')
+    args = parser.parse_args()
+
+    async def main():
+        database_url = os.environ.get('SUPABASE_DATABASE_URL')
+        use_supabase = (os.environ.get('USE_SUPABASE', 'false').lower() == 'true'
+                        or os.environ.get('CLOUD_DEPLOYMENT', 'false').lower() == 'true')
+        if use_supabase and database_url:
+            await db_adapter.initialize_supabase(database_url)
+        try:
+            report = await file_store.collect_garbage(args.grace_hours * 3600, dry_run=args.dry_run)
+            print(json.dumps(report, indent=2))
+        finally:
+            await db_adapter.close()
+
+    asyncio.run(main())
@@ -0,0 +1,269 @@
+# services/image_variant_service.py
+"""
+Resized variants of stored images
+
+`/api/file/{file_id}?w=256&fmt=webp` serves a copy of the image scaled down to
+that width instead of the full original, for canvas thumbnails, the canvas
+list and previews. Variants are built on first request in the image worker
+pool and kept on disk under USER_DATA_DIR/cache/variants:
+
+- widths are rounded up to VARIANT_WIDTHS so a handful of sizes get cached
+- concurrent requests for the same variant share one build
+- the cache is bounded by IMAGE_VARIANT_CACHE_MB (default 1024), least
+  recently used variants are removed first
+
+File ids are never rewritten, so variant responses can be cached by browsers
+forever (`Cache-Control: immutable`), the ETag also covers the source's
+mtime and size in case a file is replaced by hand.
+"""
+
+import asyncio
+import base64
+import binascii
+import hashlib
+import os
+import threading
+from email.utils import formatdate
+from typing import Any, Dict, Optional, Tuple
+from services.config_service import FILES_DIR, USER_DATA_DIR
+from services.file_index_service import file_index_service
+from services.file_store import file_store
+from services.supabase_storage_service import supabase_storage
+from services.upload_queue_service import upload_queue
+from utils.download import download_to_file
+from utils.image_output import save_variant
+from utils.image_worker import image_worker
+
+VARIANT_WIDTHS = (64, 128, 256, 384, 512, 768, 1024, 1536, 2048)
+# fmt query value -> (extension, mime type)
+VARIANT_FORMATS = {
+    'webp': ('webp', 'image/webp'),
+    'avif': ('avif', 'image/avif'),
+    'jpeg': ('jpg', 'image/jpeg'),
+    'jpg': ('jpg', 'image/jpeg'),
+    'png': ('png', 'image/png'),
+}
+DEFAULT_VARIANT_FORMAT = 'webp'
+# Width the canvas list asks for when showing thumbnails
+THUMBNAIL_WIDTH = 512
+
+
+class ImageVariant:
+    """A built variant on disk, with the headers to serve it"""
+
+    def __init__(self, path: str, media_type: str, etag: str, last_modified: float):
+        self.path = path
+        self.media_type = media_type
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def headers(self) -> Dict[str, str]:
+        return {
+            'ETag': self.etag,
+            'Last-Modified': formatdate(self.last_modified, usegmt=True),
+            'Cache-Control': 'public, max-age=31536000, immutable',
+        }
+
+
+def variant_width(width: int) -> int:
+    """Round a requested width up to the next cached size"""
+    for size in VARIANT_WIDTHS:
+        if width <= size:
+            return size
+    return VARIANT_WIDTHS[-1]
+
+
+class ImageVariantService:
+    """Builds and caches resized variants of the files in FILES_DIR"""
+
+    def __init__(self, files_dir: str = FILES_DIR, cache_dir: Optional[str] = None,
+                 max_bytes: Optional[int] = None, quality: int = 80):
+        self.files_dir = files_dir
+        self.cache_dir = cache_dir or os.path.join(USER_DATA_DIR, 'cache', 'variants')
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get('IMAGE_VARIANT_CACHE_MB', 1024)) * 1024 * 1024)
+        self.max_bytes = max_bytes
+        self.quality = quality
+        self._inflight: Dict[str, 'asyncio.Future[ImageVariant]'] = {}
+        # Cache size is measured once, then tracked as variants are added and evicted
+        self._cache_bytes: Optional[int] = None
+        self._evict_lock = threading.Lock()
+        self.stats = {'hits': 0, 'builds': 0, 'shared': 0, 'errors': 0, 'evictions': 0}
+
+    def _variant_path(self, file_id: str, version: str, width: int, fmt: str) -> Tuple[str, str]:
+        extension, _ = VARIANT_FORMATS[fmt]
+        key = hashlib.sha1(f"{file_id}|{version}|{width}|{extension}".encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], f"{key}.{extension}"), key
+
+    async def get_variant(self, file_id: str, width: int, fmt: Optional[str] = None,
+                          source_url: Optional[str] = None) -> Optional[ImageVariant]:
+        """Return the variant of file_id, building it if needed
+
+        source_url is downloaded when the file isn't in FILES_DIR (stored in
+        Supabase). Returns None when the file is in neither place.
+        """
+        fmt = (fmt or DEFAULT_VARIANT_FORMAT).lower()
+        if fmt not in VARIANT_FORMATS:
+            raise ValueError(f"Unsupported variant format {fmt!r}, expected one of {', '.join(VARIANT_FORMATS)}")
+        width = variant_width(width)
+        source_path = os.path.join(self.files_dir, file_id)
+        try:
+            stat = os.stat(source_path)
+            version = f"{stat.st_mtime_ns}:{stat.st_size}"
+            last_modified = stat.st_mtime
+        except OSError:
+            if not source_url:
+                return None
+            stat = None
+            version = 'remote'
+            last_modified = 0.0
+
+        path, key = self._variant_path(file_id, version, width, fmt)
+        media_type = VARIANT_FORMATS[fmt][1]
+        etag = f'"{key[:20]}"'
+        if os.path.exists(path):
+            self.stats['hits'] += 1
+            # Keep recently served variants at the end of the eviction order
+            os.utime(path)
+            return ImageVariant(path, media_type, etag, last_modified or os.path.getmtime(path))
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.stats['shared'] += 1
+            return await asyncio.shield(inflight)
+
+        future: 'asyncio.Future[ImageVariant]' = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if stat is None:
+                # Fetch the original next to the variant, removed once built
+                download_path = f"{path}.download"
+                try:
+                    await download_to_file(source_url, download_path)
+                    await image_worker.run('save_variant', save_variant, download_path, path, width, fmt, self.quality)
+                finally:
+                    if os.path.exists(download_path):
+                        os.remove(download_path)
+            else:
+                await image_worker.run('save_variant', save_variant, source_path, path, width, fmt, self.quality)
+            self.stats['builds'] += 1
+            await asyncio.to_thread(self._account, os.path.getsize(path))
+            variant = ImageVariant(path, media_type, etag, last_modified or os.path.getmtime(path))
+            future.set_result(variant)
+            return variant
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            self.stats['errors'] += 1
+            future.set_exception(e)
+            # Nobody else waiting: don't leave the exception unretrieved
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def _account(self, added_bytes: int) -> None:
+        """Track the cache size and evict the least recently used variants past max_bytes"""
+        with self._evict_lock:
+            if self._cache_bytes is None:
+                self._cache_bytes = sum(size for _, size, _ in self._scan())
+            else:
+                self._cache_bytes += added_bytes
+            if self._cache_bytes <= self.max_bytes:
+                return
+            # Down to 90% so we don't evict on every build
+            target = self.max_bytes * 0.9
+            for path, size, _ in sorted(self._scan(), key=lambda entry: entry[2]):
+                if self._cache_bytes <= target:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                self._cache_bytes -= size
+                self.stats['evictions'] += 1
+
+    def _scan(self):
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.is_file() and not entry.name.endswith(('.tmp', '.download', '.part')):
+                    stat = entry.stat()
+                    yield entry.path, stat.st_size, stat.st_mtime
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            'inflight': len(self._inflight),
+            'cache_bytes': self._cache_bytes,
+            'max_bytes': self.max_bytes,
+        }
+
+
+def thumbnail_url(url: Optional[str], width: int = THUMBNAIL_WIDTH) -> Optional[str]:
+    """Point an /api/file URL at its thumbnail-sized variant, other URLs are returned as is"""
+    if not url or '/api/file/' not in url or '?' in url:
+        return url
+    return f"{url}?w={width}&fmt={DEFAULT_VARIANT_FORMAT}"
+
+
+# data: URL subtype -> (stored extension, leading bytes of such a file); anything
+# else (svg, html, ...) stays inline rather than being served from /api/file
+_THUMBNAIL_TYPES: Dict[str, Tuple[str, Tuple[bytes, ...]]] = {
+    'png': ('png', (b'\x89PNG\r\n\x1a\n',)),
+    'jpeg': ('jpg', (b'\xff\xd8\xff',)),
+    'jpg': ('jpg', (b'\xff\xd8\xff',)),
+    'webp': ('webp', (b'RIFF',)),
+}
+
+
+async def store_inline_thumbnail(thumbnail: Optional[str], backend_url: str) -> Optional[str]:
+    """Write a data: URL thumbnail to FILES_DIR and return its /api/file URL
+
+    The canvas list would otherwise carry every pasted image's full bytes
+    inline. Thumbnails with the same content map to the same file. Only
+    PNG, JPEG and WebP whose bytes match their type are stored, other
+    thumbnails are returned unchanged. With Supabase Storage configured the
+    file is uploaded through the upload queue, so every instance can serve it.
+    """
+    if not thumbnail or not thumbnail.startswith('data:image/') or ';base64,' not in thumbnail:
+        return thumbnail
+    header, b64_data = thumbnail.split(';base64,', 1)
+    thumbnail_type = _THUMBNAIL_TYPES.get(header[len('data:image/'):].lower())
+    if thumbnail_type is None:
+        return thumbnail
+    extension, signatures = thumbnail_type
+    try:
+        data = base64.b64decode(b64_data, validate=True)
+    except (binascii.Error, ValueError):
+        return thumbnail
+    if not data.startswith(signatures) or (extension == 'webp' and data[8:12] != b'WEBP'):
+        return thumbnail
+
+    file_id = f"th_{hashlib.sha256(data).hexdigest()[:20]}.{extension}"
+    file_path = os.path.join(FILES_DIR, file_id)
+    if os.path.exists(file_path) or (supabase_storage.initialized and await file_index_service.lookup(file_id)):
+        return f"{backend_url}/api/file/{file_id}"
+
+    tmp_path = f"{file_path}.tmp"
+
+    def write() -> None:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, file_path)
+    await asyncio.to_thread(write)
+    await file_store.adopt(file_id)
+    if supabase_storage.initialized:
+        try:
+            # Served locally until uploaded, then /api/file redirects to storage through the file index
+            await upload_queue.enqueue(file_id, f"thumbnails/{file_id}")
+        except Exception as e:
+            print(f"❌ Failed to queue thumbnail upload to Supabase Storage, keeping the local file: {e}")
+    return f"{backend_url}/api/file/{file_id}"
+
+
+# Shared by the file router and anything listing thumbnails
+image_variants = ImageVariantService()
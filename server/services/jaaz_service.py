@@ -1,10 +1,10 @@
 # services/OpenAIAgents_service/jaaz_service.py
 
-import asyncio
 import aiohttp
 from typing import Dict, Any, Optional, List
 from utils.http_client import HttpClient
 from services.config_service import config_service
+from services.jaaz_task_watcher import jaaz_task_watcher
 
 
 class JaazService:
@@ -152,8 +152,8 @@ class JaazService:
 
         Args:
             task_id: 任务 ID
-            max_attempts: 最大轮询次数
-            interval: 轮询间隔（秒）
+            max_attempts: 最大轮询次数（与 interval 一起决定总等待时间）
+            interval: 轮询间隔（秒），小于默认退避上限时作为上限
 
         Returns:
             Dict[str, Any]: 任务结果
@@ -164,40 +164,15 @@ class JaazService:
         max_attempts = max_attempts or 150  # 默认最多轮询 150 次
         interval = interval or 2.0  # 默认轮询间隔 2 秒
 
-        async with HttpClient.create_aiohttp() as session:
-            for _ in range(max_attempts):
-                async with session.get(
-                    f"{self.api_url}/task/{task_id}",
-                    headers=self._build_headers(),
-                    timeout=aiohttp.ClientTimeout(total=20.0)
-                ) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        if data.get('success') and data.get('data', {}).get('found'):
-                            task = data['data']['task']
-                            status = task.get('status')
-
-                            if status == 'succeeded':
-                                print(
-                                    f"✅ Task {task_id} completed successfully")
-                                return task
-                            elif status == 'failed':
-                                error_msg = task.get('error', 'Unknown error')
-                                raise Exception(f"Task failed: {error_msg}")
-                            elif status == 'cancelled':
-                                raise Exception("Task was cancelled")
-                            elif status == 'processing':
-                                # 继续轮询
-                                await asyncio.sleep(interval)
-                                continue
-                            else:
-                                raise Exception(f"Unknown task status: {status}")
-                        else:
-                            raise Exception("Task not found")
-                    else:
-                        raise Exception(f"Failed to get task status: HTTP {response.status}")
-
-            raise Exception(f"Task polling timeout after {max_attempts} attempts")
+        # 由中央 watcher 统一轮询：间隔从 0.5 秒指数退避到 1.5 秒（不超过 interval），
+        # 总等待时间与原来的 max_attempts * interval 相同
+        return await jaaz_task_watcher.wait(
+            self.api_url,
+            self._build_headers(),
+            task_id,
+            timeout=max_attempts * interval,
+            max_interval=min(interval, jaaz_task_watcher.max_interval),
+        )
 
     async def generate_magic_image(self, image_content: str) -> Optional[Dict[str, Any]]:
         """
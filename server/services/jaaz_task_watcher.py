@@ -0,0 +1,244 @@
+# services/jaaz_task_watcher.py
+"""
+Central watcher for Jaaz cloud tasks
+
+Every JaazService.poll_for_task_completion call used to run its own loop,
+sleeping a fixed interval between GET /task/{id} requests. The watcher keeps
+all outstanding task ids in one place and polls them from a single loop:
+
+- each task is polled with exponential backoff, starting at `min_interval`
+  and growing by `backoff` up to `max_interval`; the cap stays below the
+  previous fixed 2 s interval, so completion is never noticed later than
+  before, short tasks are noticed sooner
+- tasks due in the same tick are queried together: one POST /task/batch per
+  Jaaz server and credentials when it supports it, otherwise concurrent
+  GET /task/{id} over the shared keep-alive session; with batches the
+  request count no longer grows with the number of tasks
+- waiters await a future; several waiters on the same task share one
+
+Batch status request/response (falls back to per-task GETs, for good, on
+any other answer than 200 from that server):
+
+    POST {api_url}/task/batch  {"task_ids": ["t1", "t2"]}
+    -> {"success": true, "data": {"tasks": [{"id": "t1", "status": ...}, ...]}}
+"""
+
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import aiohttp
+from utils.http_client import HttpClient
+
+class _WatchedTask:
+    __slots__ = ('task_id', 'api_url', 'headers', 'future', 'interval', 'max_interval', 'next_poll', 'deadline', 'waiters')
+
+    def __init__(self, task_id: str, api_url: str, headers: Dict[str, str], future: 'asyncio.Future[Dict[str, Any]]',
+                 interval: float, max_interval: float, deadline: float):
+        self.task_id = task_id
+        self.api_url = api_url
+        self.headers = headers
+        self.future = future
+        self.interval = interval
+        self.max_interval = max_interval
+        self.next_poll = time.monotonic() + interval
+        self.deadline = deadline
+        self.waiters = 0
+
+
+class JaazTaskWatcher:
+    """Multiplex Jaaz task status polling through one loop"""
+
+    def __init__(self, min_interval: float = 0.5, max_interval: float = 1.5, backoff: float = 1.5,
+                 batch_size: int = 50, coalesce_window: float = 0.25):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        # Tasks due within this many seconds are polled in the same tick (and batch)
+        self.coalesce_window = coalesce_window
+        self.batch_size = batch_size
+        self._tasks: Dict[Tuple[str, str], _WatchedTask] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop_task: Optional['asyncio.Task[None]'] = None
+        # api_url -> whether POST /task/batch is available (unknown until tried)
+        self._batch_supported: Dict[str, bool] = {}
+        self.stats = {'status_requests': 0, 'batch_requests': 0, 'tasks_completed': 0}
+
+    async def wait(self, api_url: str, headers: Dict[str, str], task_id: str,
+                   timeout: float, max_interval: Optional[float] = None) -> Dict[str, Any]:
+        """Wait until the task reaches a terminal status
+
+        Returns the task on success, raises on failure, cancellation or timeout.
+        """
+        max_interval = max_interval or self.max_interval
+        key = (api_url, task_id)
+        watched = self._tasks.get(key)
+        if watched is None or watched.future.done():
+            loop = asyncio.get_running_loop()
+            watched = _WatchedTask(
+                task_id, api_url, headers, loop.create_future(),
+                interval=min(self.min_interval, max_interval),
+                max_interval=max_interval,
+                deadline=time.monotonic() + timeout,
+            )
+            self._tasks[key] = watched
+            self._ensure_loop()
+        # Shield so one cancelled waiter doesn't cancel the task for the others
+        watched.waiters += 1
+        try:
+            return await asyncio.shield(watched.future)
+        finally:
+            watched.waiters -= 1
+            if watched.waiters == 0 and not watched.future.done():
+                # Nobody is waiting any more, stop polling it
+                watched.future.cancel()
+                if self._tasks.get(key) is watched:
+                    del self._tasks[key]
+
+    def _ensure_loop(self) -> None:
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        if self._loop_task is None or self._loop_task.done():
+            self._loop_task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        assert self._wakeup is not None
+        while self._tasks:
+            now = time.monotonic()
+            due: List[_WatchedTask] = []
+            for key, watched in list(self._tasks.items()):
+                if watched.future.done():
+                    del self._tasks[key]
+                elif now >= watched.deadline:
+                    del self._tasks[key]
+                    watched.future.set_exception(Exception(f"Task polling timeout for {watched.task_id}"))
+                elif now >= watched.next_poll - min(self.coalesce_window, watched.interval / 2):
+                    due.append(watched)
+
+            if due:
+                # A batch is sent with one set of headers, so tasks of different credentials don't share it
+                by_server: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], List[_WatchedTask]] = {}
+                for watched in due:
+                    by_server.setdefault((watched.api_url, tuple(sorted(watched.headers.items()))), []).append(watched)
+                await asyncio.gather(*[
+                    self._poll_server(api_url, tasks[i:i + self.batch_size])
+                    for (api_url, _), tasks in by_server.items()
+                    for i in range(0, len(tasks), self.batch_size)
+                ])
+                continue
+
+            if not self._tasks:
+                break
+            next_poll = min(min(w.next_poll, w.deadline) for w in self._tasks.values())
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(next_poll - time.monotonic(), 0))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _poll_server(self, api_url: str, tasks: List[_WatchedTask]) -> None:
+        headers = tasks[0].headers
+        try:
+            results = None
+            if len(tasks) > 1 and self._batch_supported.get(api_url, True):
+                results = await self._query_batch(api_url, headers, [t.task_id for t in tasks])
+            if results is None:
+                responses = await asyncio.gather(
+                    *[self._query_one(api_url, t.headers, t.task_id) for t in tasks],
+                    return_exceptions=True,
+                )
+                results = {}
+                for watched, response in zip(tasks, responses):
+                    if isinstance(response, (aiohttp.ClientError, asyncio.TimeoutError)):
+                        print(f"⚠️ Jaaz task {watched.task_id} status query failed, retrying: {response}")
+                    elif isinstance(response, Exception):
+                        self._settle(watched, error=response)
+                    else:
+                        results[watched.task_id] = response
+        except Exception as e:
+            # Network hiccup: keep watching, retry on the next backoff step
+            print(f"⚠️ Jaaz task status query failed, retrying: {e}")
+            results = {}
+
+        for watched in tasks:
+            if watched.future.done():
+                continue
+            if watched.task_id in results:
+                task = results[watched.task_id]
+                if task is None:
+                    self._settle(watched, error=Exception("Task not found"))
+                    continue
+                status = task.get('status')
+                if status == 'succeeded':
+                    print(f"✅ Task {watched.task_id} completed successfully")
+                    self._settle(watched, result=task)
+                    continue
+                if status == 'failed':
+                    self._settle(watched, error=Exception(f"Task failed: {task.get('error', 'Unknown error')}"))
+                    continue
+                if status == 'cancelled':
+                    self._settle(watched, error=Exception("Task was cancelled"))
+                    continue
+                if status != 'processing':
+                    self._settle(watched, error=Exception(f"Unknown task status: {status}"))
+                    continue
+            watched.interval = min(watched.interval * self.backoff, watched.max_interval)
+            watched.next_poll = time.monotonic() + watched.interval
+
+    def _settle(self, watched: _WatchedTask, result: Optional[Dict[str, Any]] = None,
+                error: Optional[BaseException] = None) -> None:
+        self._tasks.pop((watched.api_url, watched.task_id), None)
+        if watched.future.done():
+            return
+        self.stats['tasks_completed'] += 1
+        if error is not None:
+            watched.future.set_exception(error)
+        else:
+            watched.future.set_result(result or {})
+
+    async def _query_one(self, api_url: str, headers: Dict[str, str], task_id: str) -> Optional[Dict[str, Any]]:
+        self.stats['status_requests'] += 1
+        async with HttpClient.create_aiohttp(url=api_url) as session:
+            async with session.get(
+                f"{api_url}/task/{task_id}",
+                headers=headers,
+                timeout=aiohttp.ClientTimeout(total=20.0)
+            ) as response:
+                if response.status != 200:
+                    raise Exception(f"Failed to get task status: HTTP {response.status}")
+                data = await response.json()
+                if data.get('success') and data.get('data', {}).get('found'):
+                    return data['data']['task']
+                return None
+
+    async def _query_batch(self, api_url: str, headers: Dict[str, str], task_ids: List[str]) -> Optional[Dict[str, Optional[Dict[str, Any]]]]:
+        """Batch status query, None if the server doesn't support it"""
+        self.stats['batch_requests'] += 1
+        async with HttpClient.create_aiohttp(url=api_url) as session:
+            async with session.post(
+                f"{api_url}/task/batch",
+                headers=headers,
+                json={'task_ids': task_ids},
+                timeout=aiohttp.ClientTimeout(total=20.0)
+            ) as response:
+                if response.status != 200:
+                    # Servers without the route answer 404/405, but also 400, 422 or 5xx;
+                    # one that already served batches only falls back for this tick
+                    if not self._batch_supported.get(api_url):
+                        print(f"ℹ️ Jaaz batch task status not available from {api_url} (HTTP {response.status}), "
+                              f"polling tasks one by one")
+                        self._batch_supported[api_url] = False
+                    return None
+                try:
+                    data = await response.json(content_type=None)
+                    tasks = {task.get('id'): task for task in data.get('data', {}).get('tasks', [])}
+                except (ValueError, AttributeError, TypeError):
+                    print(f"ℹ️ Unexpected Jaaz batch task status response from {api_url}, polling tasks one by one")
+                    self._batch_supported[api_url] = False
+                    return None
+                self._batch_supported[api_url] = True
+                return {task_id: tasks.get(task_id) for task_id in task_ids}
+
+
+# Process-wide watcher shared by all JaazService instances
+jaaz_task_watcher = JaazTaskWatcher()
@@ -1,43 +1,73 @@
 # type: ignore[import]
+import asyncio
 import traceback
 from typing import Optional, List, Dict, Any, Callable, Awaitable
 from langchain_core.messages import AIMessageChunk, ToolCall, convert_to_openai_messages, ToolMessage
-from langgraph.graph import StateGraph
+from langgraph.graph.state import CompiledStateGraph
+from services.message_sync_service import MessageSync, add_message_sync, remove_message_sync
+from .delta_coalescer import DeltaCoalescer
 import json
 
 
 class StreamProcessor:
     """流式处理器 - 负责处理智能体的流式输出"""
 
-    def __init__(self, session_id: str, db_service: Any, websocket_service: Callable[[str, Dict[str, Any]], Awaitable[None]]):
+    def __init__(self, session_id: str, db_service: Any, websocket_service: Callable[[str, Dict[str, Any]], Awaitable[None]], flush_every: int = 8):
         self.session_id = session_id
         self.db_service = db_service
         self.websocket_service = websocket_service
         self.tool_calls: List[ToolCall] = []
         self.last_saved_message_index = 0
         self.last_streaming_tool_call_id: Optional[str] = None
-
-    async def process_stream(self, swarm: StateGraph, messages: List[Dict[str, Any]], context: Dict[str, Any]) -> None:
+        # 写入缓冲：新消息先攒起来，每 flush_every 条或流结束时一次事务写入
+        self.flush_every = flush_every
+        self.pending_messages: List[Dict[str, Any]] = []
+        # 增量同步：只向前端发送新增或变化的消息
+        self.message_sync = MessageSync(session_id)
+        self.seed_history = True
+        # 合并逐 token 的 delta / tool_call_arguments 事件，其他事件发送前先冲刷
+        self.coalescer = DeltaCoalescer(session_id, websocket_service)
+
+    async def process_stream(self, compiled_swarm: CompiledStateGraph, messages: List[Dict[str, Any]], context: Dict[str, Any],
+                             active_agent: Optional[str] = None, seed_history: bool = True) -> None:
         """处理整个流式响应
 
         Args:
-            swarm: 智能体群组
+            compiled_swarm: 编译好的智能体群组（由 swarm_cache 复用）
             messages: 消息列表
             context: 上下文信息
+            active_agent: 从哪个智能体开始，默认为群组的默认智能体
+            seed_history: messages 与数据库中的历史逐条对应时为 True，前端按数据库下标应用增量；
+                否则（历史修复删除了消息）本轮第一个 values chunk 发送完整快照
         """
         self.last_saved_message_index = len(messages) - 1
+        # 前端已有这段历史（或按页加载），本轮只发送新增消息
+        self.seed_history = seed_history
+        if seed_history:
+            self.message_sync.seed(messages)
 
-        compiled_swarm = swarm.compile()
+        swarm_input: Dict[str, Any] = {"messages": messages}
+        if active_agent:
+            swarm_input["active_agent"] = active_agent
 
-        async for chunk in compiled_swarm.astream(
-            {"messages": messages},
-            config=context,
-            stream_mode=["messages", "custom", 'values']
-        ):
-            await self._handle_chunk(chunk)
+        add_message_sync(self.session_id, self.message_sync)
+        try:
+            async for chunk in compiled_swarm.astream(
+                swarm_input,
+                config=context,
+                stream_mode=["messages", "custom", 'values']
+            ):
+                await self._handle_chunk(chunk)
+        finally:
+            # 流结束、出错或被取消时都要把缓冲的消息落库；shield 防止二次取消打断写入
+            remove_message_sync(self.session_id, self.message_sync)
+            await asyncio.shield(self._flush_messages())
+            await self.coalescer.flush()
+            print(f'📨 Session {self.session_id} websocket deltas: '
+                  f'{self.coalescer.events_in} in, {self.coalescer.events_out} out')
 
         # 发送完成事件
-        await self.websocket_service(self.session_id, {
+        await self.coalescer.send_event({
             'type': 'done'
         })
 
@@ -66,27 +96,44 @@ class StreamProcessor:
                     continue
                 cleaned_messages.append(msg)
             
-            oai_messages = convert_to_openai_messages(cleaned_messages)
-            # 确保 oai_messages 是列表类型
-            if not isinstance(oai_messages, list):
-                oai_messages = [oai_messages] if oai_messages else []
+            if not self.seed_history and self.message_sync.seq == 0:
+                # 下标与数据库历史对不上，先发完整快照，之后只发送增量
+                event = self.message_sync.snapshot(cleaned_messages)
+                oai_messages = event['messages']
+            else:
+                oai_messages, event = self.message_sync.diff(cleaned_messages)
 
         except Exception as e:
             print(f"❌ Error converting messages to OpenAI format: {e}")
             print(f"🔍 Problematic messages: {all_messages}")
-            # 使用空列表作為後備
+            # 转换失败时不推送，前端保留现有消息
             oai_messages = []
+            event = None
 
-        # 发送所有消息到前端
-        await self.websocket_service(self.session_id, {
-            'type': 'all_messages',
-            'messages': oai_messages
-        })
+        if event:
+            await self.coalescer.send_event(event)
 
-        # 保存新消息到数据库
+        # 新消息放入写入缓冲，攒够一批再保存到数据库
         for i in range(self.last_saved_message_index + 1, len(oai_messages)):
-            new_message = oai_messages[i]
-            if len(oai_messages) > 0:  # 确保有消息才保存
+            self.pending_messages.append(oai_messages[i])
+            self.last_saved_message_index = i
+
+        if len(self.pending_messages) >= self.flush_every:
+            await self._flush_messages()
+
+    async def _flush_messages(self) -> None:
+        """把缓冲的新消息在一个事务中写入数据库"""
+        if not self.pending_messages:
+            return
+
+        batch = self.pending_messages
+        self.pending_messages = []
+        try:
+            await self.db_service.create_messages(self.session_id, batch)
+        except Exception as e:
+            print(f"❌ Error saving {len(batch)} messages to database: {e}")
+            # 批量写入失败时逐条重试，避免一条坏消息拖累整批
+            for new_message in batch:
                 try:
                     await self.db_service.create_message(
                         self.session_id,
@@ -96,7 +143,6 @@ class StreamProcessor:
                 except Exception as e:
                     print(f"❌ Error saving message to database: {e}")
                     print(f"🔍 Problematic message: {new_message}")
-            self.last_saved_message_index = i
 
     async def _handle_message_chunk(self, ai_message_chunk: AIMessageChunk) -> None:
         """处理消息类型的 chunk"""
@@ -114,7 +160,7 @@ class StreamProcessor:
                     
                     oai_message = convert_to_openai_messages([ai_message_chunk])[0]
                     print('👇toolcall res oai_message', oai_message)
-                    await self.websocket_service(self.session_id, {
+                    await self.coalescer.send_event({
                         'type': 'tool_call_result',
                         'id': ai_message_chunk.tool_call_id,
                         'message': oai_message
@@ -124,10 +170,14 @@ class StreamProcessor:
                     print(f"🔍 Problematic ToolMessage: {ai_message_chunk}")
             elif content:
                 # 发送文本内容
-                await self.websocket_service(self.session_id, {
-                    'type': 'delta',
-                    'text': content
-                })
+                if isinstance(content, str):
+                    await self.coalescer.add_delta(content)
+                else:
+                    # 非纯文本内容（如内容块列表）无法拼接，直接发送
+                    await self.coalescer.send_event({
+                        'type': 'delta',
+                        'text': content
+                    })
             elif hasattr(ai_message_chunk, 'tool_calls') and ai_message_chunk.tool_calls and ai_message_chunk.tool_calls[0].get('name'):
                 # 处理工具调用
                 await self._handle_tool_calls(ai_message_chunk.tool_calls)
@@ -165,7 +215,7 @@ class StreamProcessor:
                     f'🔄 Tool {tool_name} requires confirmation, skipping StreamProcessor event')
                 continue
             else:
-                await self.websocket_service(self.session_id, {
+                await self.coalescer.send_event({
                     'type': 'tool_call',
                     'id': tool_call.get('id'),
                     'name': tool_name,
@@ -180,10 +230,9 @@ class StreamProcessor:
                 self.last_streaming_tool_call_id = tool_call_chunk.get('id')
             else:
                 if self.last_streaming_tool_call_id:
-                    await self.websocket_service(self.session_id, {
-                        'type': 'tool_call_arguments',
-                        'id': self.last_streaming_tool_call_id,
-                        'text': tool_call_chunk.get('args')
-                    })
+                    await self.coalescer.add_tool_call_arguments(
+                        self.last_streaming_tool_call_id,
+                        tool_call_chunk.get('args') or ''
+                    )
                 else:
                     print('🟠no last_streaming_tool_call_id', tool_call_chunk)
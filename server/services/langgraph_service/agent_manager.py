@@ -6,6 +6,7 @@ from models.tool_model import ToolInfoJson
 from services.langgraph_service.configs.image_vide_creator_config import ImageVideoCreatorAgentConfig
 from .configs import PlannerAgentConfig, create_handoff_tool, BaseAgentConfig
 from services.tool_service import tool_service
+from .context_window import chat_context
 
 
 class AgentManager:
@@ -91,11 +92,13 @@ class AgentManager:
                 business_tools.append(tool)
 
         # 创建并返回 LangGraph 智能体
+        # pre_model_hook 控制每次调用模型的输入：去掉旧图片数据、超出预算时用摘要替换最早的轮次
         return create_react_agent(
             name=config.name,
             model=model,
             tools=[*business_tools, *handoff_tools],
-            prompt=config.system_prompt
+            prompt=config.system_prompt,
+            pre_model_hook=chat_context.pre_model_hook(model)
         )
 
     @staticmethod
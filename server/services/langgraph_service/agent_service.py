@@ -2,14 +2,13 @@ from models.tool_model import ToolInfoJson
 from services.db_adapter import db_adapter
 from .StreamProcessor import StreamProcessor
 from .agent_manager import AgentManager
+from .model_registry import chat_models
+from .swarm_cache import swarm_cache, swarm_key
 import traceback
-from utils.http_client import HttpClient
 from langgraph_swarm import create_swarm  # type: ignore
-from langchain_openai import ChatOpenAI
-from langchain_ollama import ChatOllama
 from services.websocket_service import send_to_websocket  # type: ignore
 from services.config_service import config_service
-from typing import Optional, List, Dict, Any, cast, Set, TypedDict
+from typing import Optional, List, Dict, Any, cast, Set, Tuple, TypedDict
 from models.config_model import ModelInfo
 
 
@@ -116,28 +115,19 @@ async def langgraph_multi_agent(
         # 0. 修复消息历史
         fixed_messages = _fix_chat_history(messages)
 
-        # 2. 文本模型
-        text_model_instance = _create_text_model(text_model)
-
-        # 3. 创建智能体
-        agents = AgentManager.create_agents(
-            text_model_instance,
-            tool_list,  # 传入所有注册的工具
-            system_prompt or ""
+        # 2-4. 文本模型、智能体和群组只依赖配置，编译结果由 swarm_cache 复用
+        api_key = config_service.app_config.get(  # type: ignore
+            text_model.get('provider'), {}).get("api_key", "")
+        compiled_swarm, agent_names = swarm_cache.get_or_build(
+            swarm_key(text_model, api_key, tool_list, system_prompt),
+            lambda: _build_swarm(text_model, tool_list, system_prompt),
         )
-        agent_names = [agent.name for agent in agents]
         print('👇agent_names', agent_names)
         last_agent = AgentManager.get_last_active_agent(
             fixed_messages, agent_names)
 
         print('👇last_agent', last_agent)
 
-        # 4. 创建智能体群组
-        swarm = create_swarm(
-            agents=agents,  # type: ignore
-            default_active_agent=last_agent if last_agent else agent_names[0]
-        )
-
         # 5. 创建上下文
         context = {
             'canvas_id': canvas_id,
@@ -148,54 +138,35 @@ async def langgraph_multi_agent(
         # 6. 流处理
         processor = StreamProcessor(
             session_id, db_adapter, send_to_websocket)  # type: ignore
-        await processor.process_stream(swarm, fixed_messages, context)
+        # Deltas use the indices of the stored history, which no longer hold if the fix dropped messages
+        await processor.process_stream(compiled_swarm, fixed_messages, context, last_agent,
+                                       seed_history=len(fixed_messages) == len(messages))
 
     except Exception as e:
         await _handle_error(e, session_id)
 
 
-def _create_text_model(text_model: ModelInfo) -> Any:
-    """创建语言模型实例"""
-    model = text_model.get('model')
-    provider = text_model.get('provider')
-    url = text_model.get('url')
-    api_key = config_service.app_config.get(  # type: ignore
-        provider, {}).get("api_key", "")
-
-    # TODO: Verify if max token is working
-    # max_tokens = text_model.get('max_tokens', 8148)
+def _build_swarm(
+    text_model: ModelInfo,
+    tool_list: List[ToolInfoJson],
+    system_prompt: Optional[str]
+) -> Tuple[Any, List[str]]:
+    """创建文本模型、智能体并编译群组，返回 (compiled_swarm, agent_names)
 
-    if provider == 'ollama':
-        return ChatOllama(
-            model=model,
-            base_url=url,
-        )
-    else:
-        # Create httpx client with SSL configuration for ChatOpenAI
-        http_client = HttpClient.create_sync_client()
-        http_async_client = HttpClient.create_async_client()
-        # Special handling for o3-mini model which doesn't support temperature parameter
-        if model == 'o3-mini':
-            return ChatOpenAI(
-                model=model,
-                api_key=api_key,  # type: ignore
-                timeout=300,
-                base_url=url,
-                # o3-mini doesn't support temperature parameter
-                http_client=http_client,
-                http_async_client=http_async_client
-            )
-        else:
-            return ChatOpenAI(
-                model=model,
-                api_key=api_key,  # type: ignore
-                timeout=300,
-                base_url=url,
-                temperature=0,
-                # max_tokens=max_tokens, # TODO: 暂时注释掉有问题的参数
-                http_client=http_client,
-                http_async_client=http_async_client
-            )
+    默认智能体固定为第一个，每轮的活跃智能体通过输入状态传入
+    """
+    text_model_instance = chat_models.get(text_model)
+    agents = AgentManager.create_agents(
+        text_model_instance,
+        tool_list,  # 传入所有注册的工具
+        system_prompt or ""
+    )
+    agent_names = [agent.name for agent in agents]
+    swarm = create_swarm(
+        agents=agents,  # type: ignore
+        default_active_agent=agent_names[0]
+    )
+    return swarm.compile(), agent_names
 
 
 async def _handle_error(error: Exception, session_id: str) -> None:
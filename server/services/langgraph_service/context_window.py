@@ -0,0 +1,319 @@
+"""
+Token-budgeted context window for the chat agents
+
+The client sends the whole conversation every turn, and the agents used to
+pass all of it to the model: every earlier tool call and result, and every
+reference image inline as a base64 data URL. Prompts grew linearly with the
+session. The agents now get a `pre_model_hook` that builds the model input
+(the graph state, what is saved and synced to the client, is untouched):
+
+- inline images of earlier turns are replaced by their file ids (the
+  `<image file_id=...>` tags the client writes next to them), only the
+  current turn keeps its images
+- if the conversation is still over CHAT_CONTEXT_TOKENS, the oldest turns
+  are cut at a user message and replaced by a rolling summary; the summary
+  is stored per session (`chat_summaries`) with the number of messages it
+  covers, so later turns only summarize what newly fell out of the window;
+  an extended summary cuts the recent part down to WINDOW_REFILL of the
+  budget, so it lasts several turns instead of being redone every turn
+- the current turn (the last user message and everything after it) is
+  always kept whole
+
+Token counts are estimates (about 4 characters per token, IMAGE_TOKENS per
+image); good enough for a budget and free of tokenizer downloads.
+
+Tuning (environment variables):
+    CHAT_CONTEXT_TOKENS   model input budget, 0 disables windowing (default 24000)
+    CHAT_SUMMARY_TOKENS   length asked of the rolling summary (default 800)
+"""
+
+import hashlib
+import json
+import os
+import re
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.constants import TAG_NOSTREAM
+from services.db_adapter import db_adapter
+
+CONTEXT_TOKENS = int(os.environ.get('CHAT_CONTEXT_TOKENS', 24000))
+SUMMARY_TOKENS = int(os.environ.get('CHAT_SUMMARY_TOKENS', 800))
+# Share of the budget the recent messages are cut down to when the summary is extended
+WINDOW_REFILL = 0.6
+# Transcript sent per summarization call, longer gaps are summarized in steps
+SUMMARY_INPUT_TOKENS = 12000
+# What a vision model bills for one image at high detail, roughly
+IMAGE_TOKENS = 765
+MESSAGE_OVERHEAD_TOKENS = 4
+# Tool results are clipped to this many characters in the summarization transcript
+TRANSCRIPT_TOOL_CHARS = 1500
+
+_DATA_URL_RE = re.compile(r'data:image/[A-Za-z0-9.+-]+;base64,[A-Za-z0-9+/=]+')
+_IMAGE_TAG_FILE_ID_RE = re.compile(r'<image\b[^>]*\bfile_id="([^"]+)"')
+
+SUMMARY_PROMPT = (
+    "You maintain the running summary of a conversation between a user and an image/video "
+    "creation assistant. Update the summary with the new part of the conversation. Keep: the "
+    "user's goals and preferences, character and style decisions, the file ids of generated and "
+    "uploaded images worth referring back to, and open requests. Drop greetings and details of "
+    "failed attempts. Write it in the same language as the user, at most about {tokens} tokens."
+)
+
+
+def _text_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def estimate_message_tokens(message: BaseMessage) -> int:
+    """Rough token count of one message as sent to the model"""
+    tokens = MESSAGE_OVERHEAD_TOKENS
+    content = message.content
+    if isinstance(content, str):
+        tokens += _text_tokens(content)
+    else:
+        for part in content:
+            if isinstance(part, str):
+                tokens += _text_tokens(part)
+            elif part.get('type') == 'image_url':
+                tokens += IMAGE_TOKENS
+            else:
+                tokens += _text_tokens(str(part.get('text', '')))
+    if isinstance(message, AIMessage) and message.tool_calls:
+        tokens += _text_tokens(json.dumps([call.get('args', {}) for call in message.tool_calls], ensure_ascii=False))
+    return tokens
+
+
+def estimate_tokens(messages: List[BaseMessage]) -> int:
+    return sum(estimate_message_tokens(message) for message in messages)
+
+
+def strip_image_data(message: BaseMessage) -> BaseMessage:
+    """Copy of message with inline images replaced by their file ids (the message itself if it has none)"""
+    content = message.content
+    if isinstance(content, str):
+        if 'data:image/' not in content:
+            return message
+        return message.model_copy(update={'content': _DATA_URL_RE.sub('[image]', content)})
+
+    file_ids: List[str] = []
+    for part in content:
+        if isinstance(part, dict) and part.get('type') == 'text':
+            file_ids.extend(_IMAGE_TAG_FILE_ID_RE.findall(part.get('text', '')))
+    parts: List[Any] = []
+    changed = False
+    image_index = 0
+    for part in content:
+        if isinstance(part, dict) and part.get('type') == 'image_url':
+            url = (part.get('image_url') or {}).get('url', '')
+            if url.startswith('data:'):
+                # Images follow the text part in the order of its <image> tags
+                file_id = file_ids[image_index] if image_index < len(file_ids) else None
+                image_index += 1
+                changed = True
+                parts.append({'type': 'text', 'text': f'[image file_id="{file_id}"]' if file_id else '[image]'})
+                continue
+        elif isinstance(part, dict) and part.get('type') == 'text' and 'data:image/' in part.get('text', ''):
+            changed = True
+            part = {**part, 'text': _DATA_URL_RE.sub('[image]', part['text'])}
+        parts.append(part)
+    if not changed:
+        return message
+    return message.model_copy(update={'content': parts})
+
+
+def _message_text(message: BaseMessage) -> str:
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return '\n'.join(
+        part if isinstance(part, str) else str(part.get('text', '')) for part in content
+    )
+
+
+def _digest(messages: List[BaseMessage]) -> str:
+    """Identifies a history prefix by content (message ids are regenerated every turn)"""
+    digest = hashlib.sha256()
+    for message in messages:
+        digest.update(message.type.encode('utf-8'))
+        digest.update(_message_text(message).encode('utf-8'))
+        if isinstance(message, AIMessage) and message.tool_calls:
+            digest.update(json.dumps(message.tool_calls, sort_keys=True, default=str).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _transcript(messages: List[BaseMessage]) -> str:
+    lines: List[str] = []
+    for message in messages:
+        if isinstance(message, HumanMessage):
+            lines.append(f"User: {_message_text(message)}")
+        elif isinstance(message, AIMessage):
+            text = _message_text(message)
+            if text:
+                lines.append(f"Assistant: {text}")
+            for call in message.tool_calls or []:
+                lines.append(f"Assistant called {call.get('name')}({json.dumps(call.get('args', {}), ensure_ascii=False)})")
+        elif isinstance(message, ToolMessage):
+            lines.append(f"Tool result: {_message_text(message)[:TRANSCRIPT_TOOL_CHARS]}")
+    return '\n'.join(lines)
+
+
+def _chunks(messages: List[BaseMessage], max_tokens: int) -> List[List[BaseMessage]]:
+    chunks: List[List[BaseMessage]] = [[]]
+    tokens = 0
+    for message in messages:
+        message_tokens = estimate_message_tokens(message)
+        if chunks[-1] and tokens + message_tokens > max_tokens:
+            chunks.append([])
+            tokens = 0
+        chunks[-1].append(message)
+        tokens += message_tokens
+    return chunks
+
+
+class ChatContextWindow:
+    """Builds the model input of a turn: recent messages within budget plus a rolling summary"""
+
+    def __init__(self, max_tokens: int = CONTEXT_TOKENS, summary_tokens: int = SUMMARY_TOKENS,
+                 cache_size: int = 256):
+        self.max_tokens = max_tokens
+        self.summary_tokens = summary_tokens
+        self.cache_size = cache_size
+        # session_id -> stored summary record, in front of chat_summaries
+        self._summaries: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self.stats = {'calls': 0, 'windowed': 0, 'summaries': 0, 'summary_errors': 0,
+                      'tokens_in': 0, 'tokens_out': 0}
+
+    def pre_model_hook(self, model: Any) -> Callable[..., Any]:
+        """pre_model_hook for create_react_agent, summarizing with model"""
+        async def hook(state: Dict[str, Any], config: RunnableConfig) -> Dict[str, Any]:
+            session_id = (config.get('configurable') or {}).get('session_id', '')
+            return {'llm_input_messages': await self.prepare(state['messages'], session_id, model)}
+        return hook
+
+    async def prepare(self, messages: List[BaseMessage], session_id: str, model: Any) -> List[BaseMessage]:
+        """Model input for messages: earlier images stripped, oldest turns summarized past the budget"""
+        self.stats['calls'] += 1
+        turn_starts = [i for i, message in enumerate(messages) if isinstance(message, HumanMessage)]
+        current = turn_starts[-1] if turn_starts else 0
+        window = [
+            message if i == current else strip_image_data(message)
+            for i, message in enumerate(messages)
+        ]
+        tokens = [estimate_message_tokens(message) for message in window]
+        total = sum(tokens)
+        self.stats['tokens_in'] += estimate_tokens(messages)
+        if self.max_tokens <= 0 or total <= self.max_tokens or not session_id:
+            self.stats['tokens_out'] += total
+            return window
+
+        # Earliest turn start whose suffix fits next to the summary, else the current turn
+        suffix = [0] * (len(window) + 1)
+        for i in range(len(window) - 1, -1, -1):
+            suffix[i] = suffix[i + 1] + tokens[i]
+        budget = self.max_tokens - self.summary_tokens
+
+        def first_fitting(limit: float) -> int:
+            return next((start for start in turn_starts if start > 0 and suffix[start] <= limit), current)
+
+        cut = first_fitting(budget)
+        if cut == 0:
+            self.stats['tokens_out'] += total
+            return window
+        # A new summary cuts deeper (window down to WINDOW_REFILL of the budget), so the
+        # next few turns fit next to it without summarizing again
+        summary, cut = await self._summary_for(session_id, window, cut, max(first_fitting(budget * WINDOW_REFILL), cut),
+                                               current, model)
+        # The summary takes the id of the first message it replaces: the messages stream
+        # forwards node outputs with unseen ids to the client, this one must stay internal
+        result = [HumanMessage(
+            content=f"<conversation_summary>\n{summary}\n</conversation_summary>",
+            id=messages[0].id,
+        )] + window[cut:]
+        self.stats['windowed'] += 1
+        self.stats['tokens_out'] += estimate_tokens(result)
+        return result
+
+    async def _summary_for(self, session_id: str, window: List[BaseMessage], cut: int, new_cut: int,
+                           current: int, model: Any) -> Tuple[str, int]:
+        """Summary of at least window[:cut], returns (summary, messages it covers)
+
+        The stored summary is used when it covers enough, otherwise it is
+        extended (or rebuilt) up to new_cut.
+        """
+        record = await self._load(session_id)
+        previous: Optional[str] = None
+        start = 0
+        if record and 0 < record['covered_count'] <= current and \
+                isinstance(window[record['covered_count']], HumanMessage) and \
+                _digest(window[:record['covered_count']]) == record['covered_digest']:
+            if record['covered_count'] >= cut:
+                # Already covers at least what has to go
+                return record['summary'], record['covered_count']
+            previous, start = record['summary'], record['covered_count']
+
+        cut = new_cut
+        try:
+            summary = await self._summarize(model, previous, window[start:cut])
+        except Exception as e:
+            self.stats['summary_errors'] += 1
+            print(f"⚠️ Could not summarize earlier messages of session {session_id}: {e}")
+            note = f"{cut - start} earlier messages were left out to fit the context window."
+            return (f"{previous}\n\n{note}" if previous else note), cut
+
+        self.stats['summaries'] += 1
+        await self._store(session_id, {'covered_count': cut, 'covered_digest': _digest(window[:cut]), 'summary': summary})
+        return summary, cut
+
+    async def _summarize(self, model: Any, previous: Optional[str], messages: List[BaseMessage]) -> str:
+        summary = previous or ''
+        for chunk in _chunks(messages, SUMMARY_INPUT_TOKENS):
+            request = [
+                SystemMessage(content=SUMMARY_PROMPT.format(tokens=self.summary_tokens)),
+                HumanMessage(content=(
+                    f"Summary so far:\n{summary or '(none)'}\n\n"
+                    f"New part of the conversation:\n{_transcript(chunk)}\n\n"
+                    "Reply with the updated summary only."
+                )),
+            ]
+            # nostream: keep the summary out of the tokens streamed to the client
+            response = await model.ainvoke(request, config={'tags': [TAG_NOSTREAM], 'run_name': 'chat_summary'})
+            summary = _message_text(response).strip()
+        return summary
+
+    async def _load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        record = self._summaries.get(session_id)
+        if record is None:
+            try:
+                record = await db_adapter.get_chat_summary(session_id)
+            except Exception as e:
+                print(f"⚠️ Could not load the chat summary of session {session_id}: {e}")
+                return None
+            if record is None:
+                return None
+            self._remember(session_id, record)
+        else:
+            self._summaries.move_to_end(session_id)
+        return record
+
+    async def _store(self, session_id: str, record: Dict[str, Any]) -> None:
+        self._remember(session_id, record)
+        try:
+            await db_adapter.save_chat_summary(session_id, record['covered_count'], record['covered_digest'], record['summary'])
+        except Exception as e:
+            print(f"⚠️ Could not save the chat summary of session {session_id}: {e}")
+
+    def _remember(self, session_id: str, record: Dict[str, Any]) -> None:
+        self._summaries[session_id] = record
+        self._summaries.move_to_end(session_id)
+        while len(self._summaries) > self.cache_size:
+            self._summaries.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, 'max_tokens': self.max_tokens, 'cached_summaries': len(self._summaries)}
+
+
+# Shared by all agents, exposed by /api/metrics
+chat_context = ChatContextWindow()
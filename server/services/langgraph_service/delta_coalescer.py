@@ -0,0 +1,124 @@
+"""
+Coalesce streamed LLM deltas before they hit the websocket
+
+The model streams one chunk per token, and StreamProcessor used to emit one
+`delta` / `tool_call_arguments` event per chunk. DeltaCoalescer merges
+consecutive chunks of the same kind (and same tool call id) for a session and
+emits them when the window elapses, when the buffer reaches max_bytes, or
+when any other event has to go out (tool calls, results, done), so the
+relative order of events is preserved.
+
+Tuning (environment variables):
+    DELTA_COALESCE_MS     merge window in milliseconds, 0 disables (default 30)
+    DELTA_COALESCE_BYTES  flush as soon as this many bytes are buffered (default 1024)
+"""
+
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+DEFAULT_WINDOW_MS = float(os.environ.get('DELTA_COALESCE_MS', 30))
+DEFAULT_MAX_BYTES = int(os.environ.get('DELTA_COALESCE_BYTES', 1024))
+
+# Process-wide counters, exposed by /api/metrics
+delta_coalescer_stats: Dict[str, int] = {
+    'events_in': 0,
+    'events_out': 0,
+}
+
+
+def get_delta_coalescer_stats() -> Dict[str, int]:
+    """Return a copy of the process-wide coalescing counters"""
+    return dict(delta_coalescer_stats)
+
+
+class DeltaCoalescer:
+    """合并同一会话的流式增量事件，减少 websocket 事件数量"""
+
+    def __init__(
+        self,
+        session_id: str,
+        send: Callable[[str, Dict[str, Any]], Awaitable[None]],
+        window_ms: float = DEFAULT_WINDOW_MS,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ):
+        self.session_id = session_id
+        self.send = send
+        self.window = window_ms / 1000
+        self.max_bytes = max_bytes
+        self.events_in = 0
+        self.events_out = 0
+
+        # (event type, tool call id) of the buffered parts
+        self._key: Optional[Tuple[str, Optional[str]]] = None
+        self._parts: List[str] = []
+        self._size = 0
+        self._timer: Optional[asyncio.Task[None]] = None
+        self._lock = asyncio.Lock()
+
+    async def add_delta(self, text: str) -> None:
+        """Buffer a text delta"""
+        await self._add(('delta', None), text)
+
+    async def add_tool_call_arguments(self, tool_call_id: str, text: str) -> None:
+        """Buffer a tool call arguments chunk"""
+        await self._add(('tool_call_arguments', tool_call_id), text)
+
+    async def _add(self, key: Tuple[str, Optional[str]], text: str) -> None:
+        self.events_in += 1
+        delta_coalescer_stats['events_in'] += 1
+
+        if self.window <= 0:
+            await self._emit(key, text)
+            return
+
+        if self._key is not None and self._key != key:
+            await self.flush()
+
+        self._key = key
+        self._parts.append(text)
+        self._size += len(text)
+
+        if self._size >= self.max_bytes:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        try:
+            await asyncio.sleep(self.window)
+        except asyncio.CancelledError:
+            return
+        self._timer = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Emit whatever is buffered now"""
+        if self._timer is not None and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+        self._timer = None
+
+        async with self._lock:
+            if self._key is None:
+                return
+            key, text = self._key, ''.join(self._parts)
+            self._key = None
+            self._parts = []
+            self._size = 0
+            await self._emit(key, text)
+
+    async def send_event(self, event: Dict[str, Any]) -> None:
+        """Flush buffered deltas, then send a non-delta event"""
+        await self.flush()
+        async with self._lock:
+            await self.send(self.session_id, event)
+
+    async def _emit(self, key: Tuple[str, Optional[str]], text: str) -> None:
+        event_type, tool_call_id = key
+        event: Dict[str, Any] = {'type': event_type, 'text': text}
+        if tool_call_id is not None:
+            event['id'] = tool_call_id
+
+        self.events_out += 1
+        delta_coalescer_stats['events_out'] += 1
+        await self.send(self.session_id, event)
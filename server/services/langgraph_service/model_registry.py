@@ -0,0 +1,162 @@
+"""
+Registry of chat model clients
+
+_create_text_model used to construct a new ChatOpenAI with a brand-new sync
+and async httpx client for every chat turn and never close them, leaking a
+connection pool and paying a TCP/TLS handshake per turn. Models now come
+from `chat_models`:
+
+- one model per (provider, url, model, api key fingerprint), reused by
+  every turn and every cached swarm using that model
+- OpenAI-compatible models share the process-wide async httpx client of
+  their upstream (HttpClient.get_client), so turns reuse warm keep-alive
+  connections; the sync client (only used by sync invoke) is one shared
+  client owned by the registry
+- when config_service.update_config changes a provider's key or URL, the
+  models built from the old settings are dropped on the next lookup
+- `close()` on shutdown closes what the registry owns (the shared async
+  clients are closed by HttpClient.close_all)
+"""
+
+import asyncio
+import hashlib
+from typing import Any, Dict, Optional, Tuple
+import httpx
+from langchain_ollama import ChatOllama
+from langchain_openai import ChatOpenAI
+from models.config_model import ModelInfo
+from services.config_service import config_service
+from utils.http_client import HttpClient
+
+ModelKey = Tuple[int, str, str, str, str]
+
+
+def api_key_fingerprint(api_key: str) -> str:
+    """Short digest identifying an API key without keeping it in keys or logs"""
+    return hashlib.sha256((api_key or '').encode('utf-8')).hexdigest()[:12]
+
+
+class ChatModelRegistry:
+    """Long-lived chat model clients keyed by provider settings"""
+
+    def __init__(self):
+        self._models: Dict[ModelKey, Any] = {}
+        self._sync_client: Optional[httpx.Client] = None
+        self._config_version = config_service.version
+        self.stats = {'hits': 0, 'builds': 0, 'invalidations': 0}
+
+    def _provider_settings(self, text_model: ModelInfo) -> Tuple[str, str]:
+        provider = text_model.get('provider')
+        api_key = config_service.app_config.get(  # type: ignore
+            provider, {}).get("api_key", "")
+        return text_model.get('url') or '', api_key
+
+    def get(self, text_model: ModelInfo) -> Any:
+        """Return the chat model for text_model, building it on first use
+
+        Called from the event loop, the OpenAI clients are bound to it.
+        """
+        self._drop_stale()
+        url, api_key = self._provider_settings(text_model)
+        key = (
+            id(asyncio.get_running_loop()),
+            text_model.get('provider'),
+            url,
+            text_model.get('model'),
+            api_key_fingerprint(api_key),
+        )
+        model = self._models.get(key)
+        if model is not None:
+            self.stats['hits'] += 1
+            return model
+        model = self._build(text_model, url, api_key)
+        self.stats['builds'] += 1
+        self._models[key] = model
+        return model
+
+    def _drop_stale(self) -> None:
+        """After a config update, forget models whose provider key or URL changed"""
+        if config_service.version == self._config_version:
+            return
+        self._config_version = config_service.version
+        for key in list(self._models):
+            _, provider, url, model_name, fingerprint = key
+            provider_config = config_service.app_config.get(provider, {})  # type: ignore
+            configured_url = (provider_config.get('url') or '').rstrip('/')
+            if api_key_fingerprint(provider_config.get('api_key', '')) != fingerprint or \
+                    (configured_url and configured_url != url.rstrip('/')):
+                # Turns still streaming keep their reference, the clients go with the model
+                del self._models[key]
+                self.stats['invalidations'] += 1
+                print(f"♻️ {provider} settings changed, dropping chat model {model_name}")
+
+    def _build(self, text_model: ModelInfo, url: str, api_key: str) -> Any:
+        """创建语言模型实例"""
+        model = text_model.get('model')
+        provider = text_model.get('provider')
+
+        # TODO: Verify if max token is working
+        # max_tokens = text_model.get('max_tokens', 8148)
+
+        if provider == 'ollama':
+            return ChatOllama(
+                model=model,
+                base_url=url,
+            )
+
+        # Shared httpx clients with SSL configuration for ChatOpenAI
+        if self._sync_client is None:
+            self._sync_client = HttpClient.create_sync_client()
+        http_async_client = HttpClient.get_client(url=url)
+        # Special handling for o3-mini model which doesn't support temperature parameter
+        if model == 'o3-mini':
+            return ChatOpenAI(
+                model=model,
+                api_key=api_key,  # type: ignore
+                timeout=300,
+                base_url=url,
+                # o3-mini doesn't support temperature parameter
+                http_client=self._sync_client,
+                http_async_client=http_async_client
+            )
+        return ChatOpenAI(
+            model=model,
+            api_key=api_key,  # type: ignore
+            timeout=300,
+            base_url=url,
+            temperature=0,
+            # max_tokens=max_tokens, # TODO: 暂时注释掉有问题的参数
+            http_client=self._sync_client,
+            http_async_client=http_async_client
+        )
+
+    @staticmethod
+    async def _close_model(model: Any) -> None:
+        # ChatOllama owns its ollama clients; ChatOpenAI only uses the shared ones
+        if isinstance(model, ChatOllama):
+            for client in (getattr(model, '_client', None), getattr(model, '_async_client', None)):
+                http = getattr(client, '_client', None)
+                try:
+                    if isinstance(http, httpx.AsyncClient):
+                        await http.aclose()
+                    elif isinstance(http, httpx.Client):
+                        http.close()
+                except Exception as e:
+                    print(f"⚠️ Could not close chat model client: {e}")
+
+    async def close(self) -> None:
+        """Close every model client, called on shutdown"""
+        models = list(self._models.values())
+        self._models.clear()
+        for model in models:
+            await self._close_model(model)
+        if self._sync_client is not None:
+            self._sync_client.close()
+            self._sync_client = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, 'models': len(self._models)}
+
+
+# Shared by every chat turn, closed by the server lifespan
+chat_models = ChatModelRegistry()
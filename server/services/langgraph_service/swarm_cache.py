@@ -0,0 +1,105 @@
+"""
+Cache of compiled agent swarms
+
+Every chat turn used to build the text model, both react agents, the swarm
+and then compile it, although the result only depends on the model config,
+the tools and the system prompt. Compiled graphs hold no per-run state
+(session, canvas and messages come in with each astream call), so one
+compiled swarm is shared by every turn with the same inputs:
+
+- keyed by (provider, model, url, api key digest), the tool ids and a hash
+  of the system prompt; the active agent is passed in the input state
+  instead of being baked in as the swarm's default
+- least recently used swarms are dropped past SWARM_CACHE_SIZE (default 16)
+- everything is dropped when tool_service's tools change (re-initialized
+  after a config update, ComfyUI workflows registered), since agents bind
+  the tool objects themselves
+
+Tuning (environment variables):
+    SWARM_CACHE_SIZE  compiled swarms kept, 0 disables the cache (default 16)
+"""
+
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from models.config_model import ModelInfo
+from models.tool_model import ToolInfoJson
+from services.tool_service import tool_service
+
+SwarmKey = Tuple[Any, ...]
+
+
+def _digest(value: str) -> str:
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()[:16]
+
+
+def swarm_key(text_model: ModelInfo, api_key: str, tool_list: List[ToolInfoJson],
+              system_prompt: Optional[str]) -> SwarmKey:
+    """Everything a compiled swarm depends on"""
+    return (
+        text_model.get('provider'),
+        text_model.get('model'),
+        text_model.get('url'),
+        _digest(api_key or ''),
+        tuple(tool.get('id') for tool in tool_list),
+        _digest(system_prompt or ''),
+    )
+
+
+class SwarmCache:
+    """LRU of compiled swarms, invalidated when the registered tools change"""
+
+    def __init__(self, max_entries: Optional[int] = None):
+        if max_entries is None:
+            max_entries = int(os.environ.get('SWARM_CACHE_SIZE', 16))
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[SwarmKey, Any]' = OrderedDict()
+        self._tools_version = tool_service.version
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0, 'build_ms': 0.0}
+
+    def get_or_build(self, key: SwarmKey, build: Callable[[], Any]) -> Any:
+        """Return the compiled swarm for key, calling build() on a miss
+
+        build runs synchronously (no await), so concurrent turns can't build
+        the same swarm twice.
+        """
+        if tool_service.version != self._tools_version:
+            if self._entries:
+                self.stats['invalidations'] += 1
+                print(f"♻️ Tools changed, dropping {len(self._entries)} compiled swarms")
+            self._entries.clear()
+            self._tools_version = tool_service.version
+
+        swarm = self._entries.get(key)
+        if swarm is not None:
+            self.stats['hits'] += 1
+            self._entries.move_to_end(key)
+            return swarm
+
+        self.stats['misses'] += 1
+        start = time.perf_counter()
+        swarm = build()
+        self.stats['build_ms'] += (time.perf_counter() - start) * 1000
+        if self.max_entries > 0:
+            self._entries[key] = swarm
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+        return swarm
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            'build_ms': round(self.stats['build_ms'], 1),
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+        }
+
+
+# Shared by every chat turn, exposed by /api/metrics
+swarm_cache = SwarmCache()
@@ -89,10 +89,15 @@ async def _process_magic_generation(
     ai_response = await create_jaaz_response(messages, session_id, canvas_id)
 
     # Save AI response to database
-    await db_service.create_message(session_id, 'assistant', json.dumps(ai_response))
-
-    # Send messages to frontend immediately
-    all_messages = messages + [ai_response]
-    await send_to_websocket(
-        session_id, {'type': 'all_messages', 'messages': all_messages}
-    )
+    await db_adapter.create_message(session_id, 'assistant', json.dumps(ai_response))
+
+    # Send the new message to frontend immediately; the client may hold only
+    # the latest history pages, so it goes out as a delta at its index in the session
+    latest = await db_adapter.get_chat_history_page(session_id, None, 1)
+    index = latest['offset']
+    await send_to_websocket(session_id, {
+        'type': 'messages_delta',
+        'seq': 1,
+        'total': index + 1,
+        'changes': [{'index': index, 'message': ai_response}],
+    })
@@ -0,0 +1,132 @@
+# services/message_sync_service.py
+"""
+Incremental chat history sync over websocket
+
+Instead of re-converting and re-sending the whole history on every `values`
+chunk, a MessageSync tracks what the client has already received for a
+session and produces `messages_delta` events containing only appended or
+changed messages:
+
+    {'type': 'messages_delta', 'seq': 3, 'total': 42,
+     'changes': [{'index': 41, 'message': {...}}]}
+
+`seq` increases by one per delta, starting at 1 for each stream. Indices
+count from the start of the session's history: the sync is seeded with the
+history the stream started from, which the client already has (or pages
+through), so only the messages of the current turn are ever sent. When
+the stream's messages don't line up with the stored history (repaired
+tool calls dropped some), the stream starts with an `all_messages`
+snapshot instead. A client
+that sees a gap asks for a full snapshot with the `resync_messages` socket
+event and receives an `all_messages` event carrying the current `seq`.
+
+OpenAI-format conversions are cached per message object, so each message is
+converted once per stream rather than once per chunk.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+from langchain_core.messages import BaseMessage, convert_to_openai_messages
+
+
+class MessageSync:
+    """Per-session state for incremental message sync"""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.seq = 0
+        # 已发送给前端的消息（OpenAI 格式）
+        self.sent_messages: List[Dict[str, Any]] = []
+        # id(message) -> (message, converted)；保留 message 引用以免 id 被复用
+        self._conversion_cache: Dict[int, Tuple[BaseMessage, Dict[str, Any]]] = {}
+        self._sent_sources: List[int] = []
+        # Leading messages the client has from the history, never sent again
+        self._seeded = 0
+
+    def seed(self, messages: List[Dict[str, Any]]) -> None:
+        """Record the history the stream starts from (OpenAI format) as already sent"""
+        self.sent_messages = list(messages)
+        self._sent_sources = [0] * len(messages)
+        self._seeded = len(messages)
+
+    def convert(self, messages: List[BaseMessage]) -> List[Dict[str, Any]]:
+        """Convert messages to OpenAI format, reusing cached conversions"""
+        oai_messages: List[Dict[str, Any]] = []
+        for msg in messages:
+            cached = self._conversion_cache.get(id(msg))
+            if cached is None or cached[0] is not msg:
+                converted = convert_to_openai_messages(msg)
+                cached = (msg, converted)  # type: ignore
+                self._conversion_cache[id(msg)] = cached
+            oai_messages.append(cached[1])
+        return oai_messages
+
+    def diff(self, messages: List[BaseMessage]) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """Convert messages and build the delta against what the client has
+
+        Returns:
+            (oai_messages, event) where event is None if nothing changed
+        """
+        oai_messages = self.convert(messages)
+        sources = [id(msg) for msg in messages]
+
+        changes: List[Dict[str, Any]] = []
+        for index, (source, message) in enumerate(zip(sources, oai_messages)):
+            if index < self._seeded:
+                # Part of the history the stream started from
+                continue
+            if index < len(self._sent_sources) and self._sent_sources[index] == source:
+                # Same message object at the same position, already sent
+                continue
+            if index < len(self.sent_messages) and self.sent_messages[index] == message:
+                continue
+            changes.append({'index': index, 'message': message})
+
+        total_changed = len(oai_messages) != len(self.sent_messages)
+        self.sent_messages = oai_messages
+        self._sent_sources = sources
+
+        if not changes and not total_changed:
+            return oai_messages, None
+
+        self.seq += 1
+        return oai_messages, {
+            'type': 'messages_delta',
+            'seq': self.seq,
+            'total': len(oai_messages),
+            'changes': changes,
+        }
+
+    def snapshot(self, messages: Optional[List[BaseMessage]] = None) -> Dict[str, Any]:
+        """Build a full `all_messages` event, optionally from a new message list"""
+        if messages is not None:
+            self.sent_messages = self.convert(messages)
+            self._sent_sources = [id(msg) for msg in messages]
+            self.seq += 1
+        return {
+            'type': 'all_messages',
+            'seq': self.seq,
+            'messages': self.sent_messages,
+        }
+
+
+# Active syncs keyed by session_id, alive while the session is streaming
+message_syncs: Dict[str, MessageSync] = {}
+
+
+def add_message_sync(session_id: str, sync: MessageSync) -> None:
+    """Register the message sync for the given session_id"""
+    message_syncs[session_id] = sync
+
+
+def remove_message_sync(session_id: str, sync: Optional[MessageSync] = None) -> None:
+    """Remove the message sync for the given session_id
+
+    If sync is given, only remove it when it is still the registered one.
+    """
+    if sync is None or message_syncs.get(session_id) is sync:
+        message_syncs.pop(session_id, None)
+
+
+def get_message_sync(session_id: str) -> Optional[MessageSync]:
+    """Retrieve the message sync for the given session_id"""
+    return message_syncs.get(session_id)
@@ -3,10 +3,18 @@ import sqlite3
 from services.migrations.v1_initial_schema import V1InitialSchema
 from services.migrations.v2_add_canvases import V2AddCanvases
 from services.migrations.v3_add_comfy_workflow import V3AddComfyWorkflow
+from services.migrations.v4_normalize_canvas_elements import V4NormalizeCanvasElements
+from services.migrations.v5_add_file_locations import V5AddFileLocations
+from services.migrations.v6_add_file_store import V6AddFileStore
+from services.migrations.v7_add_storage_uploads import V7AddStorageUploads
+from services.migrations.v8_add_chat_summaries import V8AddChatSummaries
+from services.migrations.v9_add_chat_history_indexes import V9AddChatHistoryIndexes
+from services.migrations.v10_add_tool_confirmations import V10AddToolConfirmations
+from services.migrations.v11_count_file_blob_aliases import V11CountFileBlobAliases
 from . import Migration
 
 # Database version
-CURRENT_VERSION = 3
+CURRENT_VERSION = 11
 
 ALL_MIGRATIONS = [
     {
@@ -21,6 +29,38 @@ ALL_MIGRATIONS = [
         'version': 3,
         'migration': V3AddComfyWorkflow,
     },
+    {
+        'version': 4,
+        'migration': V4NormalizeCanvasElements,
+    },
+    {
+        'version': 5,
+        'migration': V5AddFileLocations,
+    },
+    {
+        'version': 6,
+        'migration': V6AddFileStore,
+    },
+    {
+        'version': 7,
+        'migration': V7AddStorageUploads,
+    },
+    {
+        'version': 8,
+        'migration': V8AddChatSummaries,
+    },
+    {
+        'version': 9,
+        'migration': V9AddChatHistoryIndexes,
+    },
+    {
+        'version': 10,
+        'migration': V10AddToolConfirmations,
+    },
+    {
+        'version': 11,
+        'migration': V11CountFileBlobAliases,
+    },
 ]
 class MigrationManager:
     def get_migrations_to_apply(self, current_version: int, target_version: int) -> List[Type[Migration]]:
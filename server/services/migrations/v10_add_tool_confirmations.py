@@ -0,0 +1,26 @@
+from . import Migration
+import sqlite3
+
+
+class V10AddToolConfirmations(Migration):
+    version = 10
+    description = "Add tool confirmations"
+
+    def up(self, conn: sqlite3.Connection) -> None:
+        # Tool calls waiting for the user, shared by the server processes so a
+        # confirmation handled by one wakes the tool waiting in another.
+        # confirmed is NULL until decided; times are unix timestamps.
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS tool_confirmations (
+                tool_call_id TEXT PRIMARY KEY,
+                session_id TEXT,
+                tool_name TEXT,
+                confirmed INTEGER,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_tool_confirmations_expires_at ON tool_confirmations(expires_at)")
+
+    def down(self, conn: sqlite3.Connection) -> None:
+        conn.execute("DROP TABLE IF EXISTS tool_confirmations")
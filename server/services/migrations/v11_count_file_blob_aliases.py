@@ -0,0 +1,20 @@
+from . import Migration
+import sqlite3
+
+
+class V11CountFileBlobAliases(Migration):
+    version = 11
+    description = "Count file blob references by alias"
+
+    def up(self, conn: sqlite3.Connection) -> None:
+        # ref_count used to be refreshed by GC passes only (canvases and chat
+        # sessions referencing the blob); it now counts the aliases of the
+        # blob and is kept up to date by every alias write
+        conn.execute("""
+            UPDATE file_blobs
+            SET ref_count = (SELECT COUNT(*) FROM file_aliases WHERE file_aliases.hash = file_blobs.hash)
+        """)
+
+    def down(self, conn: sqlite3.Connection) -> None:
+        # The next GC pass of the previous version rewrites the counts
+        pass
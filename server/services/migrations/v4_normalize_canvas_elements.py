@@ -0,0 +1,88 @@
+from . import Migration
+import json
+import sqlite3
+
+
+class V4NormalizeCanvasElements(Migration):
+    version = 4
+    description = "Normalize canvas elements and files into rows"
+
+    def up(self, conn: sqlite3.Connection) -> None:
+        # One row per canvas element, ordered by position (z-order)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS canvas_elements (
+                canvas_id TEXT NOT NULL,
+                id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (canvas_id, id),
+                FOREIGN KEY (canvas_id) REFERENCES canvases(id)
+            )
+        """)
+
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_canvas_elements_canvas_id_position ON canvas_elements(canvas_id, position)
+        """)
+
+        # One row per entry of the canvas `files` map
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS canvas_files (
+                canvas_id TEXT NOT NULL,
+                id TEXT NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (canvas_id, id),
+                FOREIGN KEY (canvas_id) REFERENCES canvases(id)
+            )
+        """)
+
+        # Move elements and files out of existing blobs; canvases.data keeps the rest (appState etc.)
+        cursor = conn.execute("SELECT id, data FROM canvases WHERE data IS NOT NULL AND data != ''")
+        for canvas_id, data in cursor.fetchall():
+            try:
+                payload = json.loads(data)
+            except (TypeError, ValueError):
+                print(f"⚠️ Skipping canvas {canvas_id} with invalid JSON data")
+                continue
+            if not isinstance(payload, dict):
+                continue
+
+            elements = payload.pop('elements', None) or []
+            files = payload.pop('files', None) or {}
+
+            conn.executemany("""
+                INSERT OR REPLACE INTO canvas_elements (canvas_id, id, position, data)
+                VALUES (?, ?, ?, ?)
+            """, [
+                (canvas_id, str(element.get('id') or f'_{position}'), position, json.dumps(element))
+                for position, element in enumerate(elements)
+                if isinstance(element, dict)
+            ])
+            conn.executemany("""
+                INSERT OR REPLACE INTO canvas_files (canvas_id, id, data)
+                VALUES (?, ?, ?)
+            """, [
+                (canvas_id, str(file_id), json.dumps(file_data))
+                for file_id, file_data in files.items()
+            ])
+            conn.execute("UPDATE canvases SET data = ? WHERE id = ?", (json.dumps(payload), canvas_id))
+
+    def down(self, conn: sqlite3.Connection) -> None:
+        # Fold rows back into the blobs before dropping the tables
+        cursor = conn.execute("SELECT id, data FROM canvases")
+        for canvas_id, data in cursor.fetchall():
+            try:
+                payload = json.loads(data) if data else {}
+            except (TypeError, ValueError):
+                payload = {}
+            payload['elements'] = [
+                json.loads(row[0]) for row in conn.execute(
+                    "SELECT data FROM canvas_elements WHERE canvas_id = ? ORDER BY position", (canvas_id,))
+            ]
+            payload['files'] = {
+                row[0]: json.loads(row[1]) for row in conn.execute(
+                    "SELECT id, data FROM canvas_files WHERE canvas_id = ?", (canvas_id,))
+            }
+            conn.execute("UPDATE canvases SET data = ? WHERE id = ?", (json.dumps(payload), canvas_id))
+
+        conn.execute("DROP TABLE IF EXISTS canvas_elements")
+        conn.execute("DROP TABLE IF EXISTS canvas_files")
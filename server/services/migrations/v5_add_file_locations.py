@@ -0,0 +1,20 @@
+from . import Migration
+import sqlite3
+
+
+class V5AddFileLocations(Migration):
+    version = 5
+    description = "Add file locations index"
+
+    def up(self, conn: sqlite3.Connection) -> None:
+        # file_id (served as /api/file/{file_id}) -> path in remote storage
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS file_locations (
+                file_id TEXT PRIMARY KEY,
+                storage_path TEXT NOT NULL,
+                created_at TEXT DEFAULT (STRFTIME('%Y-%m-%dT%H:%M:%fZ', 'now'))
+            )
+        """)
+
+    def down(self, conn: sqlite3.Connection) -> None:
+        conn.execute("DROP TABLE IF EXISTS file_locations")
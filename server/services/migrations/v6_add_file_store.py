@@ -0,0 +1,32 @@
+from . import Migration
+import sqlite3
+
+
+class V6AddFileStore(Migration):
+    version = 6
+    description = "Add content-addressed file store"
+
+    def up(self, conn: sqlite3.Connection) -> None:
+        # One row per distinct content, ref_count is refreshed by each GC pass
+        # (canvases and chat sessions referencing any alias of the blob)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS file_blobs (
+                hash TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                ref_count INTEGER NOT NULL DEFAULT 0,
+                created_at TEXT DEFAULT (STRFTIME('%Y-%m-%dT%H:%M:%fZ', 'now'))
+            )
+        """)
+        # file_id (the name in FILES_DIR, served as /api/file/{file_id}) -> blob
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS file_aliases (
+                file_id TEXT PRIMARY KEY,
+                hash TEXT NOT NULL,
+                created_at TEXT DEFAULT (STRFTIME('%Y-%m-%dT%H:%M:%fZ', 'now'))
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_file_aliases_hash ON file_aliases(hash)")
+
+    def down(self, conn: sqlite3.Connection) -> None:
+        conn.execute("DROP TABLE IF EXISTS file_aliases")
+        conn.execute("DROP TABLE IF EXISTS file_blobs")
@@ -0,0 +1,30 @@
+from . import Migration
+import sqlite3
+
+
+class V7AddStorageUploads(Migration):
+    version = 7
+    description = "Add storage upload journal"
+
+    def up(self, conn: sqlite3.Connection) -> None:
+        # Local files waiting to be uploaded to remote storage. Rows are removed
+        # once the file is uploaded; canvas_id/canvas_file (JSON) say which canvas
+        # file entry to point at the storage URL afterwards.
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS storage_uploads (
+                file_name TEXT PRIMARY KEY,
+                storage_path TEXT NOT NULL,
+                canvas_id TEXT,
+                canvas_file TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                next_attempt_at REAL NOT NULL DEFAULT 0,
+                created_at TEXT DEFAULT (STRFTIME('%Y-%m-%dT%H:%M:%fZ', 'now')),
+                updated_at TEXT DEFAULT (STRFTIME('%Y-%m-%dT%H:%M:%fZ', 'now'))
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_storage_uploads_status ON storage_uploads(status)")
+
+    def down(self, conn: sqlite3.Connection) -> None:
+        conn.execute("DROP TABLE IF EXISTS storage_uploads")
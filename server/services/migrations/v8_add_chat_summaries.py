@@ -0,0 +1,23 @@
+from . import Migration
+import sqlite3
+
+
+class V8AddChatSummaries(Migration):
+    version = 8
+    description = "Add chat summaries"
+
+    def up(self, conn: sqlite3.Connection) -> None:
+        # Rolling summary of the oldest covered_count messages of a session,
+        # covered_digest detects a history that changed since it was written
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS chat_summaries (
+                session_id TEXT PRIMARY KEY,
+                covered_count INTEGER NOT NULL,
+                covered_digest TEXT NOT NULL,
+                summary TEXT NOT NULL,
+                updated_at TEXT DEFAULT (STRFTIME('%Y-%m-%dT%H:%M:%fZ', 'now'))
+            )
+        """)
+
+    def down(self, conn: sqlite3.Connection) -> None:
+        conn.execute("DROP TABLE IF EXISTS chat_summaries")
@@ -0,0 +1,29 @@
+from . import Migration
+import sqlite3
+
+
+class V9AddChatHistoryIndexes(Migration):
+    version = 9
+    description = "Add covering indexes for chat history"
+
+    def up(self, conn: sqlite3.Connection) -> None:
+        # History pages list ids and roles first, this index answers that
+        # without reading message bodies; it also replaces (session_id, id)
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_chat_messages_session_id_id_role
+            ON chat_messages(session_id, id, role)
+        """)
+        conn.execute("DROP INDEX IF EXISTS idx_chat_messages_session_id_id")
+
+        # Session list of a canvas, newest first, straight from the index
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_chat_sessions_canvas_id_updated_at
+            ON chat_sessions(canvas_id, updated_at DESC, id, title, model, provider, created_at)
+        """)
+
+    def down(self, conn: sqlite3.Connection) -> None:
+        conn.execute("DROP INDEX IF EXISTS idx_chat_sessions_canvas_id_updated_at")
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_chat_messages_session_id_id ON chat_messages(session_id, id)
+        """)
+        conn.execute("DROP INDEX IF EXISTS idx_chat_messages_session_id_id_role")
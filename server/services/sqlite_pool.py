@@ -0,0 +1,139 @@
+"""
+Long-lived aiosqlite connection pool
+
+Opening a connection with `aiosqlite.connect()` spawns a thread and a file
+handle, so doing it per query is expensive under chat streaming. This pool
+keeps a few reader connections plus a single writer connection open for the
+lifetime of the process:
+
+- WAL journal mode so readers never block the writer
+- synchronous=NORMAL (safe with WAL, far fewer fsyncs)
+- per-connection statement cache so repeated queries are prepared once
+- all writes go through one connection guarded by a FIFO lock, which
+  serializes writers instead of letting them fight over SQLITE_BUSY
+
+Usage:
+    async with pool.read() as db:
+        cursor = await db.execute("SELECT ...")
+
+    async with pool.write() as db:
+        await db.execute("INSERT ...")   # committed when the block exits
+"""
+
+import asyncio
+import sqlite3
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, List, Optional
+import aiosqlite
+
+
+class SQLitePool:
+    """Pool of persistent aiosqlite connections with a single writer"""
+
+    def __init__(
+        self,
+        db_path: str,
+        max_readers: int = 4,
+        cached_statements: int = 256,
+        busy_timeout_ms: int = 5000,
+    ) -> None:
+        self.db_path = db_path
+        self.max_readers = max_readers
+        self.cached_statements = cached_statements
+        self.busy_timeout_ms = busy_timeout_ms
+
+        self._readers: Optional[asyncio.Queue[aiosqlite.Connection]] = None
+        self._all_readers: List[aiosqlite.Connection] = []
+        self._reader_count = 0
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._writer_lock: Optional[asyncio.Lock] = None
+        self._init_lock: Optional[asyncio.Lock] = None
+
+    @staticmethod
+    def configure(conn: sqlite3.Connection) -> None:
+        """Apply the pragmas used by every pooled connection (sync variant)"""
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+
+    async def _open(self) -> aiosqlite.Connection:
+        """Open and configure a new connection"""
+        db = await aiosqlite.connect(
+            self.db_path, cached_statements=self.cached_statements
+        )
+        db.row_factory = sqlite3.Row
+        await db.execute("PRAGMA journal_mode=WAL")
+        await db.execute("PRAGMA synchronous=NORMAL")
+        await db.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        return db
+
+    async def _ensure_initialized(self) -> None:
+        """Lazily create the primitives inside the running event loop"""
+        if self._writer is not None:
+            return
+        if self._init_lock is None:
+            self._init_lock = asyncio.Lock()
+        async with self._init_lock:
+            if self._writer is not None:
+                return
+            self._readers = asyncio.Queue()
+            self._writer_lock = asyncio.Lock()
+            self._writer = await self._open()
+            print(f"🗄️ SQLite pool opened: {self.db_path}")
+
+    @asynccontextmanager
+    async def read(self) -> AsyncGenerator[aiosqlite.Connection, None]:
+        """Borrow a reader connection"""
+        await self._ensure_initialized()
+        readers = self._readers
+        assert readers is not None
+
+        if readers.empty() and self._reader_count < self.max_readers:
+            # Reserve the slot before awaiting so concurrent callers cannot overshoot
+            self._reader_count += 1
+            try:
+                conn = await self._open()
+            except BaseException:
+                self._reader_count -= 1
+                raise
+            self._all_readers.append(conn)
+        else:
+            conn = await readers.get()
+
+        try:
+            yield conn
+        finally:
+            readers.put_nowait(conn)
+
+    @asynccontextmanager
+    async def write(self) -> AsyncGenerator[aiosqlite.Connection, None]:
+        """Acquire the writer connection; commits on success, rolls back on error"""
+        await self._ensure_initialized()
+        assert self._writer is not None and self._writer_lock is not None
+
+        async with self._writer_lock:
+            try:
+                yield self._writer
+                await self._writer.commit()
+            except BaseException:
+                await self._writer.rollback()
+                raise
+
+    async def close(self) -> None:
+        """Close every pooled connection"""
+        for conn in self._all_readers:
+            try:
+                await conn.close()
+            except Exception as e:
+                print(f"⚠️ Error closing SQLite reader connection: {e}")
+        self._all_readers = []
+        self._reader_count = 0
+        self._readers = None
+
+        if self._writer is not None:
+            try:
+                await self._writer.close()
+            except Exception as e:
+                print(f"⚠️ Error closing SQLite writer connection: {e}")
+            self._writer = None
+            self._writer_lock = None
+        print(f"🗄️ SQLite pool closed: {self.db_path}")
@@ -1,8 +1,9 @@
 import asyncpg
 import json
 import os
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from .config_service import USER_DATA_DIR
+from .canvas_rows import split_canvas_data, element_id
 
 class SupabaseService:
     def __init__(self):
@@ -18,6 +19,103 @@ class SupabaseService:
             max_size=10,
             command_timeout=60
         )
+        async with self.pool.acquire() as conn:
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS file_locations (
+                    file_id TEXT PRIMARY KEY,
+                    storage_path TEXT NOT NULL,
+                    created_at TIMESTAMPTZ DEFAULT NOW()
+                )
+            """)
+            # Covering index of the history pages; the messages table itself
+            # comes from the project's schema, so don't fail startup without it
+            await conn.execute("""
+                DO $$
+                BEGIN
+                    IF to_regclass('messages') IS NOT NULL THEN
+                        CREATE INDEX IF NOT EXISTS idx_messages_session_id_created_at_id
+                            ON messages(session_id, created_at, id) INCLUDE (role);
+                    END IF;
+                END $$
+            """)
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS tool_confirmations (
+                    tool_call_id TEXT PRIMARY KEY,
+                    session_id TEXT,
+                    tool_name TEXT,
+                    confirmed BOOLEAN,
+                    created_at DOUBLE PRECISION NOT NULL,
+                    expires_at DOUBLE PRECISION NOT NULL
+                )
+            """)
+            await conn.execute("CREATE INDEX IF NOT EXISTS idx_tool_confirmations_expires_at ON tool_confirmations(expires_at)")
+            # Canvas elements and files as rows, like the SQLite schema (v4), so
+            # adding an element writes one row instead of the whole canvas blob
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS canvas_elements (
+                    canvas_id TEXT NOT NULL,
+                    id TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (canvas_id, id)
+                )
+            """)
+            await conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_canvas_elements_canvas_id_position ON canvas_elements(canvas_id, position)")
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS canvas_files (
+                    canvas_id TEXT NOT NULL,
+                    id TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (canvas_id, id)
+                )
+            """)
+            await self._move_canvas_blobs_to_rows(conn)
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS chat_summaries (
+                    session_id TEXT PRIMARY KEY,
+                    covered_count INTEGER NOT NULL,
+                    covered_digest TEXT NOT NULL,
+                    summary TEXT NOT NULL,
+                    updated_at TIMESTAMPTZ DEFAULT NOW()
+                )
+            """)
+
+    async def _move_canvas_blobs_to_rows(self, conn):
+        """Move elements and files still inside canvases.data to their rows, once per canvas"""
+        if not await conn.fetchval("SELECT to_regclass('canvases') IS NOT NULL"):
+            return
+        canvas_ids = await conn.fetch("""
+            SELECT id FROM canvases
+            WHERE data::text LIKE '%"elements"%' OR data::text LIKE '%"files"%'
+        """)
+        moved = 0
+        for record in canvas_ids:
+            async with conn.transaction():
+                # Locked and read again, another instance may be moving the same canvas
+                data = await conn.fetchval("SELECT data::text FROM canvases WHERE id = $1 FOR UPDATE", record['id'])
+                try:
+                    blob = json.loads(data) if data else {}
+                except ValueError:
+                    continue
+                if not isinstance(blob, dict) or not ('elements' in blob or 'files' in blob):
+                    continue
+                rest, elements, files = split_canvas_data(blob)
+                element_rows = {
+                    element_id(element, position): (position, json.dumps(element))
+                    for position, element in enumerate(elements)
+                }
+                await conn.executemany("""
+                    INSERT INTO canvas_elements (canvas_id, id, position, data)
+                    VALUES ($1, $2, $3, $4)
+                    ON CONFLICT (canvas_id, id) DO UPDATE SET position = EXCLUDED.position, data = EXCLUDED.data
+                """, [(record['id'], row_id, position, element_data)
+                      for row_id, (position, element_data) in element_rows.items()])
+                await self._upsert_canvas_files(conn, record['id'], files)
+                await conn.execute("UPDATE canvases SET data = $1 WHERE id = $2", json.dumps(rest), record['id'])
+                moved += 1
+        if moved:
+            print(f"✅ Moved the elements and files of {moved} canvases to their own rows")
 
     async def close(self):
         """Close the connection pool"""
@@ -60,6 +158,69 @@ class SupabaseService:
             """, id, session_id, role, json.dumps(content), 
                 json.dumps(tool_calls) if tool_calls else None, tool_call_id)
 
+    async def create_messages(self, messages: List[Tuple[str, str, str, Dict[str, Any], Optional[Dict[str, Any]], Optional[str]]]):
+        """Save several chat messages in one transaction
+
+        Args:
+            messages: List of (id, session_id, role, content, tool_calls, tool_call_id) tuples
+        """
+        if not messages:
+            return
+        records = [
+            (id, session_id, role, json.dumps(content),
+             json.dumps(tool_calls) if tool_calls else None, tool_call_id)
+            for id, session_id, role, content, tool_calls, tool_call_id in messages
+        ]
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                # NOW() is the same for the whole transaction, clock_timestamp() keeps the batch in order
+                await conn.executemany("""
+                    INSERT INTO messages (id, session_id, role, content, tool_calls, tool_call_id, created_at)
+                    VALUES ($1, $2, $3, $4, $5, $6, clock_timestamp())
+                """, records)
+
+    @staticmethod
+    def _row_to_message(row: Any) -> Dict[str, Any]:
+        """Convert a messages row to an OpenAI-format message"""
+        content = row['content']
+        if isinstance(content, str):
+            try:
+                content = json.loads(content)
+            except:
+                content = {"text": content}
+
+        tool_calls = row['tool_calls']
+        if tool_calls and isinstance(tool_calls, str):
+            try:
+                tool_calls = json.loads(tool_calls)
+            except:
+                tool_calls = None
+
+        tool_call_id = row['tool_call_id']
+        # Handle nested content structure
+        if isinstance(content, dict) and 'content' in content and 'role' in content:
+            # If content is nested (contains role and content), extract the inner content;
+            # create_messages stores whole messages, their tool calls are in there too
+            actual_content = content['content']
+            tool_calls = tool_calls or content.get('tool_calls')
+            tool_call_id = tool_call_id or content.get('tool_call_id')
+        else:
+            # If content is direct, use it as is
+            actual_content = content
+
+        message = {
+            "role": row['role'],
+            "content": actual_content
+        }
+
+        if tool_calls:
+            message["tool_calls"] = tool_calls
+
+        if tool_call_id:
+            message["tool_call_id"] = tool_call_id
+
+        return message
+
     async def get_chat_history(self, session_id: str) -> List[Dict[str, Any]]:
         """Get chat history for a session"""
         async with self.pool.acquire() as conn:
@@ -67,47 +228,52 @@ class SupabaseService:
                 SELECT id, role, content, tool_calls, tool_call_id, created_at
                 FROM messages
                 WHERE session_id = $1
-                ORDER BY created_at ASC
+                ORDER BY created_at ASC, id ASC
             """, session_id)
-            
-            messages = []
-            for row in rows:
-                content = row['content']
-                if isinstance(content, str):
-                    try:
-                        content = json.loads(content)
-                    except:
-                        content = {"text": content}
-                
-                tool_calls = row['tool_calls']
-                if tool_calls and isinstance(tool_calls, str):
-                    try:
-                        tool_calls = json.loads(tool_calls)
-                    except:
-                        tool_calls = None
-
-                # Handle nested content structure
-                if isinstance(content, dict) and 'content' in content and 'role' in content:
-                    # If content is nested (contains role and content), extract the inner content
-                    actual_content = content['content']
-                else:
-                    # If content is direct, use it as is
-                    actual_content = content
-                
-                message = {
-                    "role": row['role'],
-                    "content": actual_content
-                }
-                
-                if tool_calls:
-                    message["tool_calls"] = tool_calls
-                
-                if row['tool_call_id']:
-                    message["tool_call_id"] = row['tool_call_id']
-                
-                messages.append(message)
-                
-            return messages
+            return [self._row_to_message(row) for row in rows]
+
+    async def list_chat_message_roles(self, session_id: str, before_id: Optional[str], limit: int) -> List[Dict[str, Any]]:
+        """Ids and roles of up to limit messages older than message before_id, newest first"""
+        async with self.pool.acquire() as conn:
+            # Message ids are random, the cursor is the (created_at, id) of before_id
+            rows = await conn.fetch("""
+                SELECT id, role
+                FROM messages
+                WHERE session_id = $1
+                  AND ($2::text IS NULL OR (created_at, id) < (
+                      SELECT created_at, id FROM messages WHERE id = $2 AND session_id = $1))
+                ORDER BY created_at DESC, id DESC
+                LIMIT $3
+            """, session_id, before_id, limit)
+            return [dict(row) for row in rows]
+
+    async def count_chat_messages_before(self, session_id: str, before_id: str) -> int:
+        """Number of messages older than message before_id"""
+        async with self.pool.acquire() as conn:
+            return await conn.fetchval("""
+                SELECT COUNT(*)
+                FROM messages
+                WHERE session_id = $1
+                  AND (created_at, id) < (SELECT created_at, id FROM messages WHERE id = $2 AND session_id = $1)
+            """, session_id, before_id)
+
+    async def get_chat_messages_range(self, session_id: str, first_id: str, last_id: str) -> List[Dict[str, Any]]:
+        """Messages from first_id to last_id inclusive, oldest first"""
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch("""
+                WITH bounds AS (
+                    SELECT
+                        (SELECT ROW(created_at, id) FROM messages WHERE id = $2) AS first_key,
+                        (SELECT ROW(created_at, id) FROM messages WHERE id = $3) AS last_key
+                )
+                SELECT m.id, m.role, m.content, m.tool_calls, m.tool_call_id, m.created_at
+                FROM messages m, bounds
+                WHERE m.session_id = $1
+                  AND ROW(m.created_at, m.id) >= bounds.first_key
+                  AND ROW(m.created_at, m.id) <= bounds.last_key
+                ORDER BY m.created_at ASC, m.id ASC
+            """, session_id, first_id, last_id)
+            return [self._row_to_message(row) for row in rows]
 
     async def list_sessions(self, canvas_id: str) -> List[Dict[str, Any]]:
         """List all chat sessions"""
@@ -128,39 +294,166 @@ class SupabaseService:
             return [dict(row) for row in rows]
 
     async def save_canvas_data(self, id: str, data: str, thumbnail: str = None):
-        """Save canvas data"""
+        """Save canvas data
+
+        Elements and files are stored as rows; only the ones that changed
+        since the last save are written.
+        """
+        rest, elements, files = split_canvas_data(data)
+
+        element_rows: Dict[str, Tuple[int, str]] = {}
+        for position, element in enumerate(elements):
+            element_rows[element_id(element, position)] = (position, json.dumps(element))
+        file_rows = {str(file_id): json.dumps(file_data) for file_id, file_data in files.items()}
+
         async with self.pool.acquire() as conn:
-            await conn.execute("""
-                UPDATE canvases 
-                SET data = $1, thumbnail = $2, updated_at = NOW()
-                WHERE id = $3
-            """, json.dumps(data) if isinstance(data, (dict, list)) else data, thumbnail, id)
+            async with conn.transaction():
+                # Serialize the writers of this canvas on its row
+                await conn.execute("SELECT 1 FROM canvases WHERE id = $1 FOR UPDATE", id)
+                rows = await conn.fetch("SELECT id, position, data FROM canvas_elements WHERE canvas_id = $1", id)
+                existing_elements = {row['id']: (row['position'], row['data']) for row in rows}
+                rows = await conn.fetch("SELECT id, data FROM canvas_files WHERE canvas_id = $1", id)
+                existing_files = {row['id']: row['data'] for row in rows}
+
+                await conn.executemany("""
+                    INSERT INTO canvas_elements (canvas_id, id, position, data)
+                    VALUES ($1, $2, $3, $4)
+                    ON CONFLICT (canvas_id, id) DO UPDATE SET position = EXCLUDED.position, data = EXCLUDED.data
+                """, [
+                    (id, row_id, position, element_data)
+                    for row_id, (position, element_data) in element_rows.items()
+                    if existing_elements.get(row_id) != (position, element_data)
+                ])
+                removed = list(existing_elements.keys() - element_rows.keys())
+                if removed:
+                    await conn.execute(
+                        "DELETE FROM canvas_elements WHERE canvas_id = $1 AND id = ANY($2::text[])", id, removed)
+
+                await conn.executemany("""
+                    INSERT INTO canvas_files (canvas_id, id, data)
+                    VALUES ($1, $2, $3)
+                    ON CONFLICT (canvas_id, id) DO UPDATE SET data = EXCLUDED.data
+                """, [
+                    (id, file_id, file_data)
+                    for file_id, file_data in file_rows.items()
+                    if existing_files.get(file_id) != file_data
+                ])
+                removed = list(existing_files.keys() - file_rows.keys())
+                if removed:
+                    await conn.execute(
+                        "DELETE FROM canvas_files WHERE canvas_id = $1 AND id = ANY($2::text[])", id, removed)
+
+                await conn.execute("""
+                    UPDATE canvases 
+                    SET data = $1, thumbnail = $2, updated_at = NOW()
+                    WHERE id = $3
+                """, json.dumps(rest), thumbnail, id)
 
     async def get_canvas_data(self, id: str) -> Optional[Dict[str, Any]]:
-        """Get canvas data"""
+        """Get canvas data, reassembled from the canvas and its element/file rows"""
         async with self.pool.acquire() as conn:
             row = await conn.fetchrow("""
                 SELECT data, name
                 FROM canvases
                 WHERE id = $1
             """, id)
+            if not row:
+                return None
+            element_rows = await conn.fetch("""
+                SELECT data FROM canvas_elements
+                WHERE canvas_id = $1
+                ORDER BY position
+            """, id)
+            file_rows = await conn.fetch("SELECT id, data FROM canvas_files WHERE canvas_id = $1", id)
 
-            sessions = await self.list_sessions(id)
-            
-            if row:
-                canvas_data = row['data']
-                if isinstance(canvas_data, str):
-                    try:
-                        canvas_data = json.loads(canvas_data)
-                    except:
-                        canvas_data = {}
-                        
-                return {
-                    'data': canvas_data,
-                    'name': row['name'],
-                    'sessions': sessions
-                }
-            return None
+        sessions = await self.list_sessions(id)
+
+        canvas_data = row['data']
+        if isinstance(canvas_data, str):
+            try:
+                canvas_data = json.loads(canvas_data) if canvas_data else {}
+            except:
+                canvas_data = {}
+        canvas_data = canvas_data or {}
+        if canvas_data or element_rows or file_rows:
+            canvas_data['elements'] = [json.loads(r['data']) for r in element_rows]
+            canvas_data['files'] = {r['id']: json.loads(r['data']) for r in file_rows}
+        return {
+            'data': canvas_data,
+            'name': row['name'],
+            'sessions': sessions
+        }
+
+    async def get_canvas_elements(self, canvas_id: str) -> List[Dict[str, Any]]:
+        """Get the elements of a canvas in z-order, without files or app state"""
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT data FROM canvas_elements
+                WHERE canvas_id = $1
+                ORDER BY position
+            """, canvas_id)
+        return [json.loads(row['data']) for row in rows]
+
+    async def append_canvas_elements(self, canvas_id: str, elements: List[Dict[str, Any]], files: Optional[Dict[str, Any]] = None):
+        """Append elements on top of the canvas and add their files
+
+        An element whose id already exists is replaced and moved to the top.
+        """
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("SELECT 1 FROM canvases WHERE id = $1 FOR UPDATE", canvas_id)
+                top = await conn.fetchval(
+                    "SELECT COALESCE(MAX(position), -1) FROM canvas_elements WHERE canvas_id = $1", canvas_id)
+                await conn.executemany("""
+                    INSERT INTO canvas_elements (canvas_id, id, position, data)
+                    VALUES ($1, $2, $3, $4)
+                    ON CONFLICT (canvas_id, id) DO UPDATE SET position = EXCLUDED.position, data = EXCLUDED.data
+                """, [
+                    (canvas_id, element_id(element, top + 1 + i), top + 1 + i, json.dumps(element))
+                    for i, element in enumerate(elements)
+                ])
+                await self._upsert_canvas_files(conn, canvas_id, files)
+                await self._touch_canvas(conn, canvas_id)
+
+    async def patch_canvas_elements(self, canvas_id: str, elements: Optional[List[Dict[str, Any]]] = None, files: Optional[Dict[str, Any]] = None):
+        """Update elements and files by id, keeping their position
+
+        Elements that don't exist yet are appended on top.
+        """
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("SELECT 1 FROM canvases WHERE id = $1 FOR UPDATE", canvas_id)
+                if elements:
+                    top = await conn.fetchval(
+                        "SELECT COALESCE(MAX(position), -1) FROM canvas_elements WHERE canvas_id = $1", canvas_id)
+                    for element in elements:
+                        element_data = json.dumps(element)
+                        status = await conn.execute("""
+                            UPDATE canvas_elements SET data = $1
+                            WHERE canvas_id = $2 AND id = $3
+                        """, element_data, canvas_id, str(element.get('id')))
+                        if status == 'UPDATE 0':
+                            top += 1
+                            await conn.execute("""
+                                INSERT INTO canvas_elements (canvas_id, id, position, data)
+                                VALUES ($1, $2, $3, $4)
+                            """, canvas_id, element_id(element, top), top, element_data)
+                await self._upsert_canvas_files(conn, canvas_id, files)
+                await self._touch_canvas(conn, canvas_id)
+
+    @staticmethod
+    async def _upsert_canvas_files(conn, canvas_id: str, files: Optional[Dict[str, Any]]):
+        if not files:
+            return
+        await conn.executemany("""
+            INSERT INTO canvas_files (canvas_id, id, data)
+            VALUES ($1, $2, $3)
+            ON CONFLICT (canvas_id, id) DO UPDATE SET data = EXCLUDED.data
+        """, [(canvas_id, str(file_id), json.dumps(file_data)) for file_id, file_data in files.items()])
+
+    @staticmethod
+    async def _touch_canvas(conn, canvas_id: str):
+        await conn.execute("UPDATE canvases SET updated_at = NOW() WHERE id = $1", canvas_id)
 
     async def get_or_create_canvas(self, canvas_id: str, canvas_name: str) -> Dict[str, Any]:
         """Tries to fetch a canvas by its ID. If it doesn't exist, creates a new one."""
@@ -188,13 +481,101 @@ class SupabaseService:
     async def delete_canvas(self, id: str):
         """Delete canvas and related data"""
         async with self.pool.acquire() as conn:
-            await conn.execute("DELETE FROM canvases WHERE id = $1", id)
+            async with conn.transaction():
+                await conn.execute("DELETE FROM canvas_elements WHERE canvas_id = $1", id)
+                await conn.execute("DELETE FROM canvas_files WHERE canvas_id = $1", id)
+                await conn.execute("DELETE FROM canvases WHERE id = $1", id)
 
     async def rename_canvas(self, id: str, name: str):
         """Rename canvas"""
         async with self.pool.acquire() as conn:
             await conn.execute("UPDATE canvases SET name = $1 WHERE id = $2", name, id)
 
+    async def save_file_locations(self, locations: List[Tuple[str, str]]):
+        """Record where files live in remote storage, as (file_id, storage_path) pairs"""
+        async with self.pool.acquire() as conn:
+            await conn.executemany("""
+                INSERT INTO file_locations (file_id, storage_path)
+                VALUES ($1, $2)
+                ON CONFLICT (file_id) DO UPDATE SET storage_path = EXCLUDED.storage_path
+            """, locations)
+
+    async def get_file_location(self, file_id: str) -> Optional[str]:
+        """Get the remote storage path of a file"""
+        async with self.pool.acquire() as conn:
+            return await conn.fetchval("SELECT storage_path FROM file_locations WHERE file_id = $1", file_id)
+
+    async def get_chat_summary(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Rolling summary of the session's oldest messages, if any"""
+        async with self.pool.acquire() as conn:
+            row = await conn.fetchrow("""
+                SELECT covered_count, covered_digest, summary
+                FROM chat_summaries
+                WHERE session_id = $1
+            """, session_id)
+            return dict(row) if row else None
+
+    async def save_chat_summary(self, session_id: str, covered_count: int, covered_digest: str, summary: str):
+        """Store the rolling summary of the session's first covered_count messages"""
+        async with self.pool.acquire() as conn:
+            await conn.execute("""
+                INSERT INTO chat_summaries (session_id, covered_count, covered_digest, summary)
+                VALUES ($1, $2, $3, $4)
+                ON CONFLICT (session_id) DO UPDATE SET
+                    covered_count = EXCLUDED.covered_count,
+                    covered_digest = EXCLUDED.covered_digest,
+                    summary = EXCLUDED.summary,
+                    updated_at = NOW()
+            """, session_id, covered_count, covered_digest, summary)
+
+    async def save_tool_confirmation(self, tool_call_id: str, session_id: str, tool_name: str,
+                                     created_at: float, expires_at: float):
+        """Record a tool call waiting for the user's confirmation"""
+        async with self.pool.acquire() as conn:
+            await conn.execute("""
+                INSERT INTO tool_confirmations (tool_call_id, session_id, tool_name, confirmed, created_at, expires_at)
+                VALUES ($1, $2, $3, NULL, $4, $5)
+                ON CONFLICT (tool_call_id) DO UPDATE SET
+                    session_id = EXCLUDED.session_id,
+                    tool_name = EXCLUDED.tool_name,
+                    confirmed = NULL,
+                    created_at = EXCLUDED.created_at,
+                    expires_at = EXCLUDED.expires_at
+            """, tool_call_id, session_id, tool_name, created_at, expires_at)
+
+    async def resolve_tool_confirmation(self, tool_call_id: str, confirmed: bool, now: float) -> bool:
+        """Record the user's decision, False if the tool call isn't waiting (any more)"""
+        async with self.pool.acquire() as conn:
+            result = await conn.execute("""
+                UPDATE tool_confirmations
+                SET confirmed = $1
+                WHERE tool_call_id = $2 AND confirmed IS NULL AND expires_at > $3
+            """, confirmed, tool_call_id, now)
+            return result != 'UPDATE 0'
+
+    async def get_tool_confirmation_decisions(self, tool_call_ids: List[str]) -> Dict[str, bool]:
+        """Decisions made so far for the given tool calls"""
+        if not tool_call_ids:
+            return {}
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT tool_call_id, confirmed
+                FROM tool_confirmations
+                WHERE confirmed IS NOT NULL AND tool_call_id = ANY($1::text[])
+            """, tool_call_ids)
+            return {row['tool_call_id']: row['confirmed'] for row in rows}
+
+    async def delete_tool_confirmation(self, tool_call_id: str):
+        """Forget a tool call that stopped waiting"""
+        async with self.pool.acquire() as conn:
+            await conn.execute("DELETE FROM tool_confirmations WHERE tool_call_id = $1", tool_call_id)
+
+    async def delete_expired_tool_confirmations(self, now: float) -> int:
+        """Remove tool calls past their deadline (left by stopped processes), returns how many"""
+        async with self.pool.acquire() as conn:
+            result = await conn.execute("DELETE FROM tool_confirmations WHERE expires_at <= $1", now)
+            return int(result.split()[-1])
+
     async def create_comfy_workflow(self, name: str, api_json: str, description: str, inputs: str, outputs: str = None):
         """Create a new comfy workflow"""
         async with self.pool.acquire() as conn:
@@ -1,10 +1,40 @@
 import os
 import asyncio
-from typing import Optional, Tuple
+import base64
+from typing import AsyncIterator, List, Optional, Tuple
 import aiofiles
-import httpx
 from urllib.parse import urlparse
 import json
+from utils.http_client import HttpClient
+from services.file_index_service import file_index_service
+
+CONTENT_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp',
+    '.avif': 'image/avif',
+    '.bmp': 'image/bmp'
+}
+# Files above this go through the resumable (TUS) endpoint; Supabase requires 6 MB chunks
+RESUMABLE_THRESHOLD = 6 * 1024 * 1024
+RESUMABLE_CHUNK_SIZE = 6 * 1024 * 1024
+READ_CHUNK_SIZE = 256 * 1024
+
+
+async def _read_chunks(file_path: str, offset: int = 0, length: Optional[int] = None) -> AsyncIterator[bytes]:
+    """Stream a file (or length bytes of it from offset) as a request body"""
+    remaining = os.path.getsize(file_path) - offset if length is None else length
+    async with aiofiles.open(file_path, 'rb') as file:
+        await file.seek(offset)
+        while remaining > 0:
+            chunk = await file.read(min(READ_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
 
 class SupabaseStorageService:
     def __init__(self):
@@ -34,13 +64,21 @@ class SupabaseStorageService:
             "Content-Type": "application/json"
         }
     
-    async def upload_file(self, file_path: str, storage_path: str) -> str:
+    async def _index_file(self, storage_path: str) -> None:
+        """Record the storage path so /api/file can find it without probing"""
+        try:
+            await file_index_service.record(storage_path)
+        except Exception as e:
+            print(f"⚠️ Could not index stored file {storage_path}: {e}")
+
+    async def upload_file(self, file_path: str, storage_path: str, upsert: bool = False) -> str:
         """
         Upload a file to Supabase Storage
         
         Args:
             file_path: Local file path
             storage_path: Path in storage (e.g., "images/filename.jpg")
+            upsert: Overwrite an existing object (retrying an upload that may have gone through)
             
         Returns:
             Public URL of the uploaded file
@@ -51,48 +89,102 @@ class SupabaseStorageService:
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"File not found: {file_path}")
         
-        # Read file content
-        async with aiofiles.open(file_path, 'rb') as file:
-            file_content = await file.read()
-        
         # Determine content type based on file extension
         file_extension = os.path.splitext(storage_path)[1].lower()
-        content_type_map = {
-            '.jpg': 'image/jpeg',
-            '.jpeg': 'image/jpeg',
-            '.png': 'image/png',
-            '.gif': 'image/gif',
-            '.webp': 'image/webp',
-            '.bmp': 'image/bmp'
-        }
-        content_type = content_type_map.get(file_extension, 'application/octet-stream')
-        
-        # Upload to Supabase Storage
-        upload_url = f"{self._get_storage_url()}/object/{self.bucket_name}/{storage_path}"
-        
-        headers = {
-            "Authorization": f"Bearer {self.supabase_key}",
-            "Content-Type": content_type
-        }
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                upload_url,
-                content=file_content,
-                headers=headers,
-                timeout=30.0
-            )
-            
-            if response.status_code not in [200, 201]:
-                error_text = response.text
-                raise Exception(f"Failed to upload to Supabase Storage: {response.status_code} - {error_text}")
-        
+        content_type = CONTENT_TYPES.get(file_extension, 'application/octet-stream')
+        file_size = os.path.getsize(file_path)
+
+        if file_size > RESUMABLE_THRESHOLD:
+            await self._upload_resumable(file_path, file_size, storage_path, content_type, upsert=upsert)
+        else:
+            # Upload to Supabase Storage, streaming the body from disk
+            upload_url = f"{self._get_storage_url()}/object/{self.bucket_name}/{storage_path}"
+
+            headers = {
+                "Authorization": f"Bearer {self.supabase_key}",
+                "Content-Type": content_type,
+                "Content-Length": str(file_size),
+            }
+            if upsert:
+                headers["x-upsert"] = "true"
+
+            async with HttpClient.create(url=self.supabase_url) as client:
+                response = await client.post(
+                    upload_url,
+                    content=_read_chunks(file_path),
+                    headers=headers,
+                    timeout=30.0
+                )
+
+                if response.status_code not in [200, 201]:
+                    error_text = response.text
+                    raise Exception(f"Failed to upload to Supabase Storage: {response.status_code} - {error_text}")
+
         # Generate public URL
         public_url = f"{self.supabase_url}/storage/v1/object/public/{self.bucket_name}/{storage_path}"
-        
+
         print(f"📤 Uploaded to Supabase Storage: {storage_path} -> {public_url}")
+        await self._index_file(storage_path)
         return public_url
-    
+
+    async def _upload_resumable(self, file_path: str, file_size: int, storage_path: str, content_type: str,
+                                retries: int = 3, upsert: bool = False) -> None:
+        """
+        Upload a large file with the TUS resumable protocol, RESUMABLE_CHUNK_SIZE at a time
+
+        A dropped chunk is retried from the offset the server reports, so only
+        that chunk is sent again.
+        """
+        upload_url = f"{self._get_storage_url()}/upload/resumable"
+        metadata = {
+            'bucketName': self.bucket_name,
+            'objectName': storage_path,
+            'contentType': content_type,
+        }
+        base_headers = {
+            "Authorization": f"Bearer {self.supabase_key}",
+            "Tus-Resumable": "1.0.0",
+        }
+
+        async with HttpClient.create(url=self.supabase_url) as client:
+            response = await client.post(upload_url, headers={
+                **base_headers,
+                **({"x-upsert": "true"} if upsert else {}),
+                "Upload-Length": str(file_size),
+                "Upload-Metadata": ','.join(
+                    f"{key} {base64.b64encode(value.encode('utf-8')).decode('ascii')}" for key, value in metadata.items()
+                ),
+            }, timeout=30.0)
+            if response.status_code != 201 or 'location' not in response.headers:
+                raise Exception(f"Failed to start resumable upload: {response.status_code} - {response.text}")
+            location = response.headers['location']
+
+            offset = 0
+            failures = 0
+            while offset < file_size:
+                length = min(RESUMABLE_CHUNK_SIZE, file_size - offset)
+                try:
+                    response = await client.patch(location, headers={
+                        **base_headers,
+                        "Upload-Offset": str(offset),
+                        "Content-Type": "application/offset+octet-stream",
+                        "Content-Length": str(length),
+                    }, content=_read_chunks(file_path, offset, length), timeout=120.0)
+                    if response.status_code != 204:
+                        raise Exception(f"Failed to upload chunk at {offset}: {response.status_code} - {response.text}")
+                    offset = int(response.headers.get('upload-offset', offset + length))
+                    failures = 0
+                except Exception as e:
+                    failures += 1
+                    if failures > retries:
+                        raise
+                    print(f"⚠️ Resumable upload of {storage_path} interrupted at {offset} bytes ({e}), resuming")
+                    await asyncio.sleep(0.5 * 2 ** failures)
+                    # Continue from what the server actually received
+                    head = await client.head(location, headers=base_headers, timeout=30.0)
+                    if head.status_code == 200 and 'upload-offset' in head.headers:
+                        offset = int(head.headers['upload-offset'])
+
     async def upload_file_content(self, file_content: bytes, storage_path: str, content_type: str = None) -> str:
         """
         Upload file content directly to Supabase Storage
@@ -111,15 +203,7 @@ class SupabaseStorageService:
         # Determine content type if not provided
         if not content_type:
             file_extension = os.path.splitext(storage_path)[1].lower()
-            content_type_map = {
-                '.jpg': 'image/jpeg',
-                '.jpeg': 'image/jpeg',
-                '.png': 'image/png',
-                '.gif': 'image/gif',
-                '.webp': 'image/webp',
-                '.bmp': 'image/bmp'
-            }
-            content_type = content_type_map.get(file_extension, 'application/octet-stream')
+            content_type = CONTENT_TYPES.get(file_extension, 'application/octet-stream')
         
         # Upload to Supabase Storage
         upload_url = f"{self._get_storage_url()}/object/{self.bucket_name}/{storage_path}"
@@ -129,7 +213,7 @@ class SupabaseStorageService:
             "Content-Type": content_type
         }
         
-        async with httpx.AsyncClient() as client:
+        async with HttpClient.create(url=self.supabase_url) as client:
             response = await client.post(
                 upload_url,
                 content=file_content,
@@ -145,8 +229,44 @@ class SupabaseStorageService:
         public_url = f"{self.supabase_url}/storage/v1/object/public/{self.bucket_name}/{storage_path}"
         
         print(f"📤 Uploaded content to Supabase Storage: {storage_path} -> {public_url}")
+        await self._index_file(storage_path)
         return public_url
     
+    async def list_files(self, prefix: str, page_size: int = 1000) -> List[str]:
+        """
+        List the storage paths of the files directly under a folder
+        
+        Args:
+            prefix: Folder in storage (e.g., "uploads")
+            page_size: Number of entries fetched per request
+            
+        Returns:
+            Storage paths (e.g., ["uploads/im_xxx.png"])
+        """
+        if not self.initialized:
+            raise ValueError("Supabase Storage not initialized")
+        
+        list_url = f"{self._get_storage_url()}/object/list/{self.bucket_name}"
+        paths: List[str] = []
+        offset = 0
+        
+        async with HttpClient.create(url=self.supabase_url) as client:
+            while True:
+                response = await client.post(
+                    list_url,
+                    json={"prefix": prefix, "limit": page_size, "offset": offset},
+                    headers=self._get_headers()
+                )
+                if response.status_code != 200:
+                    raise Exception(f"Failed to list Supabase Storage: {response.status_code} - {response.text}")
+                
+                entries = response.json()
+                # Folders come back with a null id
+                paths.extend(f"{prefix}/{entry['name']}" for entry in entries if entry.get('id'))
+                if len(entries) < page_size:
+                    return paths
+                offset += page_size
+    
     def get_public_url(self, storage_path: str) -> str:
         """
         Get public URL for a file in storage
@@ -175,7 +295,7 @@ class SupabaseStorageService:
         # Check if bucket exists
         list_url = f"{self._get_storage_url()}/bucket"
         
-        async with httpx.AsyncClient() as client:
+        async with HttpClient.create(url=self.supabase_url) as client:
             response = await client.get(list_url, headers=self._get_headers())
             
             if response.status_code == 200:
@@ -1,7 +1,37 @@
+"""
+Confirmation of tool calls by the user
+
+Tools that need the user's go-ahead (e.g. paid video generation) call
+`request_confirmation` and wait for the POST /api/tool_confirmation answer.
+Each waiting call used to spin on asyncio.sleep(0.1) for up to 5 minutes,
+and its entry stayed in memory forever. Now:
+
+- every request waits on its own future, resolved directly by
+  confirm_tool / cancel_confirmation when they run in the same process,
+  and removed as soon as the tool stops waiting
+- with TOOL_CONFIRMATION_BACKEND=database the pending calls are also
+  recorded in the `tool_confirmations` table (SQLite, or Supabase when it
+  is the main store), so an answer handled by another server process is
+  written there and picked up by the process running the tool; one loop
+  per process checks the table every TOOL_CONFIRMATION_POLL_SECONDS, and
+  only while tools are waiting
+- the same loop sweeps expired requests every SWEEP_INTERVAL_SECONDS,
+  including rows left in the table by processes that stopped
+
+Tuning (environment variables):
+    TOOL_CONFIRMATION_BACKEND       memory (single process, default) or database
+    TOOL_CONFIRMATION_POLL_SECONDS  shared table check interval while waiting (default 0.5)
+"""
+
 import asyncio
+import os
+import time
 from typing import Dict, Any, Optional
 from dataclasses import dataclass
 from datetime import datetime, timedelta
+from services.db_adapter import db_adapter
+
+SWEEP_INTERVAL_SECONDS = 60
 
 
 @dataclass
@@ -17,9 +47,22 @@ class ToolConfirmationRequest:
 class ToolConfirmationManager:
     """工具确认管理器"""
 
-    def __init__(self):
+    def __init__(self, backend: Optional[str] = None, poll_interval: Optional[float] = None):
         self.pending_confirmations: Dict[str, ToolConfirmationRequest] = {}
         self.confirmation_timeout = timedelta(minutes=5)  # 5分钟超时
+        self.backend = backend or os.environ.get('TOOL_CONFIRMATION_BACKEND', 'memory')
+        self.poll_interval = poll_interval or float(os.environ.get('TOOL_CONFIRMATION_POLL_SECONDS', 0.5))
+        self._futures: Dict[str, 'asyncio.Future[bool]'] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop_task: Optional['asyncio.Task[None]'] = None
+        # Whether the loop is checking the shared table (rather than idling until the next sweep)
+        self._polling = False
+        self.stats = {'requested': 0, 'confirmed': 0, 'cancelled': 0, 'timeouts': 0,
+                      'resolved_elsewhere': 0, 'polls': 0, 'swept': 0}
+
+    @property
+    def shared(self) -> bool:
+        return self.backend == 'database'
 
     async def request_confirmation(self, tool_call_id: str, session_id: str, tool_name: str, arguments: Dict[str, Any]) -> bool:
         """请求工具确认，返回是否已确认"""
@@ -30,56 +73,142 @@ class ToolConfirmationManager:
             arguments=arguments,
             created_at=datetime.now()
         )
-
+        future: 'asyncio.Future[bool]' = asyncio.get_running_loop().create_future()
         self.pending_confirmations[tool_call_id] = request
+        self._futures[tool_call_id] = future
+        self.stats['requested'] += 1
 
-        # 等待确认或超时
+        timeout = self.confirmation_timeout.total_seconds()
         try:
-            await asyncio.wait_for(
-                self._wait_for_confirmation(tool_call_id),
-                timeout=self.confirmation_timeout.total_seconds()
-            )
-            return request.confirmed is True
-        except asyncio.TimeoutError:
-            # 超时，自动取消
-            self.cancel_confirmation(tool_call_id)
-            return False
+            if self.shared:
+                now = time.time()
+                await db_adapter.save_tool_confirmation(tool_call_id, session_id, tool_name, now, now + timeout)
+            self._ensure_loop()
+            if self.shared and not self._polling:
+                # Start checking the table now instead of at the next sweep
+                self._wakeup.set()
 
-    async def _wait_for_confirmation(self, tool_call_id: str):
-        """等待确认"""
-        while tool_call_id in self.pending_confirmations:
-            request = self.pending_confirmations[tool_call_id]
-            if request.confirmed is not None:
-                return
-            await asyncio.sleep(0.1)
+            # 等待确认或超时
+            try:
+                request.confirmed = await asyncio.wait_for(future, timeout=timeout)
+            except asyncio.TimeoutError:
+                # 超时，自动取消
+                request.confirmed = False
+                self.stats['timeouts'] += 1
+            return request.confirmed
+        finally:
+            self._forget(tool_call_id, future)
+            if self.shared:
+                try:
+                    await db_adapter.delete_tool_confirmation(tool_call_id)
+                except Exception as e:
+                    print(f"⚠️ Could not remove tool confirmation {tool_call_id}: {e}")
 
-    def confirm_tool(self, tool_call_id: str) -> bool:
-        """确认工具调用"""
-        if tool_call_id in self.pending_confirmations:
-            self.pending_confirmations[tool_call_id].confirmed = True
+    def _forget(self, tool_call_id: str, future: 'asyncio.Future[bool]') -> None:
+        # A newer request may have reused the tool_call_id, only drop our own entry
+        if self._futures.get(tool_call_id) is future:
+            del self._futures[tool_call_id]
+            self.pending_confirmations.pop(tool_call_id, None)
+
+    def _resolve_local(self, tool_call_id: str, confirmed: bool) -> bool:
+        future = self._futures.get(tool_call_id)
+        if future is None or future.done():
+            return False
+        future.set_result(confirmed)
+        self.stats['confirmed' if confirmed else 'cancelled'] += 1
+        return True
+
+    async def _resolve(self, tool_call_id: str, confirmed: bool) -> bool:
+        if self._resolve_local(tool_call_id, confirmed):
+            return True
+        if self.shared and await db_adapter.resolve_tool_confirmation(tool_call_id, confirmed, time.time()):
+            # The tool waits in another process, which picks the decision up from the table
+            self.stats['resolved_elsewhere'] += 1
             return True
         return False
 
-    def cancel_confirmation(self, tool_call_id: str) -> bool:
+    async def confirm_tool(self, tool_call_id: str) -> bool:
+        """确认工具调用"""
+        return await self._resolve(tool_call_id, True)
+
+    async def cancel_confirmation(self, tool_call_id: str) -> bool:
         """取消工具调用"""
-        if tool_call_id in self.pending_confirmations:
-            self.pending_confirmations[tool_call_id].confirmed = False
-            return True
-        return False
+        return await self._resolve(tool_call_id, False)
 
     def get_pending_request(self, tool_call_id: str) -> Optional[ToolConfirmationRequest]:
         """获取待确认的请求"""
         return self.pending_confirmations.get(tool_call_id)
 
-    def cleanup_expired(self):
-        """清理过期的确认请求"""
+    async def start(self) -> None:
+        """Start the sweeper (and the shared table checks), called on startup"""
+        self._ensure_loop()
+
+    async def stop(self) -> None:
+        """Stop the background loop; waiting tools time out on their own"""
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            await asyncio.gather(self._loop_task, return_exceptions=True)
+            self._loop_task = None
+            self._polling = False
+
+    def _ensure_loop(self) -> None:
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._loop_task is None or self._loop_task.done():
+            self._loop_task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        assert self._wakeup is not None
+        next_sweep = time.monotonic() + SWEEP_INTERVAL_SECONDS
+        while True:
+            try:
+                if self.shared and self._futures:
+                    await self._poll_shared()
+                if time.monotonic() >= next_sweep:
+                    next_sweep = time.monotonic() + SWEEP_INTERVAL_SECONDS
+                    await self.cleanup_expired()
+            except Exception as e:
+                print(f"⚠️ Tool confirmation loop error: {e}")
+
+            # Idle until the next sweep unless tools wait on the shared table
+            timeout = next_sweep - time.monotonic()
+            self._polling = self.shared and bool(self._futures)
+            if self._polling:
+                timeout = min(timeout, self.poll_interval)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(timeout, 0))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _poll_shared(self) -> None:
+        """Resolve the waiting tools answered through another process"""
+        self.stats['polls'] += 1
+        decisions = await db_adapter.get_tool_confirmation_decisions(list(self._futures))
+        for tool_call_id, confirmed in decisions.items():
+            self._resolve_local(tool_call_id, confirmed)
+
+    async def cleanup_expired(self) -> int:
+        """清理过期的确认请求，返回清理的数量"""
         now = datetime.now()
         expired_ids = [
             tool_call_id for tool_call_id, request in self.pending_confirmations.items()
             if now - request.created_at > self.confirmation_timeout
         ]
         for tool_call_id in expired_ids:
+            # Normally timed out by request_confirmation itself, this catches waiters that went away
+            future = self._futures.pop(tool_call_id, None)
+            if future is not None and not future.done():
+                future.set_result(False)
             del self.pending_confirmations[tool_call_id]
+        swept = len(expired_ids)
+        if self.shared:
+            swept += await db_adapter.delete_expired_tool_confirmations(time.time())
+        self.stats['swept'] += swept
+        return swept
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, 'backend': self.backend, 'pending': len(self._futures)}
 
 
 # 全局实例
@@ -196,6 +196,8 @@ TOOL_MAPPING: Dict[str, ToolInfo] = {
 class ToolService:
     def __init__(self):
         self.tools: Dict[str, ToolInfo] = {}
+        # Bumped whenever the registered tools change, caches built from them check it
+        self.version = 0
         self._register_required_tools()
 
     def _register_required_tools(self):
@@ -215,6 +217,7 @@ class ToolService:
             return
 
         self.tools[tool_id] = tool_info
+        self.version += 1
 
     # TODO: Check if there will be racing conditions when server just starting up but tools are not ready yet.
     async def initialize(self):
@@ -239,12 +242,14 @@ class ToolService:
 
     def remove_tool(self, tool_id: str):
         self.tools.pop(tool_id)
+        self.version += 1
 
     def get_all_tools(self) -> Dict[str, ToolInfo]:
         return self.tools.copy()
 
     def clear_tools(self):
         self.tools.clear()
+        self.version += 1
         # 重新注册必须的工具
         self._register_required_tools()
 
@@ -0,0 +1,171 @@
+# services/upload_queue_service.py
+"""
+Background uploads of generated files to Supabase Storage
+
+save_image_to_canvas used to upload every generated image before the result
+reached the canvas, so each generation waited on a storage round trip (and
+fell back to a local URL, keeping the local file forever, when it failed).
+Now the image is placed with its local /api/file URL right away and the
+upload is queued here:
+
+- jobs are journaled in the local `storage_uploads` table first, so pending
+  uploads survive restarts and are picked up again by `start()`
+- at most UPLOAD_QUEUE_CONCURRENCY (default 4) uploads run at once
+- failures are retried with exponential backoff, up to
+  UPLOAD_QUEUE_MAX_ATTEMPTS (default 8) attempts; after that the job is
+  marked failed and the file keeps being served locally
+- once uploaded, the canvas file entry is pointed at the storage URL, the
+  local copy is deleted and the journal row removed
+
+Clients still holding the local URL keep working: /api/file redirects to
+storage through the file index once the local file is gone.
+"""
+
+import asyncio
+import os
+import time
+from typing import Any, Dict, Optional
+from services.canvas_mutation_service import canvas_mutations
+from services.config_service import FILES_DIR
+from services.db_adapter import db_adapter
+from services.file_store import file_store
+from services.supabase_storage_service import supabase_storage
+
+RETRY_BASE_SECONDS = 5
+RETRY_MAX_SECONDS = 600
+
+
+class UploadQueue:
+    """Journaled, retried uploads of local files to Supabase Storage"""
+
+    def __init__(self, concurrency: Optional[int] = None, max_attempts: Optional[int] = None):
+        self.concurrency = concurrency or int(os.environ.get('UPLOAD_QUEUE_CONCURRENCY', 4))
+        self.max_attempts = max_attempts or int(os.environ.get('UPLOAD_QUEUE_MAX_ATTEMPTS', 8))
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._tasks: Dict[str, 'asyncio.Task[None]'] = {}
+        self.stats = {'enqueued': 0, 'resumed': 0, 'uploaded': 0, 'retries': 0, 'failed': 0, 'uploaded_bytes': 0}
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it belongs to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    async def start(self) -> None:
+        """Resume the uploads journaled before the last shutdown"""
+        jobs = await db_adapter.list_upload_jobs('pending')
+        for job in jobs:
+            self._spawn(job)
+        if jobs:
+            self.stats['resumed'] += len(jobs)
+            print(f"📤 Resuming {len(jobs)} pending storage uploads")
+
+    async def stop(self) -> None:
+        """Cancel running uploads, they stay journaled and resume on the next start"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    async def enqueue(self, file_name: str, storage_path: str, canvas_id: Optional[str] = None,
+                      canvas_file: Optional[Dict[str, Any]] = None) -> None:
+        """Journal FILES_DIR/{file_name} for upload to storage_path and start uploading it
+
+        canvas_file is the canvas file entry (with 'id') whose dataURL is
+        switched to the storage URL once the upload is done.
+        """
+        await db_adapter.save_upload_job(file_name, storage_path, canvas_id, canvas_file)
+        self.stats['enqueued'] += 1
+        self._spawn({
+            'file_name': file_name,
+            'storage_path': storage_path,
+            'canvas_id': canvas_id,
+            'canvas_file': canvas_file,
+            'attempts': 0,
+            'next_attempt_at': 0,
+        })
+
+    def _spawn(self, job: Dict[str, Any]) -> None:
+        file_name = job['file_name']
+        if file_name in self._tasks:
+            return
+        task = asyncio.create_task(self._run(job))
+        self._tasks[file_name] = task
+        task.add_done_callback(lambda _: self._tasks.pop(file_name, None))
+
+    async def _run(self, job: Dict[str, Any]) -> None:
+        file_name = job['file_name']
+        attempts = job['attempts']
+        next_attempt_at = job['next_attempt_at'] or 0
+        while True:
+            delay = next_attempt_at - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                async with self._get_semaphore():
+                    await self._upload(job)
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                attempts += 1
+                error = f"{type(e).__name__}: {e}"
+                # A missing local file won't come back, no point retrying
+                if attempts >= self.max_attempts or isinstance(e, FileNotFoundError):
+                    self.stats['failed'] += 1
+                    print(f"❌ Giving up uploading {file_name} after {attempts} attempts: {error}")
+                    await self._record_failure(file_name, 'failed', attempts, error, 0)
+                    return
+                self.stats['retries'] += 1
+                delay = min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS)
+                next_attempt_at = time.time() + delay
+                print(f"⚠️ Upload of {file_name} failed ({error}), retrying in {delay}s")
+                await self._record_failure(file_name, 'pending', attempts, error, next_attempt_at)
+
+    @staticmethod
+    async def _record_failure(file_name: str, status: str, attempts: int, error: str, next_attempt_at: float) -> None:
+        try:
+            await db_adapter.update_upload_job(file_name, status, attempts, error, next_attempt_at)
+        except Exception as e:
+            print(f"⚠️ Could not update the upload journal for {file_name}: {e}")
+
+    async def _upload(self, job: Dict[str, Any]) -> None:
+        file_name = job['file_name']
+        local_path = os.path.join(FILES_DIR, file_name)
+        size = os.path.getsize(local_path)
+        # upsert: a previous attempt may have uploaded the file before we could record it
+        public_url = await supabase_storage.upload_file(local_path, job['storage_path'], upsert=True)
+        self.stats['uploaded'] += 1
+        self.stats['uploaded_bytes'] += size
+
+        canvas_file = job.get('canvas_file')
+        if job.get('canvas_id') and canvas_file:
+            await self._point_canvas_file(job['canvas_id'], canvas_file['id'], public_url)
+        await file_store.remove(file_name)
+        await db_adapter.delete_upload_job(file_name)
+        print(f"✅ Uploaded {file_name} to Supabase Storage in the background: {public_url}")
+
+    @staticmethod
+    async def _point_canvas_file(canvas_id: str, canvas_file_id: str, public_url: str) -> None:
+        """Switch the canvas file entry to the storage URL, unless it was removed meanwhile"""
+        async with canvas_mutations.lock_canvas(canvas_id):
+            canvas = await db_adapter.get_canvas_data(canvas_id)
+            files = ((canvas or {}).get('data') or {}).get('files') or {}
+            file_data = files.get(canvas_file_id)
+            if not file_data:
+                return
+            await db_adapter.patch_canvas_elements(canvas_id, files={
+                canvas_file_id: {**file_data, 'dataURL': public_url},
+            })
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            'active': len(self._tasks),
+            'concurrency': self.concurrency,
+        }
+
+
+# Started by the server lifespan when Supabase Storage is configured
+upload_queue = UploadQueue()
@@ -1,14 +1,73 @@
 # services/websocket_state.py
+import asyncio
+import os
+import pickle
 import socketio
-from typing import Dict
+from socketio.async_pubsub_manager import AsyncPubSubManager
+from typing import Dict, List, Optional
+
+
+class LocalPubSubManager(AsyncPubSubManager):
+    """In-process stand-in for a Redis pub/sub backend
+
+    Every manager created in this process with the same channel receives the
+    messages published by the others, which lets several AsyncServer
+    instances behave like separate workers sharing a message queue without
+    running Redis. Messages are pickled like they would be on the wire.
+    """
+    name = 'localpubsub'
+
+    _subscribers: Dict[str, List[asyncio.Queue]] = {}
+
+    def __init__(self, channel: str = 'socketio', write_only: bool = False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self._queue: asyncio.Queue = asyncio.Queue()
+        if not write_only:
+            LocalPubSubManager._subscribers.setdefault(channel, []).append(self._queue)
+
+    async def _publish(self, data):
+        message = pickle.dumps(data)
+        for queue in LocalPubSubManager._subscribers.get(self.channel, []):
+            queue.put_nowait(message)
+
+    async def _listen(self):
+        while True:
+            yield await self._queue.get()
+
+
+def create_client_manager(url: Optional[str] = None) -> Optional[socketio.AsyncManager]:
+    """Create the Socket.IO client manager from SOCKETIO_MESSAGE_QUEUE
+
+    - unset: in-memory manager, single process
+    - redis:// / rediss:// / redis+sentinel://: shared across server processes
+    - local://: in-process pub/sub stand-in for Redis
+    """
+    url = url if url is not None else os.environ.get('SOCKETIO_MESSAGE_QUEUE', '')
+    if not url:
+        return None
+    if url.startswith(('redis://', 'rediss://', 'redis+sentinel://')):
+        print("📡 Using Redis Socket.IO message queue")
+        return socketio.AsyncRedisManager(url)
+    if url.startswith('local://'):
+        print("📡 Using local Socket.IO message queue")
+        return LocalPubSubManager()
+    raise ValueError(f"Unsupported SOCKETIO_MESSAGE_QUEUE: {url}")
+
 
 sio = socketio.AsyncServer(
     cors_allowed_origins="*",
-    async_mode='asgi'
+    async_mode='asgi',
+    client_manager=create_client_manager()
 )
 
 active_connections: Dict[str, dict] = {}
 
+def canvas_room(canvas_id: str) -> str:
+    return f'canvas:{canvas_id}'
+
+def session_room(session_id: str) -> str:
+    return f'session:{session_id}'
+
 def add_connection(socket_id: str, user_info: dict = None):
     active_connections[socket_id] = user_info or {}
     print(f"New connection added: {socket_id}, total connections: {len(active_connections)}")
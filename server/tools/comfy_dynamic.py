@@ -19,11 +19,13 @@ If `run_comfy_workflow` is not yet implemented it will still work
 
 from __future__ import annotations
 
+import asyncio
 import json
 import os
 import random
 import time
 import traceback
+from functools import partial
 from io import BytesIO
 from typing import Annotated, Any, Dict, List, Optional
 from common import DEFAULT_PORT
@@ -37,7 +39,8 @@ from pydantic import BaseModel, Field, create_model
 from routers.comfyui_execution import upload_image
 from services.config_service import FILES_DIR, config_service, IMAGE_FORMATS
 from services.db_adapter import db_adapter
-from services.websocket_service import broadcast_session_update, send_to_websocket
+from services.websocket_service import send_to_websocket
+from services.canvas_mutation_service import canvas_mutations
 
 from .utils.comfyui import ComfyUIWorkflowRunner
 from tools.video_generation.video_canvas_utils import generate_new_video_element
@@ -210,16 +213,8 @@ def build_tool(wf: Dict[str, Any]) -> BaseTool:
             ):
                 outputs = [outputs]
 
-            # update the canvas data, add the new image element
-            canvas_data = await db_adapter.get_canvas_data(canvas_id)
-            if "data" not in canvas_data:
-                canvas_data["data"] = {}
-            if "elements" not in canvas_data["data"]:
-                canvas_data["data"]["elements"] = []
-            if "files" not in canvas_data["data"]:
-                canvas_data["data"]["files"] = {}
-
             generated_files_info = []
+            placements = []
 
             for output in outputs:
                 mime_type, width, height, filename = output
@@ -233,72 +228,35 @@ def build_tool(wf: Dict[str, Any]) -> BaseTool:
                     "dataURL": url,
                     "created": int(time.time() * 1000),
                 }
+                size = {
+                    "width": width,
+                    "height": height,
+                }
 
-                # Pass the current canvas_data to the element generation function
                 if mime_type.startswith("image"):
-                    new_element = await generate_new_image_element(
-                        canvas_id,
-                        file_id,
-                        {
-                            "width": width,
-                            "height": height,
-                        },
-                        canvas_data=canvas_data.get("data", {}),
-                    )
+                    build_element = partial(generate_new_image_element, canvas_id, file_id, size)
+                    event_type, url_key = "image_generated", "image_url"
                 else:
-                    new_element = await generate_new_video_element(
-                        canvas_id,
-                        file_id,
-                        {
-                            "width": width,
-                            "height": height,
-                        },
-                        canvas_data=canvas_data.get("data", {}),
+                    build_element = partial(generate_new_video_element, canvas_id, file_id, size)
+                    event_type, url_key = "video_generated", "video_url"
+
+                # Queued together, so all outputs are placed, stored and
+                # broadcast in one go
+                placements.append(
+                    canvas_mutations.add_media(
+                        session_id, canvas_id, build_element, file_data, event_type, url_key, url
                     )
-
-                canvas_data["data"]["elements"].append(new_element)
-                canvas_data["data"]["files"][file_id] = file_data
-                
-                backend_url = get_backend_url()
-                image_url = f"{backend_url}/api/file/{filename}"
-
+                )
                 generated_files_info.append(
                     {
-                        "element": new_element,
                         "file": file_data,
-                        "url": image_url,
+                        "url": url,
                         "mime_type": mime_type,
                         "filename": filename,
                     }
                 )
 
-            await db_adapter.save_canvas_data(
-                canvas_id, json.dumps(canvas_data["data"])
-            )
-
-            for file_info in generated_files_info:
-                if file_info["mime_type"].startswith("image"):
-                    await broadcast_session_update(
-                        session_id,
-                        canvas_id,
-                        {
-                            "type": "image_generated",
-                            "element": file_info["element"],
-                            "file": file_info["file"],
-                            "image_url": file_info["url"],
-                        },
-                    )
-                else:
-                    await broadcast_session_update(
-                        session_id,
-                        canvas_id,
-                        {
-                            "type": "video_generated",
-                            "element": file_info["element"],
-                            "file": file_info["file"],
-                            "video_url": file_info["url"],
-                        },
-                    )
+            await asyncio.gather(*placements)
 
             # Create a markdown string for all the generated files
             markdown_images = []
@@ -1,3 +1,4 @@
+import asyncio
 from typing import Annotated
 from pydantic import BaseModel, Field
 from langchain_core.tools import tool, InjectedToolCallId  # type: ignore
@@ -82,8 +83,8 @@ async def generate_video_by_seedance_v1_lite_i2v(
         # first-last-frame-to-video
         first_image = input_images[0]
         last_frame = input_images[-1]
-        processed_first_image = await process_input_image(first_image)
-        processed_last_frame = await process_input_image(last_frame)
+        processed_first_image, processed_last_frame = await asyncio.gather(
+            process_input_image(first_image), process_input_image(last_frame))
         if processed_first_image and processed_last_frame:
             processed_input_images = [
                 processed_first_image, processed_last_frame]
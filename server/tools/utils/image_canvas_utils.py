@@ -1,20 +1,18 @@
 """
 Canvas-related utilities for image generation
-Handles canvas operations, locking, and notifications
+Handles canvas operations and notifications, placement and locking go through
+services.canvas_mutation_service
 """
 
-import asyncio
 import os
 import random
 import time
-import json
-from contextlib import asynccontextmanager
-from typing import Dict, List, Any, Optional, Union, cast
+from typing import Dict, Any, Optional, Union
 from nanoid import generate
-from services.db_adapter import db_adapter
-from services.websocket_service import broadcast_session_update
 from services.websocket_service import send_to_websocket
 from services.supabase_storage_service import supabase_storage
+from services.canvas_mutation_service import canvas_mutations
+from services.upload_queue_service import upload_queue
 from utils.canvas import find_next_best_element_position
 
 def generate_file_id() -> str:
@@ -22,26 +20,6 @@ def generate_file_id() -> str:
     return 'im_' + generate(size=8)
 
 
-class CanvasLockManager:
-    """Canvas lock manager to prevent concurrent operations causing position overlap"""
-
-    def __init__(self) -> None:
-        self._locks: Dict[str, asyncio.Lock] = {}
-
-    @asynccontextmanager
-    async def lock_canvas(self, canvas_id: str):
-        if canvas_id not in self._locks:
-            self._locks[canvas_id] = asyncio.Lock()
-
-        async with self._locks[canvas_id]:
-            yield
-
-
-# Global lock manager instance
-canvas_lock_manager = CanvasLockManager()
-
-
-
 async def generate_new_image_element(
     canvas_id: str,
     fileid: str,
@@ -49,15 +27,8 @@ async def generate_new_image_element(
     canvas_data: Optional[Dict[str, Any]] = None,
 ) -> Dict[str, Any]:
     """Generate new image element for canvas"""
-    if canvas_data is None:
-        canvas = await db_adapter.get_canvas_data(canvas_id)
-        if canvas is None:
-            canvas = {"data": {}}
-        canvas_data = canvas.get("data", {})
-
-
-
-    new_x, new_y = await find_next_best_element_position(canvas_data)
+    # Without canvas_data the cached placement index of the canvas is used
+    new_x, new_y = await find_next_best_element_position(canvas_data, canvas_id=canvas_id)
 
     return {
         "type": "image",
@@ -94,97 +65,45 @@ async def generate_new_image_element(
 
 
 async def save_image_to_canvas(session_id: str, canvas_id: str, filename: str, mime_type: str, width: int, height: int) -> str:
-    """Save image to canvas with proper locking and positioning"""
-    from services.config_service import FILES_DIR
-    
-    # Use lock to ensure atomicity of the save process
-    async with canvas_lock_manager.lock_canvas(canvas_id):
-        # Fetch canvas data once inside the lock
-        canvas: Optional[Dict[str, Any]] = await db_adapter.get_canvas_data(canvas_id)
-        if canvas is None:
-            canvas = {'data': {}}
-        canvas_data: Dict[str, Any] = canvas.get('data', {})
-
-        # Ensure 'elements' and 'files' keys exist
-        if 'elements' not in canvas_data:
-            canvas_data['elements'] = []
-        if 'files' not in canvas_data:
-            canvas_data['files'] = {}
-
-        file_id = generate_file_id()
-        
-        # Try to upload to Supabase Storage if available
-        if supabase_storage.initialized:
-            try:
-                # Local file path
-                local_file_path = os.path.join(FILES_DIR, filename)
-                
-                # Storage path in Supabase (organize by canvas)
-                storage_path = f"canvas/{canvas_id}/{filename}"
-                
-                # Upload to Supabase Storage
-                public_url = await supabase_storage.upload_file(local_file_path, storage_path)
-                
-                # Use Supabase URL
-                url = public_url
-                image_url = public_url
-                
-                print(f"✅ Image uploaded to Supabase Storage: {public_url}")
-                
-                # Optionally remove local file to save space
-                try:
-                    os.remove(local_file_path)
-                    print(f"🗑️ Removed local file: {local_file_path}")
-                except Exception as e:
-                    print(f"⚠️ Could not remove local file: {e}")
-                    
-            except Exception as e:
-                print(f"❌ Failed to upload to Supabase Storage: {e}")
-                # Fallback to local URL
-                backend_url = os.environ.get('BACKEND_URL', 'http://localhost:8080')
-                url = f'{backend_url}/api/file/{filename}'
-                image_url = f"{backend_url}/api/file/{filename}"
-        else:
-            # Fallback to local URL if Supabase Storage not available
-            # Use full backend URL for cross-origin deployments
-            backend_url = os.environ.get('BACKEND_URL', 'http://localhost:8080')
-            url = f'{backend_url}/api/file/{filename}'
-            image_url = f"{backend_url}/api/file/{filename}"
-
-        file_data: Dict[str, Any] = {
-            'mimeType': mime_type,
-            'id': file_id,
-            'dataURL': url,
-            'created': int(time.time() * 1000),
-        }
-
-        new_image_element: Dict[str, Any] = await generate_new_image_element(
-            canvas_id,
-            file_id,
-            {
-                'width': width,
-                'height': height,
-            },
-            canvas_data
-        )
-
-        # Update the canvas data with the new element and file info
-        elements_list = cast(List[Dict[str, Any]], canvas_data['elements'])
-        elements_list.append(new_image_element)
-        canvas_data['files'][file_id] = file_data
-
-        # Save the updated canvas data back to the database
-        await db_adapter.save_canvas_data(canvas_id, json.dumps(canvas_data))
-
-        # Broadcast image generation message to frontend
-        await broadcast_session_update(session_id, canvas_id, {
-            'type': 'image_generated',
-            'element': new_image_element,
-            'file': file_data,
-            'image_url': image_url,
-        })
-
-        return image_url
+    """Save image to canvas, placement and locking go through canvas_mutations"""
+    file_id = generate_file_id()
+
+    # Served locally right away; with Supabase Storage the upload runs in the
+    # background and switches the canvas file to the storage URL when done
+    # Use full backend URL for cross-origin deployments
+    backend_url = os.environ.get('BACKEND_URL', 'http://localhost:8080')
+    url = f'{backend_url}/api/file/{filename}'
+    image_url = url
+
+    file_data: Dict[str, Any] = {
+        'mimeType': mime_type,
+        'id': file_id,
+        'dataURL': url,
+        'created': int(time.time() * 1000),
+    }
+
+    # Placed, stored and broadcast together with other results landing on the canvas
+    await canvas_mutations.add_media(
+        session_id,
+        canvas_id,
+        lambda: generate_new_image_element(canvas_id, file_id, {
+            'width': width,
+            'height': height,
+        }),
+        file_data,
+        'image_generated',
+        'image_url',
+        image_url,
+    )
+
+    if supabase_storage.initialized:
+        try:
+            # Storage path in Supabase (organize by canvas)
+            await upload_queue.enqueue(filename, f"canvas/{canvas_id}/{filename}", canvas_id, file_data)
+        except Exception as e:
+            print(f"❌ Failed to queue upload to Supabase Storage, keeping the local file: {e}")
+
+    return image_url
 
 
 async def send_image_start_notification(session_id: str, message: str) -> None:
@@ -5,7 +5,7 @@ Contains the main orchestration logic for image generation across different prov
 
 from typing import Optional, Dict, Any
 from common import DEFAULT_PORT
-from tools.utils.image_utils import process_input_image
+from tools.utils.image_utils import process_input_images
 from ..image_providers.image_base_provider import ImageProviderBase
 
 # 导入所有提供商以确保自动注册 (不要删除这些导入)
@@ -63,11 +63,8 @@ async def generate_image_with_provider(
     # Process input images for the provider
     processed_input_images: list[str] | None = None
     if input_images:
-        processed_input_images = []
-        for image_path in input_images:
-            processed_image = await process_input_image(image_path)
-            if processed_image:
-                processed_input_images.append(processed_image)
+        # Independent images, processed concurrently (cached across turns)
+        processed_input_images = await process_input_images(input_images)
 
         print(f"Using {len(processed_input_images)} input images for generation")
 
@@ -1,13 +1,16 @@
+import asyncio
 import os
 import traceback
-from PIL import Image, PngImagePlugin
-from io import BytesIO
-import base64
-import json
 from typing import Any, Optional, Tuple
+import aiofiles
 from nanoid import generate
+from utils.download import download_to_file
 from utils.http_client import HttpClient
+from utils.image_input_cache import encode_data_url, input_image_cache, input_mime_type
+from utils.image_output import output_policy, save_image
+from utils.image_worker import image_worker
 from services.config_service import FILES_DIR
+from services.file_store import file_store
 
 
 def generate_image_id() -> str:
@@ -22,102 +25,42 @@ async def get_image_info_and_save(
     metadata: Optional[dict[str, Any]] = None
 ) -> Tuple[str, int, int, str]:
     """
-    Download image from URL or decode base64, convert to PNG and save with metadata
+    Download image from URL or decode base64, store it with metadata according
+    to the deployment's output policy (utils/image_output.py, PNG by default)
+
+    The PIL work runs in the image worker pool (utils/image_worker.py).
 
     Args:
         url: Image URL or base64 string
         file_path_without_extension: File path without extension
         is_b64: Whether the url is a base64 string
-        metadata: Optional metadata to be saved in PNG info
+        metadata: Optional metadata to be saved with the image
 
     Returns:
-        tuple[str, int, int, str]: (mime_type, width, height, extension) - always PNG
+        tuple[str, int, int, str]: (mime_type, width, height, extension)
     """
+    # Stream the download (or the base64 text) to disk, the worker decodes from there
+    source_path = f"{file_path_without_extension}.download"
     try:
         if is_b64:
-            image_data = base64.b64decode(url)
-        else:
-            # Fetch the image asynchronously
-            async with HttpClient.create_aiohttp() as session:
-                async with session.get(url) as response:
-                    # Read the image content as bytes
-                    image_data = await response.read()
-
-        # Open image to get info
-        image = Image.open(BytesIO(image_data))
-        width, height = image.size
-        
-        # Store original format for debugging
-        original_format = image.format or 'Unknown'
-        print(f"Converting {original_format} image to PNG: {width}x{height}")
-
-        # Handle different color modes properly for PNG conversion
-        if image.mode == 'P':
-            # Palette mode - convert to RGBA to preserve potential transparency
-            if 'transparency' in image.info:
-                image = image.convert('RGBA')
-            else:
-                image = image.convert('RGB')
-        elif image.mode == 'LA':
-            # Grayscale with alpha - convert to RGBA
-            image = image.convert('RGBA')
-        elif image.mode == 'L':
-            # Grayscale - can stay as L or convert to RGB
-            # PNG supports grayscale, so we can keep it
-            pass
-        elif image.mode == 'CMYK':
-            # CMYK mode - convert to RGB
-            image = image.convert('RGB')
-        elif image.mode in ('RGB', 'RGBA'):
-            # Already compatible with PNG
-            pass
+            async with aiofiles.open(source_path, 'w') as out_file:
+                await out_file.write(url)
         else:
-            # For any other modes, convert to RGB as a safe fallback
-            print(f"Warning: Unusual color mode {image.mode}, converting to RGB")
-            image = image.convert('RGB')
-
-        # Unified format: always PNG
-        extension = 'png'
-        mime_type = 'image/png'
-
-        # Prepare PNG info for metadata
-        pnginfo = PngImagePlugin.PngInfo()
-        
-        # Add original format info
-        pnginfo.add_text("original_format", original_format)
-        
-        if metadata:
-            for key, value in metadata.items():
-                try:
-                    # Handle different value types
-                    if isinstance(value, (dict, list)):
-                        # Serialize complex types as JSON
-                        text_value = json.dumps(value, ensure_ascii=False)
-                    elif value is None:
-                        text_value = "null"
-                    else:
-                        # Convert to string
-                        text_value = str(value)
-                    
-                    pnginfo.add_text(str(key), text_value)
-                except Exception as e:
-                    print(f"Warning: Failed to add metadata key '{key}': {e}")
-                    traceback.print_stack()
-
-        # Save as PNG with metadata
-        file_path = f"{file_path_without_extension}.{extension}"
-        
-        # Save with optimizations and metadata
-        if metadata or original_format != 'PNG':
-            image.save(file_path, format='PNG', optimize=True, pnginfo=pnginfo)
-        else:
-            image.save(file_path, format='PNG', optimize=True)
-        
-        print(f"Successfully saved as PNG: {file_path}")
+            # Chunked download, resumed on dropped connections, size capped by MEDIA_DOWNLOAD_MAX_MB
+            await download_to_file(url, source_path)
+
+        # Decode, convert and encode off the event loop
+        mime_type, width, height, extension = await image_worker.run(
+            'save_image', save_image, source_path, file_path_without_extension, metadata, is_b64, output_policy
+        )
+        # Deduplicate against files already stored
+        await file_store.adopt_path(f"{file_path_without_extension}.{extension}")
         return mime_type, width, height, extension
 
     except Exception as e:
         print(f"Error processing image: {e}")
+        if os.path.exists(source_path):
+            os.remove(source_path)
         raise e
 
 
@@ -138,6 +81,10 @@ async def process_input_image(input_image: str | None) -> str | None:
     """
     Process input image and convert to base64 format
 
+    The data URL is cached (utils/image_input_cache.py) by file id, file
+    version and target format, so references passed again in later turns are
+    not decoded and re-encoded again.
+
     Args:
         input_image: Image file path or filename
 
@@ -148,75 +95,66 @@ async def process_input_image(input_image: str | None) -> str | None:
         return None
 
     try:
-        # First try local file
+        mime_type = input_mime_type(input_image)
         full_path = os.path.join(FILES_DIR, input_image)
-        image = None
-        
-        if os.path.exists(full_path):
-            # Load from local file
-            print(f"📁 Loading image from local file: {full_path}")
-            image = Image.open(full_path)
-        else:
-            # Try to load from backend URL (for images stored in Supabase but with local fallback)
-            print(f"🌐 Local file not found, trying to load from backend URL: {input_image}")
-            
-            # Construct the backend URL
-            import os as env_os
-            is_cloud_deployment = env_os.environ.get('CLOUD_DEPLOYMENT', 'false').lower() == 'true'
-            if is_cloud_deployment:
-                backend_url = 'https://jaaz-backend-337074826438.asia-northeast1.run.app'
+        try:
+            stat = os.stat(full_path)
+            version = f"{stat.st_mtime_ns}:{stat.st_size}"
+        except OSError:
+            # Stored in Supabase: file ids are never rewritten, the id is the version
+            stat = None
+            version = 'remote'
+
+        async def create() -> str | None:
+            if stat is not None:
+                # Load from local file
+                print(f"📁 Loading image from local file: {full_path}")
+                source: Any = full_path
             else:
-                backend_url = env_os.environ.get('BACKEND_URL', 'http://localhost:8080')
-            
-            image_url = f'{backend_url}/api/file/{input_image}'
-            print(f"🔗 Fetching image from: {image_url}")
-            
-            # Use aiohttp to fetch the image
-            import aiohttp
-            async with aiohttp.ClientSession() as session:
-                async with session.get(image_url) as response:
-                    if response.status == 200:
-                        image_data = await response.read()
-                        image = Image.open(BytesIO(image_data))
-                        print(f"✅ Successfully loaded image from URL")
-                    else:
-                        print(f"❌ Failed to fetch image from URL, status: {response.status}")
-                        return None
-
-        if not image:
-            print(f"❌ Could not load image: {input_image}")
-            return None
-
-        # Get file extension and determine MIME type
-        ext = os.path.splitext(input_image)[1].lower()
-        mime_type_map = {
-            '.png': 'image/png',
-            '.jpg': 'image/jpeg',
-            '.jpeg': 'image/jpeg',
-            '.webp': 'image/webp'
-        }
-        mime_type = mime_type_map.get(ext, 'image/jpeg')
-
-        # Convert to base64
-        with BytesIO() as output:
-            format_name = str(mime_type.split('/')[1]).upper()
-            if format_name == 'JPEG':
-                # Convert RGBA to RGB for JPEG
-                if image.mode in ('RGBA', 'LA'):
-                    background = Image.new('RGB', image.size, (255, 255, 255))
-                    background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
-                    image = background
-            
-            image.save(output, format=format_name)
-            compressed_data = output.getvalue()
-            b64_data = base64.b64encode(compressed_data).decode('utf-8')
-
-        data_url = f"data:{mime_type};base64,{b64_data}"
-        print(f"🖼️ Successfully converted image to base64 data URL")
-        return data_url
+                source = await _fetch_input_image(input_image)
+                if source is None:
+                    return None
+            data_url = await image_worker.run('encode_data_url', encode_data_url, source, mime_type)
+            print(f"🖼️ Successfully converted image to base64 data URL")
+            return data_url
+
+        key = input_image_cache.make_key(input_image, version, mime_type)
+        return await input_image_cache.get_or_create(key, create)
 
     except Exception as e:
         print(f"❌ Error processing image {input_image}: {e}")
-        import traceback
         traceback.print_exc()
         return None
+
+
+async def _fetch_input_image(input_image: str) -> bytes | None:
+    """Load an image that is not in FILES_DIR from the backend's file API"""
+    # Try to load from backend URL (for images stored in Supabase but with local fallback)
+    print(f"🌐 Local file not found, trying to load from backend URL: {input_image}")
+
+    # Construct the backend URL
+    is_cloud_deployment = os.environ.get('CLOUD_DEPLOYMENT', 'false').lower() == 'true'
+    if is_cloud_deployment:
+        backend_url = 'https://jaaz-backend-337074826438.asia-northeast1.run.app'
+    else:
+        backend_url = os.environ.get('BACKEND_URL', 'http://localhost:8080')
+
+    image_url = f'{backend_url}/api/file/{input_image}'
+    print(f"🔗 Fetching image from: {image_url}")
+
+    async with HttpClient.create_aiohttp(url=image_url) as session:
+        async with session.get(image_url) as response:
+            if response.status != 200:
+                print(f"❌ Failed to fetch image from URL, status: {response.status}")
+                return None
+            image_data = await response.read()
+            print(f"✅ Successfully loaded image from URL")
+            return image_data
+
+
+async def process_input_images(input_images: list[str] | None) -> list[str]:
+    """process_input_image for several images at once, in order, skipping the ones that failed"""
+    if not input_images:
+        return []
+    processed = await asyncio.gather(*[process_input_image(image) for image in input_images])
+    return [image for image in processed if image]
@@ -3,14 +3,12 @@ Video canvas utilities module
 Contains functions for video processing, canvas operations, and notifications
 """
 
-import json
 import time
 import os
 import asyncio
-from contextlib import asynccontextmanager
 from typing import Dict, List, Any, Tuple, Optional, Union
 from services.config_service import FILES_DIR
-from services.db_adapter import db_adapter
+from services.file_store import file_store
 from services.websocket_service import send_to_websocket, broadcast_session_update  # type: ignore
 from common import DEFAULT_PORT
 
@@ -22,32 +20,13 @@ def get_backend_url() -> str:
         return 'https://jaaz-backend-337074826438.asia-northeast1.run.app'
     else:
         return os.environ.get('BACKEND_URL', f'http://localhost:{DEFAULT_PORT}')
-from utils.http_client import HttpClient
-import aiofiles
+from utils.download import download_to_file
 import mimetypes
 from pymediainfo import MediaInfo
 from nanoid import generate
 import random
 from utils.canvas import find_next_best_element_position
-
-
-class CanvasLockManager:
-    """Canvas lock manager to prevent concurrent operations causing position overlap"""
-
-    def __init__(self) -> None:
-        self._locks: Dict[str, asyncio.Lock] = {}
-
-    @asynccontextmanager
-    async def lock_canvas(self, canvas_id: str):
-        if canvas_id not in self._locks:
-            self._locks[canvas_id] = asyncio.Lock()
-
-        async with self._locks[canvas_id]:
-            yield
-
-
-# Global lock manager instance
-canvas_lock_manager = CanvasLockManager()
+from services.canvas_mutation_service import canvas_mutations
 
 
 async def save_video_to_canvas(
@@ -56,7 +35,7 @@ async def save_video_to_canvas(
     video_url: str
 ) -> Tuple[str, Dict[str, Any], Dict[str, Any]]:
     """
-    Download video, save to files, create canvas element and return data
+    Download video, save to files, add its element to the canvas and broadcast it
 
     Args:
         session_id: Session ID for notifications
@@ -66,61 +45,45 @@ async def save_video_to_canvas(
     Returns:
         Tuple of (filename, file_data, new_video_element)
     """
-    # Use lock to ensure atomicity of the save process
-    async with canvas_lock_manager.lock_canvas(canvas_id):
-        # Generate unique video ID
-        video_id = generate_video_file_id()
-
-        # Download and save video
-        print(f"🎥 Downloading video from: {video_url}")
-        mime_type, width, height, extension = await get_video_info_and_save(
-            video_url, os.path.join(FILES_DIR, f"{video_id}")
-        )
-        filename = f"{video_id}.{extension}"
-
-        print(f"🎥 Video saved as: {filename}, dimensions: {width}x{height}")
-
-        # Create file data
-        file_id = generate_video_file_id()
-        backend_url = get_backend_url()
-        file_url = f"{backend_url}/api/file/{filename}"
-
-        file_data: Dict[str, Any] = {
-            "mimeType": mime_type,
-            "id": file_id,
-            "dataURL": file_url,
-            "created": int(time.time() * 1000),
-        }
-
-        # Create new video element for canvas
-        new_video_element: Dict[str, Any] = await generate_new_video_element(
-            canvas_id,
-            file_id,
-            {
-                "width": width,
-                "height": height,
-            },
-        )
+    # Generate unique video ID
+    video_id = generate_video_file_id()
 
-        # Update canvas data
-        canvas_data: Optional[Dict[str, Any]] = await db_adapter.get_canvas_data(canvas_id)
-        if canvas_data is None:
-            canvas_data = {}
-        if "data" not in canvas_data:
-            canvas_data["data"] = {}
-        if "elements" not in canvas_data["data"]:
-            canvas_data["data"]["elements"] = []
-        if "files" not in canvas_data["data"]:
-            canvas_data["data"]["files"] = {}
+    # Download outside the canvas lock, only placement needs it
+    print(f"🎥 Downloading video from: {video_url}")
+    mime_type, width, height, extension = await get_video_info_and_save(
+        video_url, os.path.join(FILES_DIR, f"{video_id}")
+    )
+    filename = f"{video_id}.{extension}"
 
-        canvas_data["data"]["elements"].append(
-            new_video_element)  # type: ignore
-        canvas_data["data"]["files"][file_id] = file_data
+    print(f"🎥 Video saved as: {filename}, dimensions: {width}x{height}")
 
-        # Save updated canvas data
-        await db_adapter.save_canvas_data(canvas_id, json.dumps(canvas_data["data"]))
+    # Create file data
+    file_id = generate_video_file_id()
+    backend_url = get_backend_url()
+    file_url = f"{backend_url}/api/file/{filename}"
 
-        return filename, file_data, new_video_element
+    file_data: Dict[str, Any] = {
+        "mimeType": mime_type,
+        "id": file_id,
+        "dataURL": file_url,
+        "created": int(time.time() * 1000),
+    }
+
+    # Placed, stored and broadcast together with other results landing on the canvas
+    new_video_element = await canvas_mutations.add_media(
+        session_id,
+        canvas_id,
+        lambda: generate_new_video_element(canvas_id, file_id, {
+            "width": width,
+            "height": height,
+        }),
+        file_data,
+        "video_generated",
+        "video_url",
+        file_url,
+    )
+
+    return filename, file_data, new_video_element
 
 
 async def send_video_start_notification(session_id: str, message: str) -> None:
@@ -174,6 +137,7 @@ async def process_video_result(
 ) -> str:
     """
     Complete video processing pipeline: save, update canvas, notify
+    (the completion broadcast is sent by canvas_mutations)
 
     Args:
         video_url: URL of the generated video
@@ -192,15 +156,6 @@ async def process_video_result(
             video_url=video_url
         )
 
-        # Send completion notification
-        await send_video_completion_notification(
-            session_id=session_id,
-            canvas_id=canvas_id,
-            new_video_element=new_video_element,
-            file_data=file_data,
-            video_url=file_data["dataURL"]
-        )
-
         provider_info = f" using {provider_name}" if provider_name else ""
         print(f"🎥 Video generation completed{provider_info}: {filename}")
         return format_video_success_message(filename)
@@ -218,19 +173,15 @@ def generate_video_file_id() -> str:
 async def get_video_info_and_save(
     url: str, file_path_without_extension: str
 ) -> Tuple[str, int, int, str]:
-    # Fetch the video asynchronously
-    async with HttpClient.create_aiohttp() as session:
-        async with session.get(url) as response:
-            video_content = await response.read()
-
-    # Save to temporary mp4 file first
+    # Stream the video to disk in chunks, it is renamed into place once complete
     temp_path = f"{file_path_without_extension}.mp4"
-    async with aiofiles.open(temp_path, "wb") as out_file:
-        await out_file.write(video_content)
-    print("🎥 Video saved to", temp_path)
+    size = await download_to_file(url, temp_path)
+    print(f"🎥 Video saved to {temp_path} ({size} bytes)")
+    await file_store.adopt_path(temp_path)
 
     try:
-        media_info = MediaInfo.parse(temp_path)  # type: ignore
+        # mediainfo reads the container headers only, off the event loop
+        media_info = await asyncio.to_thread(MediaInfo.parse, temp_path)  # type: ignore
         width: int = 0
         height: int = 0
 
@@ -263,13 +214,8 @@ async def generate_new_video_element(
     canvas_data: Optional[Dict[str, Any]] = None,
 ) -> Dict[str, Any]:
     """Generate new video element for canvas"""
-    if canvas_data is None:
-        canvas = await db_adapter.get_canvas_data(canvas_id)
-        if canvas is None:
-            canvas = {"data": {}}
-        canvas_data = canvas.get("data", {})
-
-    new_x, new_y = await find_next_best_element_position(canvas_data)
+    # Without canvas_data the cached placement index of the canvas is used
+    new_x, new_y = await find_next_best_element_position(canvas_data, canvas_id=canvas_id)
 
     return {
         "type": "video",
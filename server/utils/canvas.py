@@ -1,58 +1,207 @@
-from typing import Optional, Dict, Any, Union
+import json
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Union, List, Tuple, Iterable
 from services.db_service import db_service
 
-async def find_next_best_element_position(canvas_data, max_num_per_row=4, spacing=20):
+MEDIA_ELEMENT_TYPES = ("image", "embeddable", "video")
+
+
+def _is_media_element(element: Dict[str, Any]) -> bool:
+    return element.get("type") in MEDIA_ELEMENT_TYPES and not element.get("isDeleted")
+
+
+def _extent(element: Dict[str, Any]) -> Tuple[float, float, float, float]:
+    return (
+        element.get("x", 0),
+        element.get("y", 0),
+        element.get("width", 0),
+        max(element.get("height", 0), 0),
+    )
+
+
+class _Row:
+    """Elements whose vertical extents overlap, with the union of their extents"""
+    __slots__ = ("top", "bottom", "members")
+
+    def __init__(self, top: float, bottom: float):
+        self.top = top
+        self.bottom = bottom
+        # element id -> (x, y, width, height)
+        self.members: Dict[str, Tuple[float, float, float, float]] = {}
+
+
+class PlacementIndex:
     """
-    Calculates the next best position for a new element on the canvas.
-    This final version uses a robust row detection algorithm to handle complex layouts.
+    Rows of media elements kept sorted by their vertical extent.
+
+    Rows never overlap vertically, so the rows touched by a new element form a
+    contiguous range found by bisecting on row tops/bottoms. Adding an element
+    merges that range into one row, removing an element only rebuilds its own
+    row. The last row is the bottom-most one, which is where the next element
+    goes.
     """
-    elements = canvas_data.get("elements", [])
-    
-    media_elements = [
-        e for e in elements 
-        if e.get("type") in ["image", "embeddable", "video"] and not e.get("isDeleted")
-    ]
-
-    if not media_elements:
-        return 0, 0
-
-    # Sort elements by their top-left corner
-    media_elements.sort(key=lambda e: (e.get("y", 0), e.get("x", 0)))
-
-    # Group elements into rows based on vertical overlap
-    rows = []
-    for element in media_elements:
-        y, height = element.get("y", 0), element.get("height", 0)
-        placed = False
-        for row in rows:
-            # Check if the element vertically overlaps with any element in the row
-            if any(max(y, r.get("y", 0)) < min(y + height, r.get("y", 0) + r.get("height", 0)) for r in row):
-                row.append(element)
-                placed = True
+
+    def __init__(self, elements: Optional[Iterable[Dict[str, Any]]] = None):
+        self._rows: List[_Row] = []
+        self._tops: List[float] = []
+        self._bottoms: List[float] = []
+        # element id -> row holding it
+        self._element_rows: Dict[str, _Row] = {}
+        for element in elements or []:
+            self.add(element)
+
+    def __len__(self) -> int:
+        return len(self._element_rows)
+
+    def add(self, element: Dict[str, Any]) -> None:
+        """Add or move an element; non-media and deleted elements are removed"""
+        element_id = str(element.get("id"))
+        if element_id in self._element_rows:
+            self.remove(element_id)
+        if _is_media_element(element):
+            self._insert(element_id, _extent(element))
+
+    def remove(self, element_id: str) -> None:
+        """Remove an element, splitting its row if it was holding it together"""
+        row = self._element_rows.pop(str(element_id), None)
+        if row is None:
+            return
+        del row.members[str(element_id)]
+        self._pop_row(row)
+        for member_id in row.members:
+            del self._element_rows[member_id]
+        for member_id, extent in sorted(row.members.items(), key=lambda m: m[1][1]):
+            self._insert(member_id, extent)
+
+    def sync(self, elements: Iterable[Dict[str, Any]]) -> None:
+        """Bring the index in line with a full element list, touching only what changed"""
+        seen = set()
+        for element in elements:
+            element_id = str(element.get("id"))
+            seen.add(element_id)
+            row = self._element_rows.get(element_id)
+            if row is None:
+                if _is_media_element(element):
+                    self._insert(element_id, _extent(element))
+            elif not _is_media_element(element) or row.members[element_id] != _extent(element):
+                self.add(element)
+        for element_id in [i for i in self._element_rows if i not in seen]:
+            self.remove(element_id)
+
+    def _insert(self, element_id: str, extent: Tuple[float, float, float, float]) -> None:
+        y, height = extent[1], extent[3]
+        # Rows overlapping [y, y + height): bottom > y and top < y + height
+        start = bisect_right(self._bottoms, y)
+        end = max(bisect_left(self._tops, y + height), start)
+
+        row = _Row(y, y + height)
+        for merged in self._rows[start:end]:
+            row.top = min(row.top, merged.top)
+            row.bottom = max(row.bottom, merged.bottom)
+            for member_id, member_extent in merged.members.items():
+                row.members[member_id] = member_extent
+                self._element_rows[member_id] = row
+        row.members[element_id] = extent
+        self._element_rows[element_id] = row
+
+        self._rows[start:end] = [row]
+        self._tops[start:end] = [row.top]
+        self._bottoms[start:end] = [row.bottom]
+
+    def _pop_row(self, row: _Row) -> None:
+        index = bisect_left(self._tops, row.top)
+        while self._rows[index] is not row:
+            index += 1
+        del self._rows[index]
+        del self._tops[index]
+        del self._bottoms[index]
+
+    def next_position(self, max_num_per_row: int = 4, spacing: int = 20) -> Tuple[float, float]:
+        """Position for a new element: end of the last row, or a new row below it"""
+        if not self._rows:
+            return 0, 0
+
+        last_row = list(self._rows[-1].members.values())
+        if len(last_row) < max_num_per_row:
+            # Add to the last row, aligned with its top for consistency
+            x, _, width, _ = max(last_row, key=lambda extent: extent[0])
+            return x + width + spacing, min(extent[1] for extent in last_row)
+
+        # Start a new row below the entire last row
+        return 0, max(extent[1] + extent[3] for extent in last_row) + spacing
+
+
+class PlacementIndexCache:
+    """Placement indexes of recently used canvases, kept in sync by db_adapter writes"""
+
+    def __init__(self, max_canvases: int = 64):
+        self.max_canvases = max_canvases
+        self._indexes: "OrderedDict[str, PlacementIndex]" = OrderedDict()
+        # Bumped on every write so a build racing with a write is not cached
+        self._generations: Dict[str, int] = {}
+
+    def get(self, canvas_id: str) -> Optional[PlacementIndex]:
+        index = self._indexes.get(canvas_id)
+        if index is not None:
+            self._indexes.move_to_end(canvas_id)
+        return index
+
+    async def get_or_build(self, canvas_id: str) -> PlacementIndex:
+        index = self.get(canvas_id)
+        if index is not None:
+            return index
+
+        from services.db_adapter import db_adapter
+        while True:
+            generation = self._generations.get(canvas_id, 0)
+            elements = await db_adapter.get_canvas_elements(canvas_id)
+            if generation == self._generations.get(canvas_id, 0):
                 break
-        if not placed:
-            rows.append([element])
+        index = PlacementIndex(elements)
+        self._indexes[canvas_id] = index
+        while len(self._indexes) > self.max_canvases:
+            evicted, _ = self._indexes.popitem(last=False)
+            self._generations.pop(evicted, None)
+        return index
 
-    # Sort rows by their average y-coordinate
-    rows.sort(key=lambda row: sum(e.get("y", 0) for e in row) / len(row))
+    def add_elements(self, canvas_id: str, elements: Iterable[Dict[str, Any]]) -> None:
+        """Record elements appended or patched on the canvas"""
+        self._generations[canvas_id] = self._generations.get(canvas_id, 0) + 1
+        index = self._indexes.get(canvas_id)
+        if index is not None:
+            for element in elements:
+                index.add(element)
 
-    if not rows:
-        return 0, 0
+    def sync(self, canvas_id: str, canvas_data: Union[str, Dict[str, Any]]) -> None:
+        """Record a full save of the canvas data (JSON string or dict)"""
+        self._generations[canvas_id] = self._generations.get(canvas_id, 0) + 1
+        index = self._indexes.get(canvas_id)
+        if index is None:
+            return
+        if isinstance(canvas_data, str):
+            canvas_data = json.loads(canvas_data) if canvas_data else {}
+        index.sync((canvas_data or {}).get("elements") or [])
 
-    last_row = rows[-1]
-    last_row.sort(key=lambda e: e.get("x", 0))
+    def invalidate(self, canvas_id: str) -> None:
+        self._generations[canvas_id] = self._generations.get(canvas_id, 0) + 1
+        self._indexes.pop(canvas_id, None)
 
-    if len(last_row) < max_num_per_row:
-        # Add to the last row
-        rightmost_element = last_row[-1]
-        new_x = rightmost_element.get("x", 0) + rightmost_element.get("width", 0) + spacing
-        # Align with the top of the last row for consistency
-        new_y = min(e.get("y", 0) for e in last_row)
-    else:
-        # Start a new row
-        new_x = 0
-        # Position below the entire last row
-        bottom_of_last_row = max(e.get("y", 0) + e.get("height", 0) for e in last_row)
-        new_y = bottom_of_last_row + spacing
 
-    return new_x, new_y
\ No newline at end of file
+placement_indexes = PlacementIndexCache()
+
+
+async def find_next_best_element_position(canvas_data, max_num_per_row=4, spacing=20, canvas_id: Optional[str] = None):
+    """
+    Calculates the next best position for a new element on the canvas.
+    Media elements are grouped into rows by vertical overlap and the new element
+    goes at the end of the bottom row, or starts a new row below it once full.
+
+    With canvas_id (and no canvas_data) the cached placement index of that
+    canvas is used instead of scanning all elements.
+    """
+    if canvas_data is None and canvas_id is not None:
+        index = await placement_indexes.get_or_build(canvas_id)
+    else:
+        index = PlacementIndex(canvas_data.get("elements", []))
+    return index.next_position(max_num_per_row, spacing)
@@ -0,0 +1,107 @@
+# utils/download.py
+"""
+Streaming media downloads
+
+Generated images and videos are streamed to `<dest>.part` in chunks and
+renamed into place once complete, so memory stays flat however big the file
+is and readers never see a half-written file. When the connection drops the
+download resumes from where it stopped with a Range request (guarded by
+If-Range, so a changed upstream file restarts from zero).
+
+    size = await download_to_file(url, '/files/vi_123.mp4', max_bytes=500 * 1024 * 1024)
+
+MEDIA_DOWNLOAD_MAX_MB (environment) sets the default size cap, unset or 0
+means no cap.
+"""
+
+import asyncio
+import os
+from typing import Dict, Optional
+import aiofiles
+import aiohttp
+from utils.http_client import HttpClient
+
+CHUNK_SIZE = 256 * 1024
+
+
+class DownloadTooLarge(Exception):
+    """The file is larger than the allowed size"""
+
+
+def default_max_bytes() -> Optional[int]:
+    max_mb = float(os.environ.get('MEDIA_DOWNLOAD_MAX_MB', 0) or 0)
+    return int(max_mb * 1024 * 1024) if max_mb > 0 else None
+
+
+async def download_to_file(
+    url: str,
+    dest_path: str,
+    max_bytes: Optional[int] = -1,
+    retries: int = 3,
+    timeout: float = 600.0,
+    headers: Optional[Dict[str, str]] = None,
+) -> int:
+    """Stream url to dest_path, returns the number of bytes written
+
+    Args:
+        url: File to download
+        dest_path: Final path, only created once the download is complete
+        max_bytes: Size cap, -1 for the MEDIA_DOWNLOAD_MAX_MB default, None for no cap
+        retries: Attempts after a dropped connection, each resuming with a Range request
+        timeout: Total seconds allowed per attempt
+        headers: Extra request headers
+    """
+    if max_bytes == -1:
+        max_bytes = default_max_bytes()
+    part_path = f"{dest_path}.part"
+    written = 0
+    # Validator of the first response, sent as If-Range when resuming
+    validator: Optional[str] = None
+
+    try:
+        for attempt in range(retries + 1):
+            request_headers = dict(headers or {})
+            if written:
+                request_headers['Range'] = f'bytes={written}-'
+                if validator:
+                    request_headers['If-Range'] = validator
+            try:
+                async with HttpClient.create_aiohttp(url=url) as session:
+                    async with session.get(url, headers=request_headers,
+                                           timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                        if written and response.status == 416:
+                            # Nothing left past what we already have
+                            break
+                        if response.status not in (200, 206):
+                            raise Exception(f"Download failed: HTTP {response.status} for {url}")
+                        if response.status == 200 and written:
+                            # Range ignored (or upstream changed): start over
+                            print(f"⚠️ Server restarted the download of {url} from the beginning")
+                            written = 0
+                        validator = response.headers.get('ETag') or response.headers.get('Last-Modified') or validator
+
+                        expected = response.content_length
+                        if max_bytes is not None and expected is not None and written + expected > max_bytes:
+                            raise DownloadTooLarge(f"{url} is {written + expected} bytes, over the {max_bytes} byte limit")
+
+                        async with aiofiles.open(part_path, 'ab' if written else 'wb') as out_file:
+                            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                                written += len(chunk)
+                                if max_bytes is not None and written > max_bytes:
+                                    raise DownloadTooLarge(f"{url} is over the {max_bytes} byte limit")
+                                await out_file.write(chunk)
+                # A body cut short raises ClientPayloadError above, so we have it all
+                break
+            except (aiohttp.ClientError, asyncio.TimeoutError, ConnectionError) as e:
+                if attempt == retries:
+                    raise
+                delay = 0.5 * 2 ** attempt
+                print(f"⚠️ Download of {url} interrupted at {written} bytes ({e}), resuming in {delay}s")
+                await asyncio.sleep(delay)
+
+        os.replace(part_path, dest_path)
+        return written
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
@@ -3,16 +3,17 @@ HTTP 客户端工厂和管理器
 
 本模块提供了统一的 HTTP 客户端创建和管理功能，支持 httpx 和 aiohttp 库：
 - 自动 SSL 证书验证
+- 进程级共享客户端池（keep-alive，按上游 host 复用连接，支持 HTTP/2）
 - 连接池管理和超时控制
 - 同步和异步客户端支持
 - 支持代理环境变量 (trust_env=True)
 
 使用指南：
-1. httpx 客户端：
-   async with HttpClient.create() as client:
+1. httpx 客户端（共享，退出上下文时不关闭）：
+   async with HttpClient.create(url="https://api.example.com") as client:
        response = await client.get("https://api.example.com/data")
 
-2. aiohttp 客户端：
+2. aiohttp 客户端（共享，退出上下文时不关闭）：
    async with HttpClient.create_aiohttp() as session:
        async with session.get("https://api.example.com/data") as response:
            data = await response.json()
@@ -20,21 +21,116 @@ HTTP 客户端工厂和管理器
 3. 同步请求：使用 HttpClient.create_sync()
    with HttpClient.create_sync() as client:
        response = client.get("https://api.example.com/data")
+
+共享客户端在 FastAPI 关闭时通过 HttpClient.close_all() 关闭，
+连接复用统计由 /api/metrics 暴露 (HttpClient.get_stats())。
+
+连接池配置（环境变量）：
+    HTTP_POOL_MAX_CONNECTIONS    每个客户端最大连接数 (默认 200)
+    HTTP_POOL_MAX_KEEPALIVE      每个客户端保持的空闲连接数 (默认 50)
+    HTTP_POOL_PER_HOST           aiohttp 每个 host 最大连接数 (默认 50)
+    HTTP_POOL_KEEPALIVE_EXPIRY   空闲连接保留秒数 (默认 30)
+    HTTP_CLIENT_HTTP2            httpx 启用 HTTP/2: 1/0，默认安装了 h2 时启用
+    HTTP_POOL_MAX_CLIENTS        共享 httpx 客户端 / aiohttp 会话各自的上限 (默认 32)，
+                                 超出时最久未用的被移出，并在其请求超时后关闭
 """
 
+import asyncio
+import os
 import ssl
+from collections import OrderedDict
+from http.cookiejar import CookieJar, DefaultCookiePolicy
 import certifi
 import httpx
-from typing import Optional, Dict, Any, AsyncGenerator, Generator
+from typing import Optional, Dict, Any, AsyncGenerator, Generator, Tuple, Union
 from contextlib import asynccontextmanager, contextmanager
+from urllib.parse import urlsplit
 import aiohttp
 
+MAX_CONNECTIONS = int(os.environ.get('HTTP_POOL_MAX_CONNECTIONS', 200))
+MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get('HTTP_POOL_MAX_KEEPALIVE', 50))
+MAX_CONNECTIONS_PER_HOST = int(os.environ.get('HTTP_POOL_PER_HOST', 50))
+KEEPALIVE_EXPIRY = float(os.environ.get('HTTP_POOL_KEEPALIVE_EXPIRY', 30))
+MAX_SHARED_CLIENTS = int(os.environ.get('HTTP_POOL_MAX_CLIENTS', 32))
+# Requests already running on an evicted client get the request timeout to finish
+REQUEST_TIMEOUT = 300
+
+
+def _http2_enabled() -> bool:
+    setting = os.environ.get('HTTP_CLIENT_HTTP2', '')
+    if setting:
+        return setting.lower() in ('1', 'true', 'yes')
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+HTTP2_ENABLED = _http2_enabled()
+
+# Process-wide counters, exposed by /api/metrics
+http_client_stats: Dict[str, Dict[str, int]] = {
+    'httpx': {'requests': 0, 'new_connections': 0},
+    'aiohttp': {'requests': 0, 'new_connections': 0, 'reused_connections': 0},
+}
+
+
+async def _count_httpx_request(request: httpx.Request) -> None:
+    http_client_stats['httpx']['requests'] += 1
+
+    async def trace(event_name: str, info: Dict[str, Any]) -> None:
+        if event_name.endswith(('connect_tcp.complete', 'connect_unix_socket.complete')):
+            http_client_stats['httpx']['new_connections'] += 1
+
+    request.extensions['trace'] = trace
+
+
+def _aiohttp_trace_config() -> aiohttp.TraceConfig:
+    stats = http_client_stats['aiohttp']
+    trace_config = aiohttp.TraceConfig()
+
+    async def on_request_start(session, context, params):
+        stats['requests'] += 1
+
+    async def on_connection_create_end(session, context, params):
+        stats['new_connections'] += 1
+
+    async def on_connection_reuseconn(session, context, params):
+        stats['reused_connections'] += 1
+
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+    return trace_config
+
+
+def _origin(url: Optional[str]) -> str:
+    """scheme://host[:port] of url, '*' when no url is given"""
+    if not url:
+        return '*'
+    parts = urlsplit(url)
+    return f'{parts.scheme}://{parts.netloc}' if parts.netloc else '*'
+
+
+def _pool_key(url: Optional[str], kwargs: Dict[str, Any]) -> Tuple[int, str, str]:
+    # Clients are bound to the event loop they were created in
+    loop_id = id(asyncio.get_running_loop())
+    return loop_id, _origin(url), repr(sorted(kwargs.items()))
+
 
 class HttpClient:
     """HTTP 客户端工厂和管理器"""
 
     _ssl_context: Optional[ssl.SSLContext] = None
 
+    # Shared clients keyed by (event loop, upstream origin, client kwargs), least recently used first
+    _clients: 'OrderedDict[Tuple[int, str, str], httpx.AsyncClient]' = OrderedDict()
+    _aiohttp_sessions: 'OrderedDict[Tuple[int, str, str], aiohttp.ClientSession]' = OrderedDict()
+    # Evicted clients waiting to be closed: client -> (event loop id, close timer)
+    _retired: Dict[Any, Tuple[int, asyncio.TimerHandle]] = {}
+    _evictions = 0
+
     @classmethod
     def _get_ssl_context(cls) -> ssl.SSLContext:
         """获取缓存的 SSL 上下文"""
@@ -52,10 +148,12 @@ class HttpClient:
 
         config = {
             'verify': cls._get_ssl_context(),
-            'timeout': 300,
+            'timeout': REQUEST_TIMEOUT,
             'follow_redirects': True,
             'limits': httpx.Limits(
-                max_keepalive_connections=0, max_connections=200, keepalive_expiry=30
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                max_connections=MAX_CONNECTIONS,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
             ),
             **kwargs,
         }
@@ -70,11 +168,11 @@ class HttpClient:
         config = {
             'connector': aiohttp.TCPConnector(
                 ssl=cls._get_ssl_context(),
-                limit=200,
-                limit_per_host=50,
-                keepalive_timeout=0,
+                limit=MAX_CONNECTIONS,
+                limit_per_host=MAX_CONNECTIONS_PER_HOST,
+                keepalive_timeout=KEEPALIVE_EXPIRY,
             ),
-            'timeout': aiohttp.ClientTimeout(total=300),
+            'timeout': aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
             'trust_env': trust_env,  # 启用环境变量代理支持
             **kwargs,
         }
@@ -88,13 +186,33 @@ class HttpClient:
     async def create(
         cls, url: Optional[str] = None, **kwargs: Any
     ) -> AsyncGenerator[httpx.AsyncClient, None]:
-        """创建异步客户端上下文管理器"""
-        config = cls._get_client_config(**kwargs)
-        client = httpx.AsyncClient(**config)
-        try:
-            yield client
-        finally:
-            await client.aclose()
+        """获取共享异步客户端的上下文管理器（退出时不关闭客户端）
+
+        Args:
+            url: 上游地址，相同 origin 的请求复用同一个客户端及其连接
+            **kwargs: 其他 httpx.AsyncClient 参数，不同参数使用不同客户端
+        """
+        yield cls.get_client(url, **kwargs)
+
+    @classmethod
+    def get_client(cls, url: Optional[str] = None, **kwargs: Any) -> httpx.AsyncClient:
+        """获取共享异步客户端（由 close_all 关闭，调用方不要关闭）"""
+        key = _pool_key(url, kwargs)
+        client = cls._clients.get(key)
+        if client is not None and not client.is_closed:
+            cls._clients.move_to_end(key)
+        else:
+            # Shared across callers, so never keep cookies between requests
+            no_cookies = CookieJar(policy=DefaultCookiePolicy(allowed_domains=[]))
+            config = cls._get_client_config(**{'http2': HTTP2_ENABLED, 'cookies': no_cookies, **kwargs})
+            event_hooks = config.pop('event_hooks', {}) or {}
+            config['event_hooks'] = {
+                **event_hooks,
+                'request': [_count_httpx_request, *event_hooks.get('request', [])],
+            }
+            client = httpx.AsyncClient(**config)
+            cls._remember(cls._clients, key, client)
+        return client
 
     @classmethod
     @contextmanager
@@ -125,20 +243,38 @@ class HttpClient:
     @classmethod
     @asynccontextmanager
     async def create_aiohttp(
-        cls, trust_env: bool = True, **kwargs: Any
+        cls, trust_env: bool = True, url: Optional[str] = None, **kwargs: Any
     ) -> AsyncGenerator['aiohttp.ClientSession', None]:
-        """创建 aiohttp 客户端上下文管理器
+        """获取共享 aiohttp 客户端的上下文管理器（退出时不关闭会话）
 
         Args:
             trust_env: 是否信任环境变量代理设置 (HTTP_PROXY, HTTPS_PROXY, etc.)
+            url: 上游地址，相同 origin 的请求复用同一个会话及其连接
             **kwargs: 其他 aiohttp.ClientSession 参数
         """
-        config = cls._get_aiohttp_config(trust_env=trust_env, **kwargs)
-        session = aiohttp.ClientSession(**config)
-        try:
-            yield session
-        finally:
-            await session.close()
+        yield cls.get_aiohttp_session(trust_env=trust_env, url=url, **kwargs)
+
+    @classmethod
+    def get_aiohttp_session(
+        cls, trust_env: bool = True, url: Optional[str] = None, **kwargs: Any
+    ) -> 'aiohttp.ClientSession':
+        """获取共享 aiohttp 会话（由 close_all 关闭，调用方不要关闭）"""
+        key = _pool_key(url, {'trust_env': trust_env, **kwargs})
+        session = cls._aiohttp_sessions.get(key)
+        if session is not None and not session.closed:
+            cls._aiohttp_sessions.move_to_end(key)
+        else:
+            trace_configs = [_aiohttp_trace_config(), *kwargs.pop('trace_configs', [])]
+            config = cls._get_aiohttp_config(
+                trust_env=trust_env,
+                trace_configs=trace_configs,
+                # Shared across callers, so never keep cookies between requests
+                cookie_jar=kwargs.pop('cookie_jar', aiohttp.DummyCookieJar()),
+                **kwargs,
+            )
+            session = aiohttp.ClientSession(**config)
+            cls._remember(cls._aiohttp_sessions, key, session)
+        return session
 
     @classmethod
     def create_aiohttp_client(
@@ -152,3 +288,71 @@ class HttpClient:
         """
         config = cls._get_aiohttp_config(trust_env=trust_env, **kwargs)
         return aiohttp.ClientSession(**config)
+
+    # ========== 生命周期和统计 ==========
+    @classmethod
+    def _remember(cls, pool: 'OrderedDict[Tuple[int, str, str], Any]', key: Tuple[int, str, str], client: Any) -> None:
+        """加入共享池，超出 MAX_SHARED_CLIENTS 时移出最久未用的客户端"""
+        pool[key] = client
+        pool.move_to_end(key)
+        while len(pool) > max(MAX_SHARED_CLIENTS, 1):
+            old_key, old_client = pool.popitem(last=False)
+            cls._evictions += 1
+            cls._retire(old_key[0], old_client)
+
+    @classmethod
+    def _retire(cls, loop_id: int, client: Any) -> None:
+        # Callers may still hold the client for a running request, close it once that has timed out
+        loop = asyncio.get_running_loop()
+        if id(loop) != loop_id:
+            # Created in another event loop, which is gone or will close it itself
+            return
+        timer = loop.call_later(REQUEST_TIMEOUT, lambda: asyncio.ensure_future(cls._close_retired(client)))
+        cls._retired[client] = (loop_id, timer)
+
+    @classmethod
+    async def _close_retired(cls, client: Any) -> None:
+        cls._retired.pop(client, None)
+        await cls._close_client(client)
+
+    @staticmethod
+    async def _close_client(client: Union[httpx.AsyncClient, 'aiohttp.ClientSession']) -> None:
+        try:
+            if isinstance(client, httpx.AsyncClient):
+                await client.aclose()
+            else:
+                await client.close()
+        except Exception as e:
+            print(f"⚠️ Failed to close HTTP client: {e}")
+
+    @classmethod
+    async def close_all(cls) -> None:
+        """关闭当前事件循环中的共享客户端（FastAPI 关闭时调用）"""
+        loop_id = id(asyncio.get_running_loop())
+        clients, cls._clients = cls._clients, OrderedDict()
+        sessions, cls._aiohttp_sessions = cls._aiohttp_sessions, OrderedDict()
+        retired, cls._retired = cls._retired, {}
+        for key, client in [*clients.items(), *sessions.items()]:
+            if key[0] == loop_id:
+                await cls._close_client(client)
+        for client, (client_loop_id, timer) in retired.items():
+            timer.cancel()
+            if client_loop_id == loop_id:
+                await cls._close_client(client)
+        print(f"🌐 Closed {len(clients)} httpx clients and {len(sessions)} aiohttp sessions")
+
+    @classmethod
+    def get_stats(cls) -> Dict[str, Any]:
+        """连接复用统计"""
+        httpx_stats = dict(http_client_stats['httpx'])
+        httpx_stats['reused_connections'] = max(httpx_stats['requests'] - httpx_stats['new_connections'], 0)
+        return {
+            'httpx': httpx_stats,
+            'aiohttp': dict(http_client_stats['aiohttp']),
+            'shared_clients': len(cls._clients),
+            'shared_aiohttp_sessions': len(cls._aiohttp_sessions),
+            'max_shared_clients': MAX_SHARED_CLIENTS,
+            'evicted_clients': cls._evictions,
+            'retired_clients': len(cls._retired),
+            'http2': HTTP2_ENABLED,
+        }
@@ -0,0 +1,212 @@
+# utils/image_compress.py
+"""
+Compress an uploaded image under a size limit
+
+The previous loop re-encoded the full image at quality 95, 85, ... 15 and then
+at 80%, 70%, ... 40% scale until it fit: up to 16 full-size JPEG encodes on
+the request path. Here the image is decoded once and a probe (about
+PROBE_PIXELS of full-resolution tiles from across the image) predicts the
+full-size JPEG size:
+
+1. binary search the quality on the probe, then encode at full size once;
+   if the prediction was off (too big, or far under the limit), the probe
+   estimates are corrected by the measured ratio and the search repeats
+   (at most MAX_FULL_ENCODES), keeping the best encode that fits
+2. if even MIN_QUALITY is too big, the scale is solved from the measured
+   size (JPEG size grows with the pixel count) and refined the same way
+
+`compress_image` runs in the image worker pool (utils/image_worker.py).
+"""
+
+import math
+import os
+from io import BytesIO
+from typing import Any, Dict, List, Tuple
+
+PROBE_PIXELS = 512 * 512
+PROBE_GRID = 4
+MIN_QUALITY = 40
+MAX_QUALITY = 95
+# Quality used once the image has to be scaled down
+SCALED_QUALITY = 70
+MAX_FULL_ENCODES = 4
+# Aim a little under the limit so one full encode usually lands inside it
+TARGET_MARGIN = 0.95
+# A fitting encode this close to the target is kept without searching higher qualities
+CLOSE_ENOUGH = 0.75
+
+
+class _Encoder:
+    """JPEG encodes of one decoded image, counted"""
+
+    def __init__(self, image: Any):
+        self.image = image
+        self.encodes = 0
+        self.probe_encodes = 0
+        self._resized: Dict[float, Any] = {}
+
+    def resized(self, scale: float) -> Any:
+        from PIL import Image
+
+        if scale >= 1.0:
+            return self.image
+        if scale not in self._resized:
+            width, height = self.image.size
+            size = (max(1, round(width * scale)), max(1, round(height * scale)))
+            self._resized[scale] = self.image.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+        return self._resized[scale]
+
+    def encode(self, quality: int, scale: float = 1.0, probe: bool = False) -> bytes:
+        with BytesIO() as output:
+            # optimize (an extra Huffman pass) only matters for the bytes we keep
+            self.resized(scale).save(output, format='JPEG', quality=quality, optimize=not probe)
+            if probe:
+                self.probe_encodes += 1
+            else:
+                self.encodes += 1
+            return output.getvalue()
+
+
+def _to_rgb(image: Any) -> Any:
+    from PIL import Image
+
+    # Convert to RGB if necessary (for JPEG compression)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        # Create a white background for transparent images
+        if image.mode == 'P':
+            image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1] if image.mode in ('RGBA', 'LA') else None)
+        return background
+    if image.mode != 'RGB':
+        return image.convert('RGB')
+    return image
+
+
+def _probe_mosaic(image: Any) -> Any:
+    """About PROBE_PIXELS of full-resolution tiles from a grid over the image"""
+    from PIL import Image
+
+    width, height = image.size
+    if width * height <= PROBE_PIXELS:
+        return image
+    grid = PROBE_GRID
+    tile = max(8, int(math.sqrt(PROBE_PIXELS) / grid) // 8 * 8)
+    tile_w, tile_h = min(tile, width // grid), min(tile, height // grid)
+    mosaic = Image.new('RGB', (tile_w * grid, tile_h * grid))
+    for row in range(grid):
+        for col in range(grid):
+            # Tile centred in its grid cell
+            left = (2 * col + 1) * width // (2 * grid) - tile_w // 2
+            top = (2 * row + 1) * height // (2 * grid) - tile_h // 2
+            mosaic.paste(image.crop((left, top, left + tile_w, top + tile_h)), (col * tile_w, row * tile_h))
+    return mosaic
+
+
+def _search_quality(estimate, limit: int) -> int:
+    """Highest quality in [MIN_QUALITY, MAX_QUALITY] whose estimated size fits, or MIN_QUALITY - 1"""
+    low, high, best = MIN_QUALITY, MAX_QUALITY, MIN_QUALITY - 1
+    while low <= high:
+        quality = (low + high) // 2
+        if estimate(quality) <= limit:
+            best, low = quality, quality + 1
+        else:
+            high = quality - 1
+    return best
+
+
+def compress_to_limit(image: Any, max_bytes: int) -> Tuple[bytes, Dict[str, Any]]:
+    """JPEG encode image in at most max_bytes (or as close as the search gets), returns (data, stats)"""
+    image = _to_rgb(image)
+    encoder = _Encoder(image)
+    width, height = image.size
+    target = int(max_bytes * TARGET_MARGIN)
+
+    # Probe: full-resolution tiles sampled across the image (JPEG codes 8x8 blocks
+    # independently, a downscaled copy would lose the fine detail that costs bytes),
+    # its size scaled up by the pixel ratio
+    probe = _Encoder(_probe_mosaic(image))
+    pixel_ratio = (width * height) / max(probe.image.size[0] * probe.image.size[1], 1)
+    probe_sizes: Dict[int, int] = {}
+    correction = 1.0
+
+    def estimate(quality: int) -> float:
+        if quality not in probe_sizes:
+            probe_sizes[quality] = len(probe.encode(quality, probe=True))
+        return probe_sizes[quality] * pixel_ratio * correction
+
+    best: Tuple[bytes, int, float] = (b'', 0, 1.0)
+    tried = set()
+    # The probe may be off either way: always measure a full encode before giving up on quality
+    quality = max(_search_quality(estimate, target), MIN_QUALITY)
+    while quality > best[1] and quality not in tried and encoder.encodes < MAX_FULL_ENCODES:
+        tried.add(quality)
+        data = encoder.encode(quality)
+        if len(data) <= max_bytes:
+            best = (data, quality, 1.0)
+            if len(data) >= target * CLOSE_ENOUGH or quality == MAX_QUALITY:
+                break
+        # Correct the probe's prediction with the real size and search again
+        # (down when it didn't fit, up when it landed well under the limit)
+        correction *= len(data) / estimate(quality)
+        quality = max(_search_quality(estimate, target), MIN_QUALITY)
+
+    if not best[0]:
+        # Too big even at MIN_QUALITY: shrink. JPEG size grows with the pixel count
+        # (scale^2) to start with, then with the exponent measured between encodes,
+        # since downscaling also smooths out detail
+        scale = math.sqrt(target / estimate(SCALED_QUALITY))
+        points: List[Tuple[float, int]] = []
+        for _ in range(MAX_FULL_ENCODES):
+            scale = round(min(max(scale, 0.05), 0.99), 3)
+            if any(scale == tried_scale for tried_scale, _ in points):
+                break
+            data = encoder.encode(SCALED_QUALITY, scale)
+            points.append((scale, len(data)))
+            if len(data) <= max_bytes and (not best[0] or scale > best[2]):
+                best = (data, SCALED_QUALITY, scale)
+                if len(data) >= target * CLOSE_ENOUGH:
+                    break
+            exponent = 2.0
+            if len(points) >= 2:
+                (scale_a, size_a), (scale_b, size_b) = points[-2], points[-1]
+                if scale_a != scale_b and size_a != size_b:
+                    exponent = min(max(math.log(size_b / size_a) / math.log(scale_b / scale_a), 1.0), 4.0)
+            scale *= (target / len(data)) ** (1 / exponent)
+        if not best[0]:
+            # Last resort: very low quality
+            best = (encoder.encode(30, scale), 30, scale)
+
+    data, quality, scale = best
+    out_width, out_height = encoder.resized(scale).size
+    return data, {
+        'width': out_width,
+        'height': out_height,
+        'quality': quality,
+        'scale': scale,
+        'size': len(data),
+        'encodes': encoder.encodes,
+        'probe_encodes': probe.probe_encodes,
+    }
+
+
+def compress_image(source: Any, dest_path: str, max_bytes: int) -> Dict[str, Any]:
+    """Decode source (path or bytes) once, write it to dest_path as a JPEG of at most max_bytes
+
+    Written to a temp file and renamed. Returns the compression stats
+    (width, height, quality, scale, size, encodes, probe_encodes).
+    """
+    from PIL import Image
+
+    tmp_path = f"{dest_path}.tmp"
+    try:
+        with Image.open(BytesIO(source) if isinstance(source, bytes) else source) as image:
+            image.load()
+            data, stats = compress_to_limit(image, max_bytes)
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, dest_path)
+        return stats
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,227 @@
+# utils/image_input_cache.py
+"""
+Cache of reference images ready to send to providers
+
+Every image tool call turns its reference images (`im_xxx.png` file ids) into
+base64 data URLs: read the file (or fetch it from BACKEND_URL when it only
+lives in Supabase), decode it, re-encode it and base64 it. Agents pass the
+same references turn after turn, so the finished data URLs are kept in an LRU
+cache keyed by file id + mtime/size + target format:
+
+- in memory, bounded by INPUT_IMAGE_CACHE_MB (default 256, 0 disables it)
+- optionally on disk under USER_DATA_DIR/cache/input_images, bounded by
+  INPUT_IMAGE_DISK_CACHE_MB (default 0 = off), so restarts keep the work
+
+Concurrent requests for the same image share one encode, and the PIL work
+runs in the image worker pool (utils/image_worker.py).
+"""
+
+import asyncio
+import base64
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# File extension -> mime type of the data URL, anything else is sent as JPEG
+INPUT_MIME_TYPES = {
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.webp': 'image/webp',
+}
+
+
+def input_mime_type(file_id: str) -> str:
+    return INPUT_MIME_TYPES.get(os.path.splitext(file_id)[1].lower(), 'image/jpeg')
+
+
+def encode_data_url(source: Any, mime_type: str) -> str:
+    """Decode the image (path or bytes) and re-encode it as a data URL, runs in the worker pool"""
+    from io import BytesIO
+    from PIL import Image
+
+    with Image.open(BytesIO(source) if isinstance(source, bytes) else source) as image:
+        format_name = mime_type.split('/')[1].upper()
+        if format_name == 'JPEG' and image.mode in ('RGBA', 'LA'):
+            # Convert RGBA to RGB for JPEG
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
+            image = background
+        with BytesIO() as output:
+            image.save(output, format=format_name)
+            b64_data = base64.b64encode(output.getvalue()).decode('utf-8')
+    return f"data:{mime_type};base64,{b64_data}"
+
+
+class InputImageCache:
+    """Byte-bounded LRU of data URLs, in memory and optionally on disk"""
+
+    def __init__(self, max_bytes: int, disk_dir: Optional[str] = None, disk_max_bytes: int = 0):
+        self.max_bytes = max(max_bytes, 0)
+        self.disk_dir = disk_dir if disk_dir and disk_max_bytes > 0 else None
+        self.disk_max_bytes = max(disk_max_bytes, 0)
+        self._memory: 'OrderedDict[str, str]' = OrderedDict()
+        self._memory_bytes = 0
+        # Disk entries (path -> size) in LRU order, loaded on first use
+        self._disk: Optional['OrderedDict[str, int]'] = None
+        self._disk_bytes = 0
+        # Disk reads/writes run in threads
+        self._disk_lock = threading.Lock()
+        self._inflight: Dict[str, 'asyncio.Future[Optional[str]]'] = {}
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'shared': 0, 'evictions': 0}
+
+    @staticmethod
+    def make_key(file_id: str, version: str, mime_type: str) -> str:
+        return f"{file_id}|{version}|{mime_type}"
+
+    def _disk_path(self, key: str) -> str:
+        assert self.disk_dir is not None
+        return os.path.join(self.disk_dir, hashlib.sha256(key.encode('utf-8')).hexdigest() + '.txt')
+
+    def _load_disk_index(self) -> 'OrderedDict[str, int]':
+        if self._disk is None:
+            assert self.disk_dir is not None
+            os.makedirs(self.disk_dir, exist_ok=True)
+            entries = [e for e in os.scandir(self.disk_dir) if e.is_file() and e.name.endswith('.txt')]
+            entries.sort(key=lambda e: e.stat().st_mtime)
+            self._disk = OrderedDict((e.path, e.stat().st_size) for e in entries)
+            self._disk_bytes = sum(self._disk.values())
+        return self._disk
+
+    def _remember(self, key: str, data_url: str) -> None:
+        size = len(data_url)
+        if size > self.max_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous)
+        self._memory[key] = data_url
+        self._memory_bytes += size
+        while self._memory_bytes > self.max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self.stats['evictions'] += 1
+
+    def _read_disk(self, key: str) -> Optional[str]:
+        with self._disk_lock:
+            return self._read_disk_locked(key)
+
+    def _read_disk_locked(self, key: str) -> Optional[str]:
+        disk = self._load_disk_index()
+        path = self._disk_path(key)
+        if path not in disk:
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data_url = f.read()
+            os.utime(path)
+        except OSError:
+            self._disk_bytes -= disk.pop(path)
+            return None
+        disk.move_to_end(path)
+        return data_url
+
+    def _write_disk(self, key: str, data_url: str) -> None:
+        with self._disk_lock:
+            self._write_disk_locked(key, data_url)
+
+    def _write_disk_locked(self, key: str, data_url: str) -> None:
+        disk = self._load_disk_index()
+        path = self._disk_path(key)
+        size = len(data_url)
+        if size > self.disk_max_bytes:
+            return
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(data_url)
+        os.replace(tmp_path, path)
+        self._disk_bytes += size - disk.pop(path, 0)
+        disk[path] = size
+        while self._disk_bytes > self.disk_max_bytes and disk:
+            evicted_path, evicted_size = disk.popitem(last=False)
+            self._disk_bytes -= evicted_size
+            try:
+                os.remove(evicted_path)
+            except OSError:
+                pass
+
+    async def get_or_create(self, key: str, create: Callable[[], Awaitable[Optional[str]]]) -> Optional[str]:
+        """Return the cached data URL for key, or await create() once and cache it
+
+        create returns None when the image can't be loaded; that is not cached.
+        """
+        if self.max_bytes == 0 and self.disk_dir is None:
+            return await create()
+
+        data_url = self._memory.get(key)
+        if data_url is not None:
+            self._memory.move_to_end(key)
+            self.stats['hits'] += 1
+            return data_url
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.stats['shared'] += 1
+            return await asyncio.shield(inflight)
+
+        future: 'asyncio.Future[Optional[str]]' = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            if self.disk_dir is not None:
+                data_url = await asyncio.to_thread(self._read_disk, key)
+                if data_url is not None:
+                    self.stats['disk_hits'] += 1
+            if data_url is None:
+                self.stats['misses'] += 1
+                data_url = await create()
+                if data_url is not None and self.disk_dir is not None:
+                    try:
+                        await asyncio.to_thread(self._write_disk, key, data_url)
+                    except OSError as e:
+                        print(f"⚠️ Could not write input image cache entry: {e}")
+            if data_url is not None:
+                self._remember(key, data_url)
+            future.set_result(data_url)
+            return data_url
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Nobody else waiting: don't leave the exception unretrieved
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats['hits'] + self.stats['disk_hits'] + self.stats['misses']
+        return {
+            **self.stats,
+            'hit_rate': round((self.stats['hits'] + self.stats['disk_hits']) / lookups, 3) if lookups else 0.0,
+            'entries': len(self._memory),
+            'bytes': self._memory_bytes,
+            'max_bytes': self.max_bytes,
+            'disk_entries': len(self._disk) if self._disk is not None else None,
+            'disk_bytes': self._disk_bytes if self._disk is not None else None,
+            'disk_max_bytes': self.disk_max_bytes if self.disk_dir else 0,
+        }
+
+
+def _from_env() -> InputImageCache:
+    from services.config_service import USER_DATA_DIR
+
+    def megabytes(name: str, default: float) -> int:
+        return int(float(os.environ.get(name, default) or 0) * 1024 * 1024)
+
+    return InputImageCache(
+        max_bytes=megabytes('INPUT_IMAGE_CACHE_MB', 256),
+        disk_dir=os.path.join(USER_DATA_DIR, 'cache', 'input_images'),
+        disk_max_bytes=megabytes('INPUT_IMAGE_DISK_CACHE_MB', 0),
+    )
+
+
+# Shared by every tool sending reference images
+input_image_cache = _from_env()
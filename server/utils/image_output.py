@@ -0,0 +1,294 @@
+# utils/image_output.py
+"""
+How generated images are stored on disk
+
+Provider outputs used to be re-encoded as optimized PNG no matter what they
+were. That burns CPU and usually stores a file several times larger than the
+JPEG/WebP the provider sent. The output policy is chosen per deployment:
+
+    IMAGE_OUTPUT_POLICY=png    decode and re-encode as PNG (default, previous behaviour)
+    IMAGE_OUTPUT_POLICY=keep   store the provider's bytes untouched when the format is in
+                               IMAGE_OUTPUT_KEEP_FORMATS (default png,jpeg,webp); metadata is
+                               spliced in as PNG text chunks / a JPEG comment without
+                               re-encoding (kept WebP files carry none). Other formats are
+                               stored as PNG.
+    IMAGE_OUTPUT_POLICY=webp   transcode to WebP
+    IMAGE_OUTPUT_POLICY=avif   transcode to AVIF
+
+    IMAGE_OUTPUT_QUALITY=85    WebP/AVIF quality (1-100)
+    IMAGE_OUTPUT_SPEED=6       WebP/AVIF encoder speed, 0 (smallest, slowest) to 10 (fastest)
+    IMAGE_PNG_OPTIMIZE=true    PNG optimize pass (slow; false uses zlib level 6)
+
+`save_image` and `save_variant` run in the image worker pool (utils/image_worker.py).
+"""
+
+import base64
+import json
+import os
+import re
+import struct
+import traceback
+import zlib
+from typing import Any, Dict, Optional, Tuple
+from xml.sax.saxutils import quoteattr
+
+# PIL format -> (extension, mime type)
+OUTPUT_FORMATS = {
+    'PNG': ('png', 'image/png'),
+    'JPEG': ('jpg', 'image/jpeg'),
+    'WEBP': ('webp', 'image/webp'),
+    'AVIF': ('avif', 'image/avif'),
+}
+
+
+class ImageOutputPolicy:
+    """Output encoding settings, passed to the worker processes"""
+
+    MODES = ('png', 'keep', 'webp', 'avif')
+
+    def __init__(self, mode: str = 'png', keep_formats: Tuple[str, ...] = ('PNG', 'JPEG', 'WEBP'),
+                 quality: int = 85, speed: int = 6, png_optimize: bool = True):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown image output policy {mode!r}, expected one of {', '.join(self.MODES)}")
+        self.mode = mode
+        self.keep_formats = tuple(f.upper() for f in keep_formats)
+        self.quality = min(max(quality, 1), 100)
+        self.speed = min(max(speed, 0), 10)
+        self.png_optimize = png_optimize
+
+    @classmethod
+    def from_env(cls) -> 'ImageOutputPolicy':
+        keep_formats = os.environ.get('IMAGE_OUTPUT_KEEP_FORMATS', 'png,jpeg,webp')
+        return cls(
+            mode=os.environ.get('IMAGE_OUTPUT_POLICY', 'png').strip().lower(),
+            keep_formats=tuple(f.strip() for f in keep_formats.split(',') if f.strip()),
+            quality=int(os.environ.get('IMAGE_OUTPUT_QUALITY', 85)),
+            speed=int(os.environ.get('IMAGE_OUTPUT_SPEED', 6)),
+            png_optimize=os.environ.get('IMAGE_PNG_OPTIMIZE', 'true').lower() == 'true',
+        )
+
+    def __repr__(self) -> str:
+        return (f"ImageOutputPolicy(mode={self.mode!r}, keep_formats={self.keep_formats!r}, "
+                f"quality={self.quality}, speed={self.speed}, png_optimize={self.png_optimize})")
+
+
+def _metadata_texts(original_format: str, metadata: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    texts = {"original_format": original_format}
+    for key, value in (metadata or {}).items():
+        try:
+            # Handle different value types
+            if isinstance(value, (dict, list)):
+                # Serialize complex types as JSON
+                texts[str(key)] = json.dumps(value, ensure_ascii=False)
+            elif value is None:
+                texts[str(key)] = "null"
+            else:
+                # Convert to string
+                texts[str(key)] = str(value)
+        except Exception as e:
+            print(f"Warning: Failed to add metadata key '{key}': {e}")
+            traceback.print_stack()
+    return texts
+
+
+def _png_text_chunks(texts: Dict[str, str]) -> bytes:
+    """iTXt chunks (UTF-8, uncompressed) for each text entry"""
+    chunks = b''
+    for key, value in texts.items():
+        # PNG keywords are 1-79 Latin-1 characters
+        keyword = key.encode('latin-1', 'replace')[:79] or b'metadata'
+        data = keyword + b'\0\0\0\0\0' + value.encode('utf-8')
+        chunks += struct.pack('>I', len(data)) + b'iTXt' + data + struct.pack('>I', zlib.crc32(b'iTXt' + data))
+    return chunks
+
+
+def _splice_png_texts(data: bytes, texts: Dict[str, str]) -> bytes:
+    # Insert right before IEND, the last 12 bytes of a well-formed PNG
+    iend = data.rfind(b'IEND')
+    if iend < 4:
+        raise ValueError("PNG without IEND chunk")
+    return data[:iend - 4] + _png_text_chunks(texts) + data[iend - 4:]
+
+
+def _splice_jpeg_comment(data: bytes, texts: Dict[str, str]) -> bytes:
+    # COM segment right after SOI, payload limited to 65533 bytes
+    comment = json.dumps(texts, ensure_ascii=False).encode('utf-8')[:65533]
+    return data[:2] + b'\xff\xfe' + struct.pack('>H', len(comment) + 2) + comment + data[2:]
+
+
+def _xmp_packet(texts: Dict[str, str]) -> bytes:
+    attributes = ' '.join(
+        f"jaaz:{re.sub(r'[^A-Za-z0-9_.-]', '_', key) or 'metadata'}={quoteattr(value)}"
+        for key, value in texts.items()
+    )
+    return (
+        '<x:xmpmeta xmlns:x="adobe:ns:meta/">'
+        '<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">'
+        f'<rdf:Description rdf:about="" xmlns:jaaz="https://jaaz.app/ns/1.0/" {attributes}/>'
+        '</rdf:RDF></x:xmpmeta>'
+    ).encode('utf-8')
+
+
+def _read(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _convert_mode(image: Any, keep_grayscale: bool) -> Any:
+    # Handle different color modes properly for the target format
+    if image.mode == 'P':
+        # Palette mode - convert to RGBA to preserve potential transparency
+        if 'transparency' in image.info:
+            return image.convert('RGBA')
+        return image.convert('RGB')
+    if image.mode == 'LA':
+        # Grayscale with alpha - convert to RGBA
+        return image.convert('RGBA')
+    if image.mode == 'L':
+        # PNG supports grayscale, so we can keep it
+        return image if keep_grayscale else image.convert('RGB')
+    if image.mode == 'CMYK':
+        # CMYK mode - convert to RGB
+        return image.convert('RGB')
+    if image.mode in ('RGB', 'RGBA'):
+        # Already compatible
+        return image
+    # For any other modes, convert to RGB as a safe fallback
+    print(f"Warning: Unusual color mode {image.mode}, converting to RGB")
+    return image.convert('RGB')
+
+
+def save_image(
+    source_path: str,
+    file_path_without_extension: str,
+    metadata: Optional[Dict[str, Any]] = None,
+    is_b64: bool = False,
+    policy: Optional[ImageOutputPolicy] = None,
+) -> Tuple[str, int, int, str]:
+    """Store the image at source_path according to the output policy
+
+    With is_b64 the source file holds the base64 text of the image. Only the
+    header is read to get the dimensions; with the keep policy and nothing to
+    splice in, the source file is renamed into place. Otherwise it is removed
+    afterwards, and encoded outputs are written to a temp file and renamed.
+
+    Returns:
+        tuple[str, int, int, str]: (mime_type, width, height, extension)
+    """
+    from io import BytesIO
+    from PIL import Image, PngImagePlugin
+
+    policy = policy or ImageOutputPolicy()
+    image = None
+    tmp_path = None
+    try:
+        if is_b64:
+            with open(source_path, 'rb') as f:
+                source: Any = BytesIO(base64.b64decode(f.read()))
+        else:
+            source = source_path
+
+        # Opening only parses the header, pixels are decoded on first use
+        image = Image.open(source)
+        width, height = image.size
+        original_format = image.format or 'Unknown'
+        texts = _metadata_texts(original_format, metadata)
+
+        if policy.mode == 'keep' and original_format in policy.keep_formats and original_format in OUTPUT_FORMATS:
+            extension, mime_type = OUTPUT_FORMATS[original_format]
+            file_path = f"{file_path_without_extension}.{extension}"
+            if (metadata and original_format in ('PNG', 'JPEG')) or is_b64:
+                data = source.getvalue() if is_b64 else _read(source_path)
+                if metadata and original_format == 'PNG':
+                    data = _splice_png_texts(data, texts)
+                elif metadata and original_format == 'JPEG':
+                    data = _splice_jpeg_comment(data, texts)
+                _write_atomic(file_path, data)
+            else:
+                # The download itself becomes the stored file
+                image.close()
+                os.replace(source_path, file_path)
+            print(f"Stored {original_format} image as is: {file_path} ({width}x{height})")
+            return mime_type, width, height, extension
+
+        target = policy.mode.upper() if policy.mode in ('webp', 'avif') else 'PNG'
+        extension, mime_type = OUTPUT_FORMATS[target]
+        file_path = f"{file_path_without_extension}.{extension}"
+        print(f"Converting {original_format} image to {target}: {width}x{height}")
+        image = _convert_mode(image, keep_grayscale=(target == 'PNG'))
+
+        # Encode next to the target and rename, readers never see a partial file
+        tmp_path = f"{file_path}.tmp"
+        if target == 'PNG':
+            save_args: Dict[str, Any] = {'optimize': True} if policy.png_optimize else {'compress_level': 6}
+            # Original PNGs without metadata are saved as they were
+            if metadata or original_format != 'PNG':
+                pnginfo = PngImagePlugin.PngInfo()
+                for key, value in texts.items():
+                    pnginfo.add_text(key, value)
+                save_args['pnginfo'] = pnginfo
+            image.save(tmp_path, format='PNG', **save_args)
+        elif target == 'WEBP':
+            # method: 0 (fast) .. 6 (slowest, smallest)
+            image.save(tmp_path, format='WEBP', quality=policy.quality,
+                       method=round(6 - policy.speed * 0.6), xmp=_xmp_packet(texts))
+        else:
+            image.save(tmp_path, format='AVIF', quality=policy.quality,
+                       speed=policy.speed, xmp=_xmp_packet(texts))
+        os.replace(tmp_path, file_path)
+
+        print(f"Successfully saved as {target}: {file_path}")
+        return mime_type, width, height, extension
+    finally:
+        if image is not None:
+            image.close()
+        for leftover in (source_path, tmp_path):
+            if leftover and os.path.exists(leftover):
+                os.remove(leftover)
+
+
+def save_variant(source_path: str, dest_path: str, width: int, fmt: str, quality: int = 80) -> Tuple[int, int]:
+    """Write a copy of the image at most width pixels wide in fmt ('webp', 'avif', 'jpeg', 'png')
+
+    Images are never upscaled. Written to a temp file and renamed, returns the (width, height) written.
+    """
+    from PIL import Image, ImageOps
+
+    target = 'JPEG' if fmt in ('jpg', 'jpeg') else fmt.upper()
+    tmp_path = f"{dest_path}.tmp"
+    try:
+        with Image.open(source_path) as image:
+            # JPEG can decode straight at a smaller scale
+            image.draft('RGB', (width, width * image.height // max(image.width, 1)))
+            image = ImageOps.exif_transpose(image)
+            if image.width > width:
+                image = image.resize((width, max(1, round(image.height * width / image.width))),
+                                     Image.Resampling.LANCZOS, reducing_gap=3.0)
+            image = _convert_mode(image, keep_grayscale=(target == 'PNG'))
+            if target == 'JPEG' and image.mode == 'RGBA':
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                background.paste(image, mask=image.split()[-1])
+                image = background
+            save_args: Dict[str, Any] = {}
+            if target in ('WEBP', 'AVIF', 'JPEG'):
+                save_args['quality'] = quality
+            if target == 'PNG':
+                save_args['compress_level'] = 6
+            image.save(tmp_path, format=target, **save_args)
+            size = image.size
+        os.replace(tmp_path, dest_path)
+        return size
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+# Deployment-wide policy, read once at startup
+output_policy = ImageOutputPolicy.from_env()
@@ -0,0 +1,144 @@
+# utils/image_worker.py
+"""
+Process pool for CPU-heavy PIL work
+
+Decoding a 2-4K generation result, converting its mode and re-encoding it as
+an optimized PNG takes hundreds of milliseconds of pure CPU. Run inline on the
+event loop that stalls every websocket stream for the whole time, so image
+tools hand that work to a small pool of worker processes instead:
+
+    mime_type, width, height, extension = await image_worker.run(
+        'save_image', save_image, source_path, file_path_without_extension
+    )
+
+Jobs are bounded: at most `max_pending` are submitted to the pool at once,
+the rest wait their turn on the loop (reported as queue depth). Per-op counts
+and latencies are kept in `image_worker.get_stats()`.
+
+Configuration (environment):
+    IMAGE_WORKER_PROCESSES  number of worker processes (default: min(4, cpu count));
+                            0 runs the jobs in a thread instead
+    IMAGE_WORKER_MAX_PENDING  jobs submitted to the pool at once (default: 2 x processes)
+
+Functions run in the pool must be module level and take picklable arguments,
+and this module must stay cheap to import (workers may import it on start).
+"""
+
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional, Tuple, TypeVar
+
+T = TypeVar('T')
+
+
+def _timed_call(fn: Callable[..., T], args: Tuple[Any, ...]) -> Tuple[T, float]:
+    """Run fn in the worker and report how long it ran there (ms)"""
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+class ImageWorkerPool:
+    """Bounded process pool for PIL decode/convert/encode jobs"""
+
+    def __init__(self, processes: Optional[int] = None, max_pending: Optional[int] = None):
+        if processes is None:
+            processes = int(os.environ.get('IMAGE_WORKER_PROCESSES', min(4, os.cpu_count() or 1)))
+        self.processes = max(processes, 0)
+        if max_pending is None:
+            max_pending = int(os.environ.get('IMAGE_WORKER_MAX_PENDING', max(self.processes, 1) * 2))
+        self.max_pending = max(max_pending, 1)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._waiting = 0
+        self._running = 0
+        self._ops: Dict[str, Dict[str, float]] = {}
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Forking the running server would copy locks held by its threads
+            # (aiosqlite, executors, transfers) into the workers. forkserver
+            # forks them from a clean single-threaded process instead, spawn
+            # where it isn't available; both import the job's module in the
+            # worker, which is why the image modules stay cheap to import.
+            start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            mp_context = multiprocessing.get_context(start_method)
+            self._executor = ProcessPoolExecutor(max_workers=self.processes, mp_context=mp_context)
+            print(f"🖼️ Image worker pool started with {self.processes} processes")
+        return self._executor
+
+    async def run(self, op: str, fn: Callable[..., T], *args: Any) -> T:
+        """Run fn(*args) in the pool, op names the job in the stats"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        stats = self._ops.setdefault(op, {'count': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                                          'queue_ms': 0.0, 'work_ms': 0.0})
+        queued_at = time.perf_counter()
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+        started_at = time.perf_counter()
+        self._running += 1
+        try:
+            if self.processes == 0:
+                result, work_ms = await asyncio.to_thread(_timed_call, fn, args)
+            else:
+                loop = asyncio.get_running_loop()
+                try:
+                    result, work_ms = await loop.run_in_executor(self._get_executor(), _timed_call, fn, args)
+                except BrokenProcessPool:
+                    # A worker died (e.g. killed for memory); start a fresh pool and retry once
+                    print("⚠️ Image worker pool broken, restarting")
+                    self._discard_executor()
+                    result, work_ms = await loop.run_in_executor(self._get_executor(), _timed_call, fn, args)
+        except BaseException:
+            stats['errors'] += 1
+            raise
+        finally:
+            self._running -= 1
+            self._slots.release()
+        total_ms = (time.perf_counter() - queued_at) * 1000
+        stats['count'] += 1
+        stats['total_ms'] += total_ms
+        stats['max_ms'] = max(stats['max_ms'], total_ms)
+        stats['queue_ms'] += (started_at - queued_at) * 1000
+        stats['work_ms'] += work_ms
+        return result
+
+    def _discard_executor(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def close(self) -> None:
+        self._discard_executor()
+
+    def get_stats(self) -> Dict[str, Any]:
+        ops = {}
+        for op, stats in self._ops.items():
+            count = max(stats['count'], 1)
+            ops[op] = {
+                'count': stats['count'],
+                'errors': stats['errors'],
+                'avg_ms': round(stats['total_ms'] / count, 2),
+                'max_ms': round(stats['max_ms'], 2),
+                'avg_queue_ms': round(stats['queue_ms'] / count, 2),
+                'avg_work_ms': round(stats['work_ms'] / count, 2),
+            }
+        return {
+            'processes': self.processes,
+            'max_pending': self.max_pending,
+            'queue_depth': self._waiting,
+            'running': self._running,
+            'ops': ops,
+        }
+
+
+# Shared by every image tool; worker processes start on first use
+image_worker = ImageWorkerPool()